@@ -2,7 +2,8 @@ from __future__ import annotations
 from fastapi import Request, HTTPException
 from typing import Optional
 
-from app.services.supabase import get_supabase
+from app.config import VISITOR_COOKIE
+from app.services import db
 from app.core.api_keys import validate_api_key
 
 
@@ -22,13 +23,11 @@ async def get_current_user(request: Request) -> dict:
         return {"id": key_auth["user_id"], "scopes": key_auth["scopes"], "via": "api_key"}
 
     # Otherwise validate as Supabase JWT
-    sb = get_supabase()
     try:
-        user_resp = sb.auth.get_user(token)
-        user = user_resp.user
+        user = await db.get_auth_user(token)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return {"id": user.id, "email": user.email, "via": "session"}
+        return {"id": user["id"], "email": user.get("email"), "via": "session"}
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
@@ -39,3 +38,8 @@ async def get_optional_user(request: Request) -> Optional[dict]:
         return await get_current_user(request)
     except HTTPException:
         return None
+
+
+def get_visitor_id(request: Request) -> Optional[str]:
+    """Publisher-supplied visitor id (cookie, then `visitor_id` query param)."""
+    return request.cookies.get(VISITOR_COOKIE) or request.query_params.get("visitor_id") or None
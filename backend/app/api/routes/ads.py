@@ -1,18 +1,34 @@
 from __future__ import annotations
 
+import asyncio
 import time
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse
+from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
 
-from app.services.supabase import get_supabase
-from app.services.signals import collect_signals
+from app.core import timing
+from app.core.signing import sign_click
+from app.models.schemas import AdBatchRequest
+from app.services import db
+from app.services.bandit import bandit
+from app.services.campaign_cache import campaign_cache, CampaignSnapshot
+from app.services.event_filter import event_filter
+from app.services.event_writer import impression_writer
+from app.services.signals import collect_signals, providers_for
 from app.services.decisioning import select_variant
-from app.templates.renderer import render_ad, TEMPLATE_NAMES
+from app.templates.renderer import render_ad_cached, RenderedAd, TEMPLATE_NAMES
+from app.api.deps import get_visitor_id
 
 router = APIRouter(prefix="/ad", tags=["ads"])
 
+# Served ads are re-decided per request, so caches must revalidate; the ETag
+# still lets browsers/CDNs skip the body when the same creative comes back.
+SERVE_CACHE_CONTROL = "no-cache"
+PREVIEW_CACHE_CONTROL = "private, max-age=30"
+
 
 def _campaign_is_servable(campaign: dict) -> bool:
     if campaign.get("status") != "active":
@@ -27,27 +43,85 @@ def _campaign_is_servable(campaign: dict) -> bool:
     return True
 
 
-def _load_campaign_full(campaign_id: str) -> dict:
-    sb = get_supabase()
-    camp = sb.table("campaigns").select("*").eq("id", campaign_id).maybe_single().execute()
-    if not camp.data:
+async def _load_campaign_full(campaign_id: str) -> dict:
+    camp, variants, rules = await asyncio.gather(
+        db.select_one("campaigns", filters={"id": db.eq(campaign_id)}),
+        db.select("variants", filters={"campaign_id": db.eq(campaign_id)}),
+        db.select("rules", filters={"campaign_id": db.eq(campaign_id)}),
+    )
+    if not camp:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    variants = sb.table("variants").select("*").eq("campaign_id", campaign_id).execute()
-    rules = sb.table("rules").select("*").eq("campaign_id", campaign_id).execute()
-    return {**camp.data, "variants": variants.data or [], "rules": rules.data or []}
+    variants = variants or []
+    if camp.get("ab_test_mode") == "bandit":
+        stats = await db.select(
+            "variant_stats", "variant_id, impressions, clicks", {"campaign_id": db.eq(campaign_id)}
+        )
+        bandit.load(campaign_id, tuple(v["id"] for v in variants), stats)
+    else:
+        bandit.forget(campaign_id)
+    return {**camp, "variants": variants, "rules": rules or []}
+
+
+async def _get_snapshot(campaign_id: str) -> CampaignSnapshot:
+    """Campaign + variants + rules, served from the snapshot cache when warm."""
+    return await campaign_cache.get_or_load(campaign_id, _load_campaign_full)
+
+
+def _impression_row(campaign_id: str, variant_id: str, signals: dict, ip: str) -> dict:
+    return {
+        "campaign_id": campaign_id,
+        "variant_id": variant_id,
+        "signals": signals,
+        "ip_address": ip,
+    }
+
+
+def _etag_matches(if_none_match: str, etags: tuple[str, ...]) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+
+def _timing_headers(headers: dict) -> dict:
+    """Close the request's timings and add the Server-Timing header when enabled."""
+    timing.finish()
+    value = timing.server_timing()
+    if value:
+        headers["Server-Timing"] = value
+    return headers
+
 
+def _html_response(request: Request, rendered: RenderedAd, cache_control: str) -> Response:
+    """HTML response with ETag/Cache-Control, answering If-None-Match with 304."""
+    use_gzip = rendered.gzipped is not None and "gzip" in request.headers.get("accept-encoding", "")
+    etag = rendered.etag_gzip if use_gzip else rendered.etag
+    headers = _timing_headers({"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"})
 
-def _track_impression_bg(campaign_id: str, variant_id: str, signals: dict, ip: str):
-    try:
-        sb = get_supabase()
-        sb.table("impressions").insert({
-            "campaign_id": campaign_id,
-            "variant_id": variant_id,
-            "signals": signals,
-            "ip_address": ip,
-        }).execute()
-    except Exception:
-        pass
+    if _etag_matches(request.headers.get("if-none-match", ""), (rendered.etag, rendered.etag_gzip)):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=rendered.gzipped, media_type="text/html; charset=utf-8", headers=headers)
+    return Response(content=rendered.body, media_type="text/html; charset=utf-8", headers=headers)
+
+
+@lru_cache(maxsize=4096)
+def _signed_click_url(campaign_id: str, variant_id: str, url: str) -> str:
+    sig = sign_click(campaign_id, variant_id, url)
+    return f"/api/analytics/click/{campaign_id}/{variant_id}?url={quote(url, safe='')}&sig={sig}"
+
+
+def _click_url(campaign_id: str, variant: dict) -> str:
+    """Click-through URL signed over campaign, variant and destination."""
+    return _signed_click_url(campaign_id, variant["id"], variant.get("cta_url") or "")
 
 
 @router.get("/templates")
@@ -55,86 +129,175 @@ async def list_templates():
     return {"templates": TEMPLATE_NAMES}
 
 
+@router.post("/batch")
+async def serve_ad_batch(body: AdBatchRequest, request: Request, response: Response):
+    """Serve every ad slot of a page in one call: signals are collected once and
+    campaigns load concurrently. Slot failures are reported per slot."""
+    timing.begin()
+    campaign_ids = list(dict.fromkeys(slot.campaign_id for slot in body.slots))
+    with timing.timed("campaign"):
+        loaded = await asyncio.gather(
+            *(_get_snapshot(cid) for cid in campaign_ids), return_exceptions=True
+        )
+    snapshots = dict(zip(campaign_ids, loaded))
+
+    signal_keys = set()
+    for snap in loaded:
+        if isinstance(snap, CampaignSnapshot):
+            signal_keys |= snap.signal_keys
+    with timing.timed("signals"):
+        signals = await collect_signals(request, providers_for(signal_keys))
+    ip = signals.get("ip", "")
+    visitor_id = get_visitor_id(request)
+
+    ads = []
+    for i, slot in enumerate(body.slots):
+        entry: dict = {"slot": i, "campaign_id": slot.campaign_id}
+        snap = snapshots[slot.campaign_id]
+        if isinstance(snap, HTTPException):
+            entry["error"] = snap.detail
+            ads.append(entry)
+            continue
+        if isinstance(snap, BaseException):
+            entry["error"] = "Campaign unavailable"
+            ads.append(entry)
+            continue
+        if not _campaign_is_servable(snap.campaign):
+            entry["error"] = "Campaign not available"
+            ads.append(entry)
+            continue
+
+        with timing.timed("decide"):
+            variant = select_variant(snap.campaign, signals, snap.plan, visitor_id)
+        if not variant:
+            entry["error"] = "No variant available"
+            ads.append(entry)
+            continue
+
+        click_url = _click_url(slot.campaign_id, variant)
+        entry["variant_id"] = variant["id"]
+        entry["click_url"] = click_url
+        if body.format == "json":
+            entry["variant"] = variant
+        else:
+            with timing.timed("render"):
+                entry["html"] = render_ad_cached(variant, slot.template, slot.width, slot.height, click_url).html
+        ads.append(entry)
+
+        if body.track and event_filter.admit(
+            "impression", slot.campaign_id, variant["id"], ip, request.headers, visitor_id, placement=str(i)
+        ):
+            impression_writer.offer(_impression_row(slot.campaign_id, variant["id"], signals, ip))
+            bandit.record_impression(slot.campaign_id, variant["id"])
+
+    result: dict = {"ads": ads}
+    if body.format == "json":
+        result["signals"] = signals
+    response.headers.update(_timing_headers({}))
+    return result
+
+
 @router.get("/{campaign_id}")
 async def serve_ad(
     campaign_id: str,
     request: Request,
-    background_tasks: BackgroundTasks,
+    response: Response,
     format: str = "html",
     track: bool = True,
     width: int = 400,
     height: int = 300,
     template: str = "default",
 ):
-    campaign = _load_campaign_full(campaign_id)
+    timing.begin()
+    with timing.timed("campaign"):
+        snap = await _get_snapshot(campaign_id)
+    campaign = snap.campaign
     if not _campaign_is_servable(campaign):
         raise HTTPException(status_code=404, detail="Campaign not available")
 
-    signals = await collect_signals(request)
-    variant = select_variant(campaign, signals)
+    with timing.timed("signals"):
+        signals = await collect_signals(request, providers_for(snap.signal_keys))
+    visitor_id = get_visitor_id(request)
+    with timing.timed("decide"):
+        variant = select_variant(campaign, signals, snap.plan, visitor_id)
     if not variant:
         raise HTTPException(status_code=404, detail="No variant available")
 
-    click_url = f"/api/analytics/click/{campaign_id}/{variant['id']}?url={variant.get('cta_url', '')}"
+    click_url = _click_url(campaign_id, variant)
 
-    if track:
-        background_tasks.add_task(
-            _track_impression_bg, campaign_id, variant["id"], signals, signals.get("ip", "")
-        )
+    ip = signals.get("ip", "")
+    if track and event_filter.admit("impression", campaign_id, variant["id"], ip, request.headers, visitor_id):
+        impression_writer.offer(_impression_row(campaign_id, variant["id"], signals, ip))
+        bandit.record_impression(campaign_id, variant["id"])
 
     if format == "json":
+        response.headers.update(_timing_headers({}))
         return {"variant": variant, "signals": signals, "click_url": click_url}
 
-    html = render_ad(variant, template, width, height, click_url)
-    return HTMLResponse(content=html)
+    with timing.timed("render"):
+        rendered = render_ad_cached(variant, template, width, height, click_url)
+    return _html_response(request, rendered, SERVE_CACHE_CONTROL)
 
 
 @router.get("/{campaign_id}/preview")
 async def preview_ad(
     campaign_id: str,
+    request: Request,
     variant_id: Optional[str] = None,
     template: str = "default",
     width: int = 400,
     height: int = 300,
 ):
-    sb = get_supabase()
     if variant_id:
-        vr = sb.table("variants").select("*").eq("id", variant_id).eq("campaign_id", campaign_id).maybe_single().execute()
-        if not vr.data:
+        variant = await db.select_one(
+            "variants", filters={"id": db.eq(variant_id), "campaign_id": db.eq(campaign_id)}
+        )
+        if not variant:
             raise HTTPException(status_code=404, detail="Variant not found")
-        variant = vr.data
     else:
-        variants = sb.table("variants").select("*").eq("campaign_id", campaign_id).execute()
-        if not variants.data:
+        variants = await db.select("variants", filters={"campaign_id": db.eq(campaign_id)}, limit=1)
+        if not variants:
             raise HTTPException(status_code=404, detail="No variants")
-        variant = variants.data[0]
+        variant = variants[0]
 
-    html = render_ad(variant, template, width, height)
-    return HTMLResponse(content=html)
+    rendered = render_ad_cached(variant, template, width, height)
+    return _html_response(request, rendered, PREVIEW_CACHE_CONTROL)
 
 
 @router.get("/{campaign_id}/debug")
 async def debug_ad(campaign_id: str, request: Request):
     t0 = time.time()
-    campaign = _load_campaign_full(campaign_id)
-    signals = await collect_signals(request)
-    variant = select_variant(campaign, signals)
+    timing.begin()
+    with timing.timed("campaign"):
+        snap = await _get_snapshot(campaign_id)
+    campaign = snap.campaign
+    report: dict = {}
+    with timing.timed("signals"):
+        signals = await collect_signals(request, providers_for(snap.signal_keys), report)
+    visitor_id = get_visitor_id(request)
+    with timing.timed("decide"):
+        variant = select_variant(campaign, signals, snap.plan, visitor_id)
     elapsed = round((time.time() - t0) * 1000, 2)
     return {
         "campaign_id": campaign_id,
         "ab_test_mode": campaign.get("ab_test_mode"),
         "signals": signals,
+        "signal_keys": sorted(snap.signal_keys),
+        **report,
         "selected_variant": variant,
         "total_variants": len(campaign.get("variants", [])),
         "total_rules": len(campaign.get("rules", [])),
         "timing_ms": elapsed,
+        "stages_ms": timing.current(),
     }
 
 
 @router.get("/{campaign_id}/simulate")
 async def simulate_ad(campaign_id: str, request: Request):
-    campaign = _load_campaign_full(campaign_id)
-    signals = await collect_signals(request)
+    snap = await _get_snapshot(campaign_id)
+    campaign = snap.campaign
+    overrides = {k[7:] for k in request.query_params if k.startswith("signal_")}
+    signals = await collect_signals(request, providers_for(snap.signal_keys - overrides))
 
     # Override signals with query params prefixed signal_
     for key, val in request.query_params.items():
@@ -149,5 +312,5 @@ async def simulate_ad(campaign_id: str, request: Request):
                 except ValueError:
                     signals[signal_name] = val
 
-    variant = select_variant(campaign, signals)
+    variant = select_variant(campaign, signals, snap.plan, get_visitor_id(request))
     return {"signals": signals, "selected_variant": variant}
@@ -1,15 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import json
 from datetime import datetime, timezone, timedelta
-from fastapi import APIRouter, HTTPException, Depends, Request
-from fastapi.responses import RedirectResponse
-
-from app.models.schemas import ClickEvent, ImpressionEvent
-from app.services.supabase import get_supabase
-from app.api.deps import get_current_user
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Path, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+
+from app.core.signing import hash_ip, verify_click
+from app.models.schemas import UUID_PATTERN, ClickEvent, ImpressionEvent, ReplayRequest
+from app.services import dashboard as dashboard_service, db
+from app.services.bandit import bandit
+from app.services.event_filter import event_filter
+from app.services.event_writer import click_writer, impression_writer
+from app.services.replay import ReplayPlan, replay
+from app.api.deps import get_current_user, get_visitor_id
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
+# PostgREST caps responses at 1000 rows by default
+ROLLUP_PAGE_SIZE = 1000
+
 
 def _get_client_ip(request: Request) -> str:
     forwarded = request.headers.get("x-forwarded-for")
@@ -18,97 +29,140 @@ def _get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "127.0.0.1"
 
 
+def _click_row(campaign_id: str, variant_id: str, url: Optional[str], request: Request) -> dict:
+    return {
+        "campaign_id": campaign_id,
+        "variant_id": variant_id,
+        "url": url or None,
+        "ip_hash": hash_ip(_get_client_ip(request)),
+        "user_agent": request.headers.get("user-agent"),
+        "referer": request.headers.get("referer"),
+    }
+
+
+def _admit(kind: str, campaign_id: str, variant_id: str, request: Request, visitor_id: Optional[str] = None) -> bool:
+    visitor_id = visitor_id or get_visitor_id(request)
+    return event_filter.admit(kind, campaign_id, variant_id, _get_client_ip(request), request.headers, visitor_id)
+
+
+async def _unsigned_click_redirect(campaign_id: str, variant_id: str) -> RedirectResponse:
+    # Links served before click signing (still in cached creatives) carry no
+    # `sig`. They go to the variant's own destination, never to `url`, and the
+    # click isn't recorded since nothing proves it came from a served ad.
+    variant = await db.select_one(
+        "variants", "cta_url", {"id": db.eq(variant_id), "campaign_id": db.eq(campaign_id)}
+    )
+    if not variant:
+        raise HTTPException(status_code=400, detail="Invalid click signature")
+    return RedirectResponse(url=variant.get("cta_url") or "/", status_code=302)
+
+
 @router.get("/click/{campaign_id}/{variant_id}")
-async def track_click_redirect(campaign_id: str, variant_id: str, request: Request, url: str = ""):
-    sb = get_supabase()
-    try:
-        sb.table("clicks").insert({
-            "campaign_id": campaign_id,
-            "variant_id": variant_id,
-            "ip_address": _get_client_ip(request),
-        }).execute()
-    except Exception:
-        pass
-    redirect_url = url or "/"
-    return RedirectResponse(url=redirect_url, status_code=302)
+async def track_click_redirect(
+    request: Request,
+    campaign_id: str = Path(..., pattern=UUID_PATTERN),
+    variant_id: str = Path(..., pattern=UUID_PATTERN),
+    url: str = "",
+    sig: str = "",
+):
+    # The signature proves this link came from serve_ad, so no lookup is needed
+    # before redirecting; the click itself is written in the background.
+    if not sig:
+        return await _unsigned_click_redirect(campaign_id, variant_id)
+    if not verify_click(campaign_id, variant_id, url, sig):
+        raise HTTPException(status_code=400, detail="Invalid click signature")
+    if _admit("click", campaign_id, variant_id, request):
+        bandit.record_click(campaign_id, variant_id)
+        click_writer.offer(_click_row(campaign_id, variant_id, url, request))
+    return RedirectResponse(url=url or "/", status_code=302)
 
 
 @router.post("/click")
 async def track_click_ajax(body: ClickEvent, request: Request):
-    sb = get_supabase()
-    sb.table("clicks").insert({
-        "campaign_id": body.campaign_id,
-        "variant_id": body.variant_id,
-        "ip_address": _get_client_ip(request),
-    }).execute()
+    if not _admit("click", body.campaign_id, body.variant_id, request, body.visitor_id):
+        return {"status": "filtered"}
+    bandit.record_click(body.campaign_id, body.variant_id)
+    queued = await click_writer.put(_click_row(body.campaign_id, body.variant_id, body.url, request))
+    if not queued:
+        raise HTTPException(status_code=503, detail="Tracking queue full")
     return {"status": "ok"}
 
 
 @router.post("/impression")
 async def track_impression(body: ImpressionEvent, request: Request):
-    sb = get_supabase()
-    sb.table("impressions").insert({
+    if not _admit("impression", body.campaign_id, body.variant_id, request, body.visitor_id):
+        return {"status": "filtered"}
+    bandit.record_impression(body.campaign_id, body.variant_id)
+    queued = await impression_writer.put({
         "campaign_id": body.campaign_id,
         "variant_id": body.variant_id,
         "signals": body.signals or {},
         "ip_address": _get_client_ip(request),
-    }).execute()
+    })
+    if not queued:
+        raise HTTPException(status_code=503, detail="Tracking queue full")
     return {"status": "ok"}
 
 
+async def _select_rollups(campaign_id: str, since: str) -> list[dict]:
+    """A campaign's hourly counters since `since`, read in id-ordered pages."""
+    rows: list[dict] = []
+    last_id = None
+    while True:
+        filters = {"campaign_id": db.eq(campaign_id), "bucket": db.gte(since)}
+        if last_id is not None:
+            filters["id"] = db.gt(last_id)
+        page = await db.select(
+            "campaign_stats_hourly",
+            "id, variant_id, bucket, impressions, clicks",
+            filters,
+            order="id.asc",
+            limit=ROLLUP_PAGE_SIZE,
+        )
+        rows.extend(page)
+        if len(page) < ROLLUP_PAGE_SIZE:
+            return rows
+        last_id = page[-1]["id"]
+
+
 @router.get("/campaigns/{campaign_id}/stats")
 async def campaign_stats(campaign_id: str, days: int = 7, user: dict = Depends(get_current_user)):
-    sb = get_supabase()
-
     # Verify ownership
-    camp = sb.table("campaigns").select("id").eq("id", campaign_id).eq("user_id", user["id"]).maybe_single().execute()
-    if not camp.data:
+    camp = await db.select_one("campaigns", "id", {"id": db.eq(campaign_id), "user_id": db.eq(user["id"])})
+    if not camp:
         raise HTTPException(status_code=404, detail="Campaign not found")
 
-    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-
-    impressions = sb.table("impressions").select("id, variant_id, created_at").eq("campaign_id", campaign_id).gte("created_at", since).execute()
-    clicks = sb.table("clicks").select("id, variant_id, created_at").eq("campaign_id", campaign_id).gte("created_at", since).execute()
+    # Hourly rollups (campaign_stats_hourly); the window starts at the top of the hour
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    rollups = await _select_rollups(campaign_id, since.isoformat())
 
-    imp_data = impressions.data or []
-    click_data = clicks.data or []
-    total_imp = len(imp_data)
-    total_clicks = len(click_data)
-    ctr = round(total_clicks / total_imp * 100, 2) if total_imp > 0 else 0
-
-    # Daily breakdown
+    total_imp = 0
+    total_clicks = 0
     daily: dict[str, dict] = {}
-    for i in imp_data:
-        day = i["created_at"][:10]
-        daily.setdefault(day, {"date": day, "impressions": 0, "clicks": 0})
-        daily[day]["impressions"] += 1
-    for c in click_data:
-        day = c["created_at"][:10]
-        daily.setdefault(day, {"date": day, "impressions": 0, "clicks": 0})
-        daily[day]["clicks"] += 1
+    variants: dict[str, list[int]] = {}
+    for row in rollups:
+        imps, clicks = row["impressions"], row["clicks"]
+        total_imp += imps
+        total_clicks += clicks
+        day = row["bucket"][:10]
+        entry = daily.setdefault(day, {"date": day, "impressions": 0, "clicks": 0})
+        entry["impressions"] += imps
+        entry["clicks"] += clicks
+        counts = variants.setdefault(row.get("variant_id"), [0, 0])
+        counts[0] += imps
+        counts[1] += clicks
+    ctr = round(total_clicks / total_imp * 100, 2) if total_imp > 0 else 0
     daily_breakdown = sorted(daily.values(), key=lambda x: x["date"])
 
-    # Variant breakdown
-    variant_imp: dict[str, int] = {}
-    variant_clicks: dict[str, int] = {}
-    for i in imp_data:
-        vid = i.get("variant_id", "unknown")
-        variant_imp[vid] = variant_imp.get(vid, 0) + 1
-    for c in click_data:
-        vid = c.get("variant_id", "unknown")
-        variant_clicks[vid] = variant_clicks.get(vid, 0) + 1
-
-    all_vids = set(variant_imp.keys()) | set(variant_clicks.keys())
-    variant_breakdown = []
-    for vid in all_vids:
-        vi = variant_imp.get(vid, 0)
-        vc = variant_clicks.get(vid, 0)
-        variant_breakdown.append({
+    variant_breakdown = [
+        {
             "variant_id": vid,
             "impressions": vi,
             "clicks": vc,
             "ctr": round(vc / vi * 100, 2) if vi > 0 else 0,
-        })
+        }
+        for vid, (vi, vc) in variants.items()
+    ]
 
     return {
         "campaign_id": campaign_id,
@@ -121,37 +175,29 @@ async def campaign_stats(campaign_id: str, days: int = 7, user: dict = Depends(g
     }
 
 
-@router.get("/dashboard")
-async def dashboard(user: dict = Depends(get_current_user)):
-    sb = get_supabase()
-    campaigns = sb.table("campaigns").select("id, name, status").eq("user_id", user["id"]).execute()
-    camp_ids = [c["id"] for c in (campaigns.data or [])]
+@router.post("/campaigns/{campaign_id}/replay")
+async def replay_campaign(campaign_id: str, body: ReplayRequest, user: dict = Depends(get_current_user)):
+    """Replay recent impressions through a proposed rule set and stream predicted vs. served variants as NDJSON."""
+    camp = await db.select_one("campaigns", "id, ab_test_mode", {"id": db.eq(campaign_id), "user_id": db.eq(user["id"])})
+    if not camp:
+        raise HTTPException(status_code=404, detail="Campaign not found")
 
-    if not camp_ids:
-        return {"campaigns": [], "total_impressions": 0, "total_clicks": 0, "ctr": 0}
+    variants, current_rules = await asyncio.gather(
+        db.select("variants", "id, is_default, weight", {"campaign_id": db.eq(campaign_id)}),
+        db.select("rules", filters={"campaign_id": db.eq(campaign_id)}),
+    )
+    rules = [r.model_dump() for r in body.rules] if body.rules is not None else current_rules
+    mode = body.ab_test_mode or camp.get("ab_test_mode") or "off"
+    plan = ReplayPlan({**camp, "variants": variants}, rules, mode)
+    since = (datetime.now(timezone.utc) - timedelta(days=body.days)).isoformat()
 
-    since = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-    total_imp = 0
-    total_clicks = 0
-    campaign_stats_list = []
-
-    for cid in camp_ids:
-        imps = sb.table("impressions").select("id", count="exact").eq("campaign_id", cid).gte("created_at", since).execute()
-        clks = sb.table("clicks").select("id", count="exact").eq("campaign_id", cid).gte("created_at", since).execute()
-        ci = imps.count or 0
-        cc = clks.count or 0
-        total_imp += ci
-        total_clicks += cc
-        campaign_stats_list.append({
-            "campaign_id": cid,
-            "impressions": ci,
-            "clicks": cc,
-            "ctr": round(cc / ci * 100, 2) if ci > 0 else 0,
-        })
+    async def lines():
+        async for result in replay(plan, campaign_id, since, body.limit):
+            yield json.dumps(result) + "\n"
 
-    return {
-        "campaigns": campaign_stats_list,
-        "total_impressions": total_imp,
-        "total_clicks": total_clicks,
-        "ctr": round(total_clicks / total_imp * 100, 2) if total_imp > 0 else 0,
-    }
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/dashboard")
+async def dashboard(user: dict = Depends(get_current_user)):
+    return await dashboard_service.get(user["id"])
@@ -7,6 +7,8 @@ from app.models.schemas import (
     RuleCreate, RuleUpdate,
 )
 from app.services.supabase import get_supabase
+from app.services import dashboard
+from app.services.campaign_cache import campaign_cache
 from app.api.deps import get_current_user
 
 router = APIRouter(prefix="/api/campaigns", tags=["campaigns"])
@@ -25,6 +27,7 @@ async def create_campaign(body: CampaignCreate, user: dict = Depends(get_current
     data = body.model_dump(exclude_none=True)
     data["user_id"] = user["id"]
     result = sb.table("campaigns").insert(data).execute()
+    dashboard.invalidate(user["id"])
     return result.data[0] if result.data else result.data
 
 
@@ -48,6 +51,7 @@ async def update_campaign(campaign_id: str, body: CampaignUpdate, user: dict = D
     result = sb.table("campaigns").update(data).eq("id", campaign_id).eq("user_id", user["id"]).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Campaign not found")
+    campaign_cache.invalidate(campaign_id)
     return result.data[0]
 
 
@@ -55,6 +59,8 @@ async def update_campaign(campaign_id: str, body: CampaignUpdate, user: dict = D
 async def delete_campaign(campaign_id: str, user: dict = Depends(get_current_user)):
     sb = get_supabase()
     sb.table("campaigns").delete().eq("id", campaign_id).eq("user_id", user["id"]).execute()
+    campaign_cache.invalidate(campaign_id)
+    dashboard.invalidate(user["id"])
     return {"message": "Deleted"}
 
 
@@ -90,6 +96,7 @@ async def duplicate_campaign(campaign_id: str, user: dict = Depends(get_current_
             new_r["variant_id"] = variant_id_map[new_r["variant_id"]]
         sb.table("rules").insert(new_r).execute()
 
+    dashboard.invalidate(user["id"])
     return new_camp_result.data[0]
 
 
@@ -104,6 +111,7 @@ async def create_variant(campaign_id: str, body: VariantCreate, user: dict = Dep
     data = body.model_dump(exclude_none=True)
     data["campaign_id"] = campaign_id
     result = sb.table("variants").insert(data).execute()
+    campaign_cache.invalidate(campaign_id)
     return result.data[0] if result.data else result.data
 
 
@@ -119,6 +127,7 @@ async def update_variant(campaign_id: str, variant_id: str, body: VariantUpdate,
     result = sb.table("variants").update(data).eq("id", variant_id).eq("campaign_id", campaign_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Variant not found")
+    campaign_cache.invalidate(campaign_id)
     return result.data[0]
 
 
@@ -129,6 +138,7 @@ async def delete_variant(campaign_id: str, variant_id: str, user: dict = Depends
     if not camp.data:
         raise HTTPException(status_code=404, detail="Campaign not found")
     sb.table("variants").delete().eq("id", variant_id).eq("campaign_id", campaign_id).execute()
+    campaign_cache.invalidate(campaign_id)
     return {"message": "Deleted"}
 
 
@@ -142,6 +152,7 @@ async def create_rule(campaign_id: str, body: RuleCreate, user: dict = Depends(g
     data = body.model_dump(exclude_none=True)
     data["campaign_id"] = campaign_id
     result = sb.table("rules").insert(data).execute()
+    campaign_cache.invalidate(campaign_id)
     return result.data[0] if result.data else result.data
 
 
@@ -157,6 +168,7 @@ async def update_rule(campaign_id: str, rule_id: str, body: RuleUpdate, user: di
     result = sb.table("rules").update(data).eq("id", rule_id).eq("campaign_id", campaign_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Rule not found")
+    campaign_cache.invalidate(campaign_id)
     return result.data[0]
 
 
@@ -167,4 +179,5 @@ async def delete_rule(campaign_id: str, rule_id: str, user: dict = Depends(get_c
     if not camp.data:
         raise HTTPException(status_code=404, detail="Campaign not found")
     sb.table("rules").delete().eq("id", rule_id).eq("campaign_id", campaign_id).execute()
+    campaign_cache.invalidate(campaign_id)
     return {"message": "Deleted"}
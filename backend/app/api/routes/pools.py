@@ -4,6 +4,7 @@ from fastapi import APIRouter, HTTPException, Depends
 
 from app.models.schemas import PoolUpsert
 from app.services.supabase import get_supabase
+from app.services.campaign_cache import campaign_cache
 from app.api.deps import get_current_user
 
 router = APIRouter(prefix="/api/pools", tags=["pools"])
@@ -93,6 +94,7 @@ async def generate_variants(campaign_id: str, user: dict = Depends(get_current_u
         if result.data:
             created.append(result.data[0])
 
+    campaign_cache.invalidate(campaign_id)
     return {"generated": len(created), "variants": created}
 
 
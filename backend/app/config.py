@@ -12,3 +12,78 @@ SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
 SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
 ALLOWED_ORIGINS: List[str] = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173").split(",")
 WEATHER_API_KEY: Optional[str] = os.getenv("WEATHER_API_KEY")
+
+# Campaign snapshot cache (ad serving)
+CAMPAIGN_CACHE_TTL: float = float(os.getenv("CAMPAIGN_CACHE_TTL", "30"))
+CAMPAIGN_CACHE_MAX: int = int(os.getenv("CAMPAIGN_CACHE_MAX", "1000"))
+
+# Async PostgREST client (serving, tracking and auth paths)
+DB_TIMEOUT: float = float(os.getenv("DB_TIMEOUT", "3"))
+DB_MAX_CONNECTIONS: int = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_MAX_KEEPALIVE: int = int(os.getenv("DB_MAX_KEEPALIVE", "20"))
+
+# Rendered creative cache
+RENDER_CACHE_MAX: int = int(os.getenv("RENDER_CACHE_MAX", "5000"))
+RENDER_CACHE_GZIP: bool = os.getenv("RENDER_CACHE_GZIP", "true").lower() == "true"
+
+# Signal providers (geo / weather)
+SIGNALS_HTTP_TIMEOUT: float = float(os.getenv("SIGNALS_HTTP_TIMEOUT", "5"))
+SIGNALS_DEADLINE: float = float(os.getenv("SIGNALS_DEADLINE", "2"))
+SIGNALS_MAX_CONNECTIONS: int = int(os.getenv("SIGNALS_MAX_CONNECTIONS", "50"))
+SIGNALS_MAX_KEEPALIVE: int = int(os.getenv("SIGNALS_MAX_KEEPALIVE", "10"))
+GEO_CACHE_MAX_ENTRIES: int = int(os.getenv("GEO_CACHE_MAX_ENTRIES", "50000"))
+GEO_CACHE_MAX_BYTES: int = int(os.getenv("GEO_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+WEATHER_CACHE_MAX_ENTRIES: int = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "10000"))
+WEATHER_CACHE_MAX_BYTES: int = int(os.getenv("WEATHER_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Local GeoIP range table (CSV or compiled .bin); empty = remote ip-api.com only
+GEOIP_DB_PATH: str = os.getenv("GEOIP_DB_PATH", "")
+GEOIP_REMOTE_FALLBACK: bool = os.getenv("GEOIP_REMOTE_FALLBACK", "false").lower() == "true"
+
+# Weather cells: serve stale up to WEATHER_MAX_STALE past the TTL while refreshing,
+# and re-fetch the WEATHER_REFRESH_TOP most requested cells every WEATHER_REFRESH_INTERVAL
+WEATHER_MAX_STALE: float = float(os.getenv("WEATHER_MAX_STALE", "1800"))
+WEATHER_REFRESH_INTERVAL: float = float(os.getenv("WEATHER_REFRESH_INTERVAL", "60"))
+WEATHER_REFRESH_TOP: int = int(os.getenv("WEATHER_REFRESH_TOP", "100"))
+
+# Sticky A/B modes: cookie holding a stable visitor id (falls back to IP + UA)
+VISITOR_COOKIE: str = os.getenv("VISITOR_COOKIE", "dco_vid")
+
+# Bandit mode: how often in-memory impression/click counters go to variant_stats
+BANDIT_FLUSH_INTERVAL: float = float(os.getenv("BANDIT_FLUSH_INTERVAL", "10"))
+
+# Per-stage latency histograms and the Server-Timing header on ad responses
+SERVER_TIMING: bool = os.getenv("SERVER_TIMING", "true").lower() == "true"
+
+# Buffered tracking writes (impressions/clicks): bulk inserts from a bounded queue
+EVENT_BATCH_SIZE: int = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+EVENT_FLUSH_INTERVAL: float = float(os.getenv("EVENT_FLUSH_INTERVAL", "1"))
+EVENT_QUEUE_MAX: int = int(os.getenv("EVENT_QUEUE_MAX", "50000"))
+EVENT_MAX_RETRIES: int = int(os.getenv("EVENT_MAX_RETRIES", "3"))
+EVENT_ENQUEUE_TIMEOUT: float = float(os.getenv("EVENT_ENQUEUE_TIMEOUT", "0.05"))
+EVENT_DRAIN_TIMEOUT: float = float(os.getenv("EVENT_DRAIN_TIMEOUT", "10"))
+EVENT_WRITER_WORKERS: int = int(os.getenv("EVENT_WRITER_WORKERS", "2"))
+
+# HMAC key for click-through URLs (defaults to one derived from the service key; one of the two is required)
+CLICK_SIGNING_SECRET: str = os.getenv("CLICK_SIGNING_SECRET", "")
+
+# Local write-ahead spool for tracking events while the database is down (empty = disabled)
+SPOOL_DIR: str = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES: int = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+SPOOL_MAX_BYTES: int = int(os.getenv("SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+SPOOL_FSYNC_INTERVAL: float = float(os.getenv("SPOOL_FSYNC_INTERVAL", "0.2"))
+SPOOL_REPLAY_INTERVAL: float = float(os.getenv("SPOOL_REPLAY_INTERVAL", "5"))
+
+# Compact impression signals: per-process cache of signal_dict ids
+SIGNAL_DICT_CACHE_MAX: int = int(os.getenv("SIGNAL_DICT_CACHE_MAX", "100000"))
+
+# Tracking event filter: drop prefetches/bots and repeats within DEDUP_WINDOW seconds
+BOT_FILTER: bool = os.getenv("BOT_FILTER", "true").lower() == "true"
+DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_WINDOW: float = float(os.getenv("DEDUP_WINDOW", "60"))
+DEDUP_MEMORY_BYTES: int = int(os.getenv("DEDUP_MEMORY_BYTES", str(8 * 1024 * 1024)))
+DEDUP_EXPECTED_EVENTS: int = int(os.getenv("DEDUP_EXPECTED_EVENTS", "500000"))
+
+# Per-user cache of the analytics dashboard overview
+DASHBOARD_CACHE_TTL: float = float(os.getenv("DASHBOARD_CACHE_TTL", "30"))
+DASHBOARD_CACHE_MAX: int = int(os.getenv("DASHBOARD_CACHE_MAX", "10000"))
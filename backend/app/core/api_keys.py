@@ -4,7 +4,7 @@ import secrets
 from datetime import datetime, timezone
 from typing import Optional
 
-from app.services.supabase import get_supabase
+from app.services import db
 
 
 def generate_api_key() -> str:
@@ -28,24 +28,19 @@ async def validate_api_key(key: str) -> Optional[dict]:
         return None
 
     key_hash = hash_key(key)
-    sb = get_supabase()
 
     try:
-        result = (
-            sb.table("api_keys")
-            .select("id, user_id, scopes, expires_at, revoked_at, metadata")
-            .eq("key_hash", key_hash)
-            .maybe_single()
-            .execute()
+        data = await db.select_one(
+            "api_keys",
+            "id, user_id, scopes, expires_at, revoked_at, metadata",
+            {"key_hash": db.eq(key_hash)},
         )
     except Exception:
         return None
 
-    if not result.data:
+    if not data:
         return None
 
-    data = result.data
-
     if data.get("revoked_at"):
         return None
 
@@ -56,9 +51,11 @@ async def validate_api_key(key: str) -> Optional[dict]:
 
     # Update last_used_at (fire and forget)
     try:
-        sb.table("api_keys").update(
-            {"last_used_at": datetime.now(timezone.utc).isoformat()}
-        ).eq("id", data["id"]).execute()
+        await db.update(
+            "api_keys",
+            {"last_used_at": datetime.now(timezone.utc).isoformat()},
+            {"id": db.eq(data["id"])},
+        )
     except Exception:
         pass
 
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+
+# Time-windowed set membership in fixed memory.
+#
+# Two Bloom filters of equal size: keys are added to the current one and
+# looked up in both. Every `window` seconds the current filter becomes the
+# previous one and a fresh filter takes its place, so a key is remembered for
+# between one and two windows and memory never grows. The false-positive
+# rate is estimated from each filter's actual fill (set bits / total bits).
+#
+# The filters are blocked: a key's k bits all fall in one 64-byte block
+# (a cache line), so a lookup is one slice turned into an int and a mask
+# test instead of k scattered bit probes. This costs a little accuracy
+# against a classic Bloom filter of the same size.
+
+K_MAX = 8
+BLOCK_BYTES = 64
+BLOCK_BITS = BLOCK_BYTES * 8  # bit offsets within a block take 9 hash bits
+
+
+class RotatingBloom:
+    """A pair of Bloom filters rotated every `window` seconds, within `memory_bytes`."""
+
+    def __init__(self, window: float, memory_bytes: int, expected_per_window: int):
+        self.window = window
+        self.blocks = max(memory_bytes // 2 // BLOCK_BYTES, 1)
+        self.nbytes = self.blocks * BLOCK_BYTES
+        self.bits = self.nbytes * 8
+        per_key = self.bits / max(expected_per_window, 1)
+        self.k = max(1, min(K_MAX, round(per_key * math.log(2))))
+        self._current = bytearray(self.nbytes)
+        self._previous = bytearray(self.nbytes)
+        self._current_ones = 0
+        self._previous_ones = 0
+        self._started = time.monotonic()
+        self.rotations = 0
+
+    def _rotate(self, now: float) -> None:
+        elapsed = now - self._started
+        if elapsed >= 2 * self.window:
+            self._previous = bytearray(self.nbytes)  # idle for a while: both are expired
+            self._previous_ones = 0
+        else:
+            self._previous, self._previous_ones = self._current, self._current_ones
+        self._current = bytearray(self.nbytes)
+        self._current_ones = 0
+        self._started = now
+        self.rotations += 1
+
+    def _locate(self, key: bytes) -> tuple[int, int]:
+        """Byte offset of the key's block and the mask of its bits within it."""
+        digest = hashlib.blake2b(key, digest_size=24).digest()
+        offset = int.from_bytes(digest[:8], "little") % self.blocks * BLOCK_BYTES
+        h = int.from_bytes(digest[8:], "little")
+        mask = 0
+        for _ in range(self.k):
+            mask |= 1 << (h & (BLOCK_BITS - 1))
+            h >>= 9
+        return offset, mask
+
+    def contains(self, key: bytes) -> bool:
+        """True if `key` was (probably) seen within the window; doesn't remember it."""
+        offset, mask = self._locate(key)
+        end = offset + BLOCK_BYTES
+        return (
+            int.from_bytes(self._current[offset:end], "little") & mask == mask
+            or int.from_bytes(self._previous[offset:end], "little") & mask == mask
+        )
+
+    def check_and_add(self, key: bytes) -> bool:
+        """True if `key` was (probably) seen within the window; otherwise remembers it."""
+        now = time.monotonic()
+        if now - self._started >= self.window:
+            self._rotate(now)
+        offset, mask = self._locate(key)
+        end = offset + BLOCK_BYTES
+        block = int.from_bytes(self._current[offset:end], "little")
+        if block & mask == mask:
+            return True
+        if int.from_bytes(self._previous[offset:end], "little") & mask == mask:
+            return True
+        self._current[offset:end] = (block | mask).to_bytes(BLOCK_BYTES, "little")
+        self._current_ones += bin(mask & ~block).count("1")
+        return False
+
+    def false_positive_rate(self) -> float:
+        """Estimated chance that a new key is reported as seen."""
+        p_current = (self._current_ones / self.bits) ** self.k
+        p_previous = (self._previous_ones / self.bits) ** self.k
+        return 1 - (1 - p_current) * (1 - p_previous)
+
+    def stats(self) -> dict:
+        return {
+            "memory_bytes": 2 * self.nbytes,
+            "bits_per_filter": self.bits,
+            "hashes": self.k,
+            "window_seconds": self.window,
+            "fill_current": round(self._current_ones / self.bits, 6),
+            "fill_previous": round(self._previous_ones / self.bits, 6),
+            "estimated_fp_rate": self.false_positive_rate(),
+            "rotations": self.rotations,
+        }
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def approx_size(value: Any) -> int:
+    """Shallow size estimate for flat tuples/strings/numbers (what the caches store)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "stored_at", "size")
+
+    def __init__(self, value: Any, stored_at: float, size: int):
+        self.value = value
+        self.stored_at = stored_at
+        self.size = size
+
+
+class TTLCache:
+    """LRU cache bounded by entry count and an approximate byte budget, with TTL.
+
+    With `max_stale` set, entries stay available through get_stale() for that
+    long past their TTL (stale-while-revalidate); get() only returns fresh ones.
+    Meant to be used from the event loop; it does no locking of its own.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        max_bytes: int = 0,
+        sizer: Callable[[Any], int] = approx_size,
+        max_stale: float = 0,
+    ):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizer = sizer
+        self._data: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        hit = self.get_stale(key, allow_stale=False)
+        return hit[0] if hit is not None else None
+
+    def get_stale(self, key: Hashable, allow_stale: bool = True) -> Optional[tuple[Any, bool]]:
+        """Return (value, is_stale), or None once the entry is past TTL + max_stale."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        age = time.monotonic() - entry.stored_at
+        if age >= self.ttl + self.max_stale:
+            self._remove(key, entry)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        stale = age >= self.ttl
+        if stale and not allow_stale:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        if stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return entry.value, stale
+
+    def age(self, key: Hashable) -> Optional[float]:
+        entry = self._data.get(key)
+        return time.monotonic() - entry.stored_at if entry is not None else None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= old.size
+        size = self._sizer(value) + sys.getsizeof(key)
+        self._data[key] = _Entry(value, time.monotonic(), size)
+        self.bytes += size
+        self._evict()
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._remove(key, entry)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def _remove(self, key: Hashable, entry: _Entry) -> None:
+        del self._data[key]
+        self.bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes and self.bytes > self.max_bytes)
+        ):
+            _, entry = self._data.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        served = self.hits + self.stale_hits
+        total = served + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round(served / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
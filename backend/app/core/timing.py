@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from app.config import SERVER_TIMING
+
+# Per-stage latency for the serving path.
+#
+# `timed("stage")` measures a block with perf_counter_ns and records it into
+# a process-wide log2 histogram; when a request has called begin(), the
+# duration is also kept for that request so server_timing() can render the
+# Server-Timing header. With SERVER_TIMING off, timed() hands back a shared
+# no-op and nothing is recorded.
+
+_perf_ns = time.perf_counter_ns
+
+# Histogram buckets are powers of two in microseconds: bucket i holds
+# durations below 2**i us (the last one also takes everything larger)
+BUCKETS = 32
+
+
+class Histogram:
+    """Log2-bucketed latency histogram; recording is O(1) and allocation-free."""
+
+    __slots__ = ("counts", "count", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int) -> None:
+        self.counts[min((ns // 1000).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, q: float) -> float:
+        """Upper bound (ms) of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(2 ** i / 1000, self.max_ns / 1e6)
+        return self.max_ns / 1e6
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ns / self.count / 1e6, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p90_ms": round(self.percentile(0.90), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max_ns / 1e6, 3),
+        }
+
+
+class _RequestTimings:
+    __slots__ = ("start", "stages")
+
+    def __init__(self):
+        self.start = _perf_ns()
+        self.stages: dict[str, int] = {}
+
+
+_histograms: dict[str, Histogram] = {}
+_current: ContextVar[Optional[_RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record(name: str, ns: int) -> None:
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = _histograms[name] = Histogram()
+    hist.record(ns)
+    timings = _current.get()
+    if timings is not None:
+        # Repeated stages (e.g. one per slot in a batch) add up
+        timings.stages[name] = timings.stages.get(name, 0) + ns
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Stage":
+        self.start = _perf_ns()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        record(self.name, _perf_ns() - self.start)
+        return False
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopStage":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+def timed(name: str):
+    """Context manager timing a stage (usable around awaits)."""
+    return _Stage(name) if SERVER_TIMING else _NOOP
+
+
+def begin() -> None:
+    """Start collecting stage timings for the current request."""
+    if SERVER_TIMING:
+        _current.set(_RequestTimings())
+
+
+def finish(name: str = "total") -> None:
+    """Record the request's total time since begin()."""
+    timings = _current.get()
+    if timings is not None:
+        record(name, _perf_ns() - timings.start)
+
+
+def current() -> dict[str, float]:
+    """Stage durations (ms) recorded so far for the current request."""
+    timings = _current.get()
+    if timings is None:
+        return {}
+    return {name: round(ns / 1e6, 3) for name, ns in timings.stages.items()}
+
+
+def server_timing() -> Optional[str]:
+    """Server-Timing header value for the current request, or None when not timing."""
+    timings = _current.get()
+    if timings is None:
+        return None
+    return ", ".join(f"{name};dur={ns / 1e6:.3f}" for name, ns in timings.stages.items())
+
+
+def stats() -> dict:
+    return {"enabled": SERVER_TIMING, "stages": {name: h.stats() for name, h in _histograms.items()}}
@@ -1,4 +1,6 @@
 from __future__ import annotations
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -7,11 +9,31 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from app.config import ALLOWED_ORIGINS
+from app.core import timing
 from app.api.routes import auth, campaigns, ads, analytics, assets, pools, keys
+from app.services import dashboard, db, event_writer, geoip, signal_codec, signals
+from app.services.bandit import bandit
+from app.services.event_filter import event_filter
+from app.services.campaign_cache import campaign_cache
+from app.templates.renderer import render_cache_stats
 
 limiter = Limiter(key_func=get_remote_address)
 
-app = FastAPI(title="SOUTS DCO", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db.startup()
+    await signals.startup()
+    await bandit.startup()
+    await event_writer.startup()
+    yield
+    await event_writer.shutdown()
+    await bandit.shutdown()
+    await signals.shutdown()
+    await db.shutdown()
+
+
+app = FastAPI(title="SOUTS DCO", version="1.0.0", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -37,3 +59,19 @@ app.include_router(keys.router)
 @app.get("/health")
 async def health():
     return {"status": "ok", "service": "souts-dco"}
+
+
+@app.get("/health/stats")
+async def health_stats():
+    return {
+        "campaign_cache": campaign_cache.stats(),
+        "render_cache": render_cache_stats(),
+        "signals": signals.stats(),
+        "geoip": geoip.stats(),
+        "bandit": bandit.stats(),
+        "timing": timing.stats(),
+        "writers": event_writer.stats(),
+        "signal_dict": signal_codec.stats(),
+        "event_filter": event_filter.stats(),
+        "dashboard_cache": dashboard.stats(),
+    }
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 
+# Ids of database rows, checked where they come from public requests
+UUID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+
+
 # --- Auth ---
 class UserAuth(BaseModel):
     email: str
@@ -65,6 +69,14 @@ class RuleCreate(BaseModel):
     priority: Optional[int] = 0
 
 
+class ReplayRequest(BaseModel):
+    """What-if replay: proposed rules/mode (defaults to the campaign's own) over recent impressions."""
+    rules: Optional[list[RuleCreate]] = None
+    ab_test_mode: Optional[str] = None
+    days: int = Field(7, ge=1, le=90)
+    limit: int = Field(50000, ge=1, le=200000)
+
+
 class RuleUpdate(BaseModel):
     variant_id: Optional[str] = None
     signal: Optional[str] = None
@@ -90,14 +102,30 @@ class APIKeyUpdate(BaseModel):
     scopes: Optional[list[str]] = None
 
 
+# --- Ad Serving ---
+class AdSlot(BaseModel):
+    campaign_id: str
+    template: str = "default"
+    width: int = 400
+    height: int = 300
+
+
+class AdBatchRequest(BaseModel):
+    slots: list[AdSlot] = Field(..., min_length=1, max_length=20)
+    format: str = "html"
+    track: bool = True
+
+
 # --- Analytics ---
 class ClickEvent(BaseModel):
-    campaign_id: str
-    variant_id: str
+    campaign_id: str = Field(..., pattern=UUID_PATTERN)
+    variant_id: str = Field(..., pattern=UUID_PATTERN)
     url: Optional[str] = None
+    visitor_id: Optional[str] = None
 
 
 class ImpressionEvent(BaseModel):
-    campaign_id: str
-    variant_id: str
+    campaign_id: str = Field(..., pattern=UUID_PATTERN)
+    variant_id: str = Field(..., pattern=UUID_PATTERN)
     signals: Optional[dict] = None
+    visitor_id: Optional[str] = None
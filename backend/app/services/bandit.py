@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+import httpx
+import numpy as np
+
+from app.config import BANDIT_FLUSH_INTERVAL
+from app.services import db
+
+# Thompson-sampling state for campaigns in `bandit` mode.
+#
+# Each worker keeps per-variant impression/click counters in memory: the
+# totals read from variant_stats when the campaign snapshot loads ("base")
+# plus what this worker has counted since ("pending"). Decisions sample every
+# variant's Beta(1 + clicks, 1 + non-clicks) posterior in one vectorized call
+# and pick the best draw, so no database work happens per request. Draws are
+# made in small batches (up to DRAW_BATCH decisions at a time, refreshed from
+# the current counts) to amortize numpy's per-call overhead. Pending
+# counts are flushed to variant_stats on an interval, and the next snapshot
+# load brings in what the other workers flushed.
+#
+# Only campaigns this worker has loaded in bandit mode, and their known
+# variants, are counted: ids come from the database, never from the request.
+# A worker that serves a campaign loads it, so with several workers each
+# hot bandit campaign is counted everywhere; events for one a worker has
+# never served are left to the raw impression/click tables.
+
+IMPRESSIONS, CLICKS = 0, 1
+
+# Decisions drawn per vectorized call, and the cap on posterior samples per call
+DRAW_BATCH = 256
+DRAW_SAMPLES = 4096
+
+
+class CampaignArms:
+    """Counters for one campaign's variants, aligned with the snapshot's variant order."""
+
+    __slots__ = ("campaign_id", "ids", "index", "base", "pending", "_draws")
+
+    def __init__(self, campaign_id: str):
+        self.campaign_id = campaign_id
+        self.ids: tuple[str, ...] = ()
+        self.index: dict[str, int] = {}
+        self.base = np.zeros((0, 2), dtype=np.int64)
+        self.pending = np.zeros((0, 2), dtype=np.int64)
+        self._draws: list[int] = []
+
+    def align(self, variant_ids: tuple[str, ...]) -> None:
+        """Re-key the counters to a new variant list, keeping counts by id."""
+        if variant_ids == self.ids:
+            return
+        base = np.zeros((len(variant_ids), 2), dtype=np.int64)
+        pending = np.zeros((len(variant_ids), 2), dtype=np.int64)
+        for i, vid in enumerate(variant_ids):
+            old = self.index.get(vid)
+            if old is not None:
+                base[i] = self.base[old]
+                pending[i] = self.pending[old]
+        self.ids = variant_ids
+        self.index = {vid: i for i, vid in enumerate(variant_ids)}
+        self.base, self.pending = base, pending
+        self._draws = []
+
+    def reset_draws(self) -> None:
+        self._draws = []
+
+    def choose(self, rng: np.random.Generator) -> int:
+        """Index of the variant whose posterior draw is highest."""
+        if not self._draws:
+            totals = self.base + self.pending
+            clicks = totals[:, CLICKS, None]
+            misses = np.maximum(totals[:, IMPRESSIONS, None] - clicks, 0)
+            batch = max(1, min(DRAW_BATCH, DRAW_SAMPLES // max(len(self.ids), 1)))
+            samples = rng.beta(1 + clicks, 1 + misses, size=(len(self.ids), batch))
+            self._draws = samples.argmax(axis=0).tolist()
+        return self._draws.pop()
+
+
+class Bandit:
+    """Registry of per-campaign arms plus the periodic flush to variant_stats."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._arms: dict[str, CampaignArms] = {}
+        self._rng = np.random.default_rng()
+        self._flusher: Optional[asyncio.Task] = None
+        self.decisions = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.flush_rejected = 0
+
+    def arms(self, campaign_id: str, variant_ids: tuple[str, ...]) -> CampaignArms:
+        arms = self._arms.get(campaign_id)
+        if arms is None:
+            arms = self._arms[campaign_id] = CampaignArms(campaign_id)
+        arms.align(variant_ids)
+        return arms
+
+    def load(self, campaign_id: str, variant_ids: tuple[str, ...], rows: list[dict]) -> None:
+        """Merge the variant_stats totals read at snapshot load into the base counts.
+
+        Totals only grow, so the larger of the loaded and the local count wins:
+        a flush acknowledged after these rows were read isn't lost.
+        """
+        arms = self.arms(campaign_id, variant_ids)
+        for row in rows:
+            i = arms.index.get(row.get("variant_id"))
+            if i is not None:
+                loaded = (row.get("impressions") or 0, row.get("clicks") or 0)
+                arms.base[i] = np.maximum(arms.base[i], loaded)
+        arms.reset_draws()
+
+    def forget(self, campaign_id: str) -> None:
+        """Stop counting a campaign that is no longer in bandit mode."""
+        self._arms.pop(campaign_id, None)
+
+    def choose(self, arms: CampaignArms) -> str:
+        """Id of the chosen variant.
+
+        Arms are re-aligned when a newer snapshot loads, so callers holding an
+        older plan must map the choice by id, not by position.
+        """
+        self.decisions += 1
+        return arms.ids[arms.choose(self._rng)]
+
+    def _record(self, campaign_id: str, variant_id: str, column: int, n: int) -> None:
+        arms = self._arms.get(campaign_id)
+        i = arms.index.get(variant_id) if arms is not None else None
+        if i is not None:
+            arms.pending[i, column] += n
+
+    def record_impression(self, campaign_id: str, variant_id: str, n: int = 1) -> None:
+        self._record(campaign_id, variant_id, IMPRESSIONS, n)
+
+    def record_click(self, campaign_id: str, variant_id: str, n: int = 1) -> None:
+        self._record(campaign_id, variant_id, CLICKS, n)
+
+    async def _send(self, rows: list[dict], settled: list[tuple[dict, bool]]) -> bool:
+        """Send deltas, adding (row, applied) to `settled` for each row the database answered for.
+
+        A batch the database rejects (4xx) is split until the bad rows are
+        isolated; those are settled as not applied. Returns False once the
+        database is unavailable, leaving the remaining rows pending.
+        """
+        try:
+            await db.rpc("increment_variant_stats", {"deltas": rows})
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status >= 500 or status in (408, 425, 429):
+                return False
+            if len(rows) == 1:
+                settled.append((rows[0], False))
+                return True
+            mid = len(rows) // 2
+            return await self._send(rows[:mid], settled) and await self._send(rows[mid:], settled)
+        except (httpx.HTTPError, OSError):
+            return False
+        settled.extend((row, True) for row in rows)
+        return True
+
+    async def flush(self) -> int:
+        """Push pending counts to variant_stats. Returns the number of variant rows applied.
+
+        Counts stay pending (and in use for decisions) until the database
+        takes them; while it is unavailable they are retried with the next
+        flush. Rows it rejects are dropped.
+        """
+        rows = []
+        bases: dict[tuple[str, str], np.ndarray] = {}
+        for arms in self._arms.values():
+            for i in np.flatnonzero(arms.pending.any(axis=1)):
+                impressions, clicks = (int(x) for x in arms.pending[i])
+                rows.append({
+                    "campaign_id": arms.campaign_id,
+                    "variant_id": arms.ids[i],
+                    "impressions": impressions,
+                    "clicks": clicks,
+                })
+                bases[(arms.campaign_id, arms.ids[i])] = arms.base[i].copy()
+        if not rows:
+            return 0
+        settled: list[tuple[dict, bool]] = []
+        if not await self._send(rows, settled):
+            self.flush_errors += 1
+        applied = 0
+        for row, ok in settled:
+            key = (row["campaign_id"], row["variant_id"])
+            arms = self._arms.get(key[0])
+            i = arms.index.get(key[1]) if arms else None
+            if ok:
+                applied += 1
+            else:
+                self.flush_rejected += 1
+            if i is None:
+                continue
+            sent = np.array((row["impressions"], row["clicks"]))
+            arms.pending[i] -= sent
+            if ok:
+                # A snapshot load during the RPC may already have brought these in
+                arms.base[i] = np.maximum(arms.base[i], bases[key] + sent)
+        if applied:
+            self.flushes += 1
+            self.flushed_rows += applied
+        return applied
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def startup(self) -> None:
+        if self.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def shutdown(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "campaigns": len(self._arms),
+            "pending": sum(int(a.pending.sum()) for a in self._arms.values()),
+            "decisions": self.decisions,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+            "flush_rejected": self.flush_rejected,
+        }
+
+
+bandit = Bandit(BANDIT_FLUSH_INTERVAL)
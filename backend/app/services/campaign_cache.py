@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from app.config import CAMPAIGN_CACHE_MAX, CAMPAIGN_CACHE_TTL
+from app.core.singleflight import SingleFlight
+from app.services.decisioning import DecisionPlan, compile_campaign
+
+
+@dataclass(frozen=True)
+class CampaignSnapshot:
+    """Preloaded campaign row with its variants and rules.
+
+    Snapshots are shared between requests and must be treated as read-only.
+    """
+
+    campaign_id: str
+    campaign: dict
+    loaded_at: float
+    plan: DecisionPlan
+
+    @property
+    def signal_keys(self) -> frozenset[str]:
+        return self.plan.signal_keys
+
+
+class CampaignCache:
+    """Bounded LRU of campaign snapshots with TTL eviction.
+
+    Invalidation is per process; the TTL bounds how long other workers can
+    serve a campaign that was edited elsewhere. Concurrent misses for a
+    campaign share one load, and a load that started before an invalidation
+    is served to its callers but not cached (nor joined by later ones).
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, CampaignSnapshot] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, campaign_id: str) -> Optional[CampaignSnapshot]:
+        with self._lock:
+            snap = self._data.get(campaign_id)
+            if snap is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - snap.loaded_at >= self.ttl:
+                del self._data[campaign_id]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(campaign_id)
+            self.hits += 1
+            return snap
+
+    def _snapshot(self, campaign_id: str, campaign: dict) -> CampaignSnapshot:
+        frozen = {
+            **campaign,
+            "variants": tuple(campaign.get("variants") or ()),
+            "rules": tuple(campaign.get("rules") or ()),
+        }
+        return CampaignSnapshot(
+            campaign_id=campaign_id,
+            campaign=frozen,
+            loaded_at=time.monotonic(),
+            plan=compile_campaign(frozen),
+        )
+
+    def put(self, campaign_id: str, campaign: dict) -> CampaignSnapshot:
+        snap = self._snapshot(campaign_id, campaign)
+        with self._lock:
+            self._data[campaign_id] = snap
+            self._data.move_to_end(campaign_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return snap
+
+    async def get_or_load(
+        self, campaign_id: str, loader: Callable[[str], Awaitable[dict]]
+    ) -> CampaignSnapshot:
+        snap = self.get(campaign_id)
+        if snap is not None:
+            return snap
+        generation = self._generations.get(campaign_id, 0)
+
+        async def load() -> CampaignSnapshot:
+            campaign = await loader(campaign_id)
+            if self._generations.get(campaign_id, 0) != generation:
+                return self._snapshot(campaign_id, campaign)  # edited meanwhile: don't cache
+            return self.put(campaign_id, campaign)
+
+        return await self._flight.do((campaign_id, generation), load)
+
+    def invalidate(self, campaign_id: str) -> None:
+        with self._lock:
+            self._generations[campaign_id] = self._generations.get(campaign_id, 0) + 1
+            if self._data.pop(campaign_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "singleflight": self._flight.stats(),
+        }
+
+
+campaign_cache = CampaignCache(max_size=CAMPAIGN_CACHE_MAX, ttl=CAMPAIGN_CACHE_TTL)
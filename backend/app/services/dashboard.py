@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from app.config import DASHBOARD_CACHE_MAX, DASHBOARD_CACHE_TTL
+from app.core.cache import TTLCache
+from app.core.singleflight import SingleFlight
+from app.services import db
+
+# Account overview for the analytics dashboard.
+#
+# One dashboard_stats RPC sums the hourly rollups of all the user's campaigns
+# in a single grouped query, so the cost doesn't grow with round trips per
+# campaign. Results are cached per user for DASHBOARD_CACHE_TTL seconds and
+# concurrent misses for the same user share one RPC. Like the campaign
+# snapshot cache, invalidation (on campaign create/duplicate/delete) is per
+# process; the TTL bounds staleness elsewhere. Each invalidation bumps the
+# user's generation, so a load that started before it is neither cached nor
+# joined by later callers.
+
+DAYS = 7
+
+_cache = TTLCache(DASHBOARD_CACHE_TTL, DASHBOARD_CACHE_MAX)
+_flight = SingleFlight()
+_generations: dict[str, int] = {}
+
+
+async def _load(user_id: str) -> dict:
+    since = (datetime.now(timezone.utc) - timedelta(days=DAYS)).replace(minute=0, second=0, microsecond=0)
+    rows = await db.rpc("dashboard_stats", {"uid": user_id, "since": since.isoformat()}) or []
+    total_imp = 0
+    total_clicks = 0
+    campaigns = []
+    for row in rows:
+        ci, cc = int(row["impressions"]), int(row["clicks"])
+        total_imp += ci
+        total_clicks += cc
+        campaigns.append({
+            "campaign_id": row["campaign_id"],
+            "impressions": ci,
+            "clicks": cc,
+            "ctr": round(cc / ci * 100, 2) if ci > 0 else 0,
+        })
+    return {
+        "campaigns": campaigns,
+        "total_impressions": total_imp,
+        "total_clicks": total_clicks,
+        "ctr": round(total_clicks / total_imp * 100, 2) if total_imp > 0 else 0,
+    }
+
+
+async def get(user_id: str) -> dict:
+    """The user's last-7-days totals per campaign (shared; treat as read-only)."""
+    result = _cache.get(user_id)
+    if result is None:
+        generation = _generations.get(user_id, 0)
+        result = await _flight.do((user_id, generation), lambda: _load(user_id))
+        if _generations.get(user_id, 0) == generation:
+            _cache.set(user_id, result)
+    return result
+
+
+def invalidate(user_id: str) -> None:
+    _generations[user_id] = _generations.get(user_id, 0) + 1
+    _cache.delete(user_id)
+
+
+def stats() -> dict:
+    return {**_cache.stats(), "singleflight": _flight.stats()}
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import httpx
+
+from app.config import (
+    SUPABASE_URL,
+    SUPABASE_SERVICE_KEY,
+    DB_TIMEOUT,
+    DB_MAX_CONNECTIONS,
+    DB_MAX_KEEPALIVE,
+)
+
+# Async PostgREST access for the hot paths (serving, tracking, auth).
+# The sync supabase-py client blocks the event loop for every round trip;
+# this module shares one pooled keep-alive client per worker instead.
+
+_client: httpx.AsyncClient | None = None
+
+
+def _create_client() -> httpx.AsyncClient:
+    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+    return httpx.AsyncClient(
+        base_url=SUPABASE_URL.rstrip("/"),
+        headers={
+            "apikey": SUPABASE_SERVICE_KEY,
+            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+        },
+        timeout=DB_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=DB_MAX_CONNECTIONS,
+            max_keepalive_connections=DB_MAX_KEEPALIVE,
+            keepalive_expiry=30,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+
+async def startup() -> None:
+    if SUPABASE_URL and SUPABASE_SERVICE_KEY:
+        get_client()
+
+
+async def shutdown() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def eq(value: Any) -> str:
+    return f"eq.{value}"
+
+
+def gt(value: Any) -> str:
+    return f"gt.{value}"
+
+
+def gte(value: Any) -> str:
+    return f"gte.{value}"
+
+
+def in_(values: list) -> str:
+    return "in.(" + ",".join(str(v) for v in values) + ")"
+
+
+def _params(
+    columns: str,
+    filters: Optional[dict[str, str]],
+    order: Optional[str],
+    limit: Optional[int],
+) -> dict[str, str]:
+    params: dict[str, str] = {"select": columns}
+    if filters:
+        params.update(filters)
+    if order:
+        params["order"] = order
+    if limit is not None:
+        params["limit"] = str(limit)
+    return params
+
+
+async def select(
+    table: str,
+    columns: str = "*",
+    filters: Optional[dict[str, str]] = None,
+    order: Optional[str] = None,
+    limit: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> list[dict]:
+    """SELECT rows; `filters` maps column -> PostgREST operator expression, e.g. {"id": eq(x)}."""
+    resp = await get_client().get(
+        f"/rest/v1/{table}",
+        params=_params(columns, filters, order, limit),
+        timeout=timeout or DB_TIMEOUT,
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def select_one(
+    table: str,
+    columns: str = "*",
+    filters: Optional[dict[str, str]] = None,
+    timeout: Optional[float] = None,
+) -> Optional[dict]:
+    rows = await select(table, columns, filters, limit=1, timeout=timeout)
+    return rows[0] if rows else None
+
+
+async def count(
+    table: str,
+    filters: Optional[dict[str, str]] = None,
+    timeout: Optional[float] = None,
+) -> int:
+    resp = await get_client().head(
+        f"/rest/v1/{table}",
+        params=_params("id", filters, None, None),
+        headers={"Prefer": "count=exact"},
+        timeout=timeout or DB_TIMEOUT,
+    )
+    resp.raise_for_status()
+    content_range = resp.headers.get("content-range", "*/0")
+    total = content_range.rsplit("/", 1)[-1]
+    return int(total) if total.isdigit() else 0
+
+
+async def insert(
+    table: str,
+    rows: dict | list[dict],
+    returning: bool = False,
+    timeout: Optional[float] = None,
+    on_conflict: Optional[str] = None,
+) -> list[dict]:
+    """Insert rows; with `on_conflict`, rows clashing on that key are skipped (idempotent)."""
+    prefer = "return=representation" if returning else "return=minimal"
+    params = None
+    if on_conflict:
+        prefer += ",resolution=ignore-duplicates"
+        params = {"on_conflict": on_conflict}
+    resp = await get_client().post(
+        f"/rest/v1/{table}",
+        json=rows,
+        params=params,
+        headers={"Prefer": prefer},
+        timeout=timeout or DB_TIMEOUT,
+    )
+    resp.raise_for_status()
+    return resp.json() if returning else []
+
+
+async def update(
+    table: str,
+    values: dict,
+    filters: dict[str, str],
+    returning: bool = False,
+    timeout: Optional[float] = None,
+) -> list[dict]:
+    resp = await get_client().patch(
+        f"/rest/v1/{table}",
+        params=filters,
+        json=values,
+        headers={"Prefer": "return=representation" if returning else "return=minimal"},
+        timeout=timeout or DB_TIMEOUT,
+    )
+    resp.raise_for_status()
+    return resp.json() if returning else []
+
+
+async def rpc(fn: str, args: Optional[dict] = None, timeout: Optional[float] = None) -> Any:
+    resp = await get_client().post(
+        f"/rest/v1/rpc/{fn}",
+        json=args or {},
+        timeout=timeout or DB_TIMEOUT,
+    )
+    resp.raise_for_status()
+    return resp.json() if resp.content else None
+
+
+async def get_auth_user(token: str, timeout: Optional[float] = None) -> Optional[dict]:
+    """Resolve a Supabase session JWT to its user via GoTrue. Returns None if invalid."""
+    resp = await get_client().get(
+        "/auth/v1/user",
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=timeout or DB_TIMEOUT,
+    )
+    if resp.status_code in (401, 403, 404):
+        return None
+    resp.raise_for_status()
+    return resp.json()
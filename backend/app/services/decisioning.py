@@ -1,51 +1,169 @@
 from __future__ import annotations
 
+import hashlib
+import math
 import random
-from typing import Optional
+from typing import Callable, Optional
 
+RULE_MODES = ("rules", "rules_then_weighted", "rules_then_sticky")
+WEIGHTED_MODES = ("weighted", "rules_then_weighted")
+STICKY_MODES = ("sticky", "rules_then_sticky")
+BANDIT_MODE = "bandit"
 
-def _evaluate_rule(rule: dict, signals: dict) -> bool:
-    """Evaluate a single rule against collected signals."""
-    signal_key = rule.get("signal", "")
-    operator = rule.get("operator", "")
-    rule_value = rule.get("value", "")
-    actual = signals.get(signal_key)
+# Sticky campaigns with more variants than this are split in two levels
+STICKY_FLAT_MAX = 64
+STICKY_GROUPS = 64
 
-    if actual is None:
-        return False
+# Campaigns with at least this many compiled rules match through a RuleIndex
+RULE_INDEX_MIN_RULES = 16
 
-    actual_str = str(actual).lower()
-    rule_str = str(rule_value).lower()
+# Signal value normalized once per decision: (lowercased str, float or None)
+_Normalized = tuple[str, Optional[float]]
+_MISSING = object()
 
-    actual_num: float = 0.0
-    rule_num: float = 0.0
-    is_numeric = False
+
+# Operator aliases accepted in rule rows, mapped to their canonical name
+OPERATORS = {
+    "eq": "eq", "equals": "eq",
+    "ne": "ne", "not_equals": "ne",
+    "contains": "contains",
+    "in": "in",
+    "gt": "gt", "greater_than": "gt",
+    "lt": "lt", "less_than": "lt",
+    "gte": "gte", "greater_equal": "gte",
+    "lte": "lte", "less_equal": "lte",
+}
+NUMERIC_OPERATORS = frozenset({"gt", "lt", "gte", "lte"})
+
+
+class CompiledRule:
+    """A rule pre-parsed into a typed predicate and bound to its variant."""
+
+    __slots__ = (
+        "rule_id", "signal", "operator", "priority", "variant",
+        "text", "number", "options", "test",
+    )
+
+    def __init__(self, rule: dict, variant: dict, operator: str, text: str, number: Optional[float]):
+        self.rule_id = rule.get("id")
+        self.signal = rule.get("signal", "")
+        self.operator = operator
+        self.priority = rule.get("priority") or 0
+        self.variant = variant
+        self.text = text
+        self.number = number
+        self.options = (
+            frozenset(v.strip().lower() for v in text.split(",")) if operator == "in" else None
+        )
+        self.test = self._predicate()
+
+    def _predicate(self) -> Callable[[str, Optional[float]], bool]:
+        op, text, number, options = self.operator, self.text, self.number, self.options
+        if op == "eq":
+            return lambda s, n: s == text
+        if op == "ne":
+            return lambda s, n: s != text
+        if op == "contains":
+            return lambda s, n: text in s
+        if op == "in":
+            return lambda s, n: s in options
+        if op == "gt":
+            return lambda s, n: n is not None and n > number
+        if op == "lt":
+            return lambda s, n: n is not None and n < number
+        if op == "gte":
+            return lambda s, n: n is not None and n >= number
+        return lambda s, n: n is not None and n <= number
+
+
+def _parse_number(value: object) -> Optional[float]:
     try:
-        actual_num = float(actual)
-        rule_num = float(rule_value)
-        is_numeric = True
+        return float(value)  # type: ignore[arg-type]
     except (ValueError, TypeError):
-        pass
-
-    if operator in ("eq", "equals"):
-        return actual_str == rule_str
-    elif operator in ("ne", "not_equals"):
-        return actual_str != rule_str
-    elif operator == "contains":
-        return rule_str in actual_str
-    elif operator in ("gt", "greater_than") and is_numeric:
-        return actual_num > rule_num
-    elif operator in ("lt", "less_than") and is_numeric:
-        return actual_num < rule_num
-    elif operator in ("gte", "greater_equal") and is_numeric:
-        return actual_num >= rule_num
-    elif operator in ("lte", "less_equal") and is_numeric:
-        return actual_num <= rule_num
-    elif operator == "in":
-        options = [v.strip().lower() for v in rule_str.split(",")]
-        return actual_str in options
-
-    return False
+        return None
+
+
+def compile_rules(variants: list[dict], rules: list[dict]) -> tuple[CompiledRule, ...]:
+    """Compile rules into predicates, highest priority first.
+
+    Rules pointing at unknown variants or that can never match are dropped.
+    Ties keep their original order, as the per-request sort did.
+    """
+    variant_map = {v["id"]: v for v in variants}
+    ordered = sorted(rules, key=lambda r: r.get("priority") or 0, reverse=True)
+    compiled = []
+    for rule in ordered:
+        variant = variant_map.get(rule.get("variant_id"))
+        operator = OPERATORS.get(rule.get("operator", ""))
+        if variant is None or operator is None:
+            continue
+        value = rule.get("value", "")
+        number = _parse_number(value)
+        # Numeric rules need a numeric threshold; NaN compares false to everything
+        if operator in NUMERIC_OPERATORS and (number is None or number != number):
+            continue
+        compiled.append(CompiledRule(rule, variant, operator, str(value).lower(), number))
+    return tuple(compiled)
+
+
+def _normalize(value: object) -> _Normalized:
+    return str(value).lower(), _parse_number(value)
+
+
+def match_rules(rules: tuple[CompiledRule, ...], signals: dict) -> Optional[dict]:
+    """Return the variant of the first (highest-priority) matching compiled rule."""
+    seen: dict[str, object] = {}
+    for rule in rules:
+        norm = seen.get(rule.signal)
+        if norm is None:
+            actual = signals.get(rule.signal)
+            norm = _MISSING if actual is None else _normalize(actual)
+            seen[rule.signal] = norm
+        if norm is _MISSING:
+            continue
+        if rule.test(*norm):  # type: ignore[misc]
+            return rule.variant
+    return None
+
+
+class DecisionPlan:
+    """Everything select_variant needs, precomputed once per campaign snapshot."""
+
+    __slots__ = (
+        "mode", "variants", "default", "rules", "signal_keys", "index", "sampler", "sticky", "arms", "by_id",
+    )
+
+    def __init__(self, campaign: dict):
+        from app.services.rule_index import RuleIndex  # imports this module
+
+        self.mode = campaign.get("ab_test_mode", "off")
+        self.variants = list(campaign.get("variants", []))
+        self.default = _get_default_variant(self.variants)
+        rules = list(campaign.get("rules", []))
+        self.rules = compile_rules(self.variants, rules) if self.mode in RULE_MODES else ()
+        self.signal_keys = frozenset(r.signal for r in self.rules if r.signal)
+        # Small rule sets are faster to scan than to probe through the index
+        self.index = RuleIndex(self.rules) if len(self.rules) >= RULE_INDEX_MIN_RULES else None
+        self.sampler = WeightedSampler(self.variants) if self.mode in WEIGHTED_MODES else None
+        self.sticky = (
+            StickySplit(str(campaign.get("id", "")), self.variants) if self.mode in STICKY_MODES else None
+        )
+        self.arms = None
+        self.by_id: dict[str, dict] = {}
+        if self.mode == BANDIT_MODE:
+            self.by_id = {v["id"]: v for v in self.variants}
+            from app.services.bandit import bandit  # numpy; only bandit campaigns need it
+
+            self.arms = bandit.arms(str(campaign.get("id", "")), tuple(v["id"] for v in self.variants))
+
+    def match(self, signals: dict) -> Optional[dict]:
+        if self.index is not None:
+            return self.index.match(signals)
+        return match_rules(self.rules, signals)
+
+
+def compile_campaign(campaign: dict) -> DecisionPlan:
+    return DecisionPlan(campaign)
 
 
 def _get_default_variant(variants: list[dict]) -> Optional[dict]:
@@ -56,55 +174,201 @@ def _get_default_variant(variants: list[dict]) -> Optional[dict]:
     return variants[0] if variants else None
 
 
-def _select_by_rules(variants: list[dict], rules: list[dict], signals: dict) -> Optional[dict]:
-    """Evaluate rules by priority (highest first), return first matching variant."""
-    sorted_rules = sorted(rules, key=lambda r: r.get("priority", 0), reverse=True)
-    variant_map = {v["id"]: v for v in variants}
+# Per-worker RNG for weighted draws; not shared with other users of `random`
+_rng = random.Random()
 
-    for rule in sorted_rules:
-        if _evaluate_rule(rule, signals):
-            vid = rule.get("variant_id")
-            if vid in variant_map:
-                return variant_map[vid]
-    return None
 
+def _weights(variants: list[dict]) -> list[float]:
+    """Variant weights with missing ones as 1.0 and negative ones as 0."""
+    weights = []
+    for v in variants:
+        w = v.get("weight", 1.0)
+        weights.append(max(float(w if w is not None else 1.0), 0.0))
+    return weights
 
-def _select_by_weight(variants: list[dict]) -> Optional[dict]:
-    """Weighted random selection based on variant weights."""
-    if not variants:
-        return None
-    weights = [v.get("weight", 1.0) for v in variants]
-    total = sum(weights)
-    if total <= 0:
-        return variants[0]
-    return random.choices(variants, weights=weights, k=1)[0]
 
+class WeightedSampler:
+    """O(1) weighted choice over variants using Walker's alias method.
 
-def select_variant(campaign: dict, signals: dict) -> Optional[dict]:
-    """Select a variant based on campaign mode, rules, and signals."""
-    variants = campaign.get("variants", [])
-    rules = campaign.get("rules", [])
+    Built once per campaign snapshot, so a weight change takes effect when
+    the snapshot is reloaded. Missing weights count as 1.0, negative as 0;
+    when nothing has positive weight the first variant is always chosen.
+    """
+
+    __slots__ = ("variants", "choices", "prob", "alias", "n")
+
+    def __init__(self, variants: list[dict]):
+        self.variants = variants
+        weights = _weights(variants)
+        # Zero-weight variants are left out of the table so they can never be drawn
+        self.choices = [v for v, w in zip(variants, weights) if w > 0]
+        positive = [w for w in weights if w > 0]
+        self.n = n = len(positive)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        if n == 0:
+            return
+
+        total = sum(positive)
+        scaled = [w * n / total for w in positive]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # Whatever is left is 1.0 up to rounding error and keeps prob 1.0
+
+    def pick(self) -> Optional[dict]:
+        if self.n == 0:
+            return self.variants[0] if self.variants else None
+        u = _rng.random() * self.n
+        i = int(u)
+        return self.choices[i if u - i < self.prob[i] else self.alias[i]]
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def _mix64(x: int) -> int:
+    """splitmix64 finalizer: a cheap, well-distributed 64-bit mix."""
+    x = ((x ^ (x >> 33)) * 0xFF51AFD7ED558CCD) & _MASK64
+    x = ((x ^ (x >> 33)) * 0xC4CEB9FE1A85EC53) & _MASK64
+    return x ^ (x >> 33)
+
+
+def _rendezvous(bucket: int, seeds: list[int], weights: list[float]) -> int:
+    """Weighted rendezvous (highest random weight) choice of an index."""
+    best, chosen = -1.0, 0
+    for i, (seed, weight) in enumerate(zip(seeds, weights)):
+        u = ((_mix64(bucket ^ seed) >> 11) + 0.5) * 2.0 ** -53
+        score = -weight / math.log(u)
+        if score > best:
+            best, chosen = score, i
+    return chosen
+
+
+class StickySplit:
+    """Deterministic weighted assignment of visitors to variants, with no storage.
+
+    A visitor's 64-bit bucket (a hash of campaign id and visitor key) picks a
+    variant by weighted rendezvous hashing: every variant scores the bucket
+    and the best score, scaled by weight, wins. That splits traffic by
+    weight, and when a weight changes the only visitors who move are those
+    pulled into or pushed out of that variant.
+
+    Campaigns with more than STICKY_FLAT_MAX variants (generated pools) are
+    split in two levels, first across STICKY_GROUPS fixed groups and then
+    within one, to keep a pick cheap; movement is then near-minimal.
+    """
+
+    __slots__ = ("variants", "campaign_id", "groups")
+
+    def __init__(self, campaign_id: str, variants: list[dict]):
+        self.variants = variants
+        self.campaign_id = campaign_id
+        members = [
+            (_hash64(str(v["id"])), w, v)
+            for v, w in zip(variants, _weights(variants))
+            if w > 0
+        ]
+        if len(members) > STICKY_FLAT_MAX:
+            grouped: dict[int, list] = {}
+            for member in members:
+                grouped.setdefault(member[0] % STICKY_GROUPS, []).append(member)
+        else:
+            grouped = {0: members} if members else {}
+        # (group seed, group weight, member seeds, member weights, member variants)
+        self.groups = [
+            (
+                _hash64(f"group:{g}"),
+                sum(m[1] for m in group),
+                [m[0] for m in group],
+                [m[1] for m in group],
+                [m[2] for m in group],
+            )
+            for g, group in sorted(grouped.items())
+        ]
+
+    def bucket(self, visitor_key: str) -> int:
+        return _hash64(f"{self.campaign_id}:{visitor_key}")
+
+    def pick(self, visitor_key: str) -> Optional[dict]:
+        if not self.groups:
+            return self.variants[0] if self.variants else None
+        bucket = self.bucket(visitor_key)
+        group = self.groups[0]
+        if len(self.groups) > 1:
+            chosen = _rendezvous(bucket, [g[0] for g in self.groups], [g[1] for g in self.groups])
+            group = self.groups[chosen]
+            bucket = _mix64(bucket ^ group[0])  # independent draw within the group
+        return group[4][_rendezvous(bucket, group[2], group[3])]
+
+
+def visitor_key(signals: dict, visitor_id: Optional[str] = None) -> str:
+    """Stable visitor key: the explicit visitor id, else IP + user agent."""
+    if visitor_id:
+        return f"id:{visitor_id}"
+    return f"ipua:{signals.get('ip', '')}|{signals.get('user_agent', '')}"
+
+
+def select_variant(
+    campaign: dict,
+    signals: dict,
+    plan: Optional[DecisionPlan] = None,
+    visitor_id: Optional[str] = None,
+) -> Optional[dict]:
+    """Select a variant based on campaign mode, rules, and signals.
+
+    Pass the snapshot's precompiled `plan` on hot paths; without it the
+    campaign is compiled on the fly. Sticky modes key on `visitor_id` when
+    given, else on the request's IP and user agent.
+    """
+    if plan is None:
+        plan = compile_campaign(campaign)
+    variants = plan.variants
 
     if not variants:
         return None
 
-    mode = campaign.get("ab_test_mode", "off")
+    mode = plan.mode
 
     if mode == "off":
-        return _get_default_variant(variants)
+        return plan.default
 
     if mode == "rules":
-        result = _select_by_rules(variants, rules, signals)
-        return result or _get_default_variant(variants)
+        result = plan.match(signals)
+        return result or plan.default
 
     if mode == "weighted":
-        return _select_by_weight(variants)
+        return plan.sampler.pick()  # type: ignore[union-attr]
 
     if mode == "rules_then_weighted":
-        result = _select_by_rules(variants, rules, signals)
+        result = plan.match(signals)
         if result:
             return result
-        return _select_by_weight(variants)
+        return plan.sampler.pick()  # type: ignore[union-attr]
+
+    if mode == "sticky":
+        return plan.sticky.pick(visitor_key(signals, visitor_id))  # type: ignore[union-attr]
+
+    if mode == "rules_then_sticky":
+        result = plan.match(signals)
+        if result:
+            return result
+        return plan.sticky.pick(visitor_key(signals, visitor_id))  # type: ignore[union-attr]
+
+    if mode == BANDIT_MODE:
+        from app.services.bandit import bandit
+
+        # A variant added after this plan was built isn't in it: use the default
+        return plan.by_id.get(bandit.choose(plan.arms)) or plan.default  # type: ignore[arg-type]
 
     # Fallback
-    return _get_default_variant(variants)
+    return plan.default
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import re
+from typing import Mapping, Optional
+
+from app.config import (
+    BOT_FILTER,
+    DEDUP_ENABLED,
+    DEDUP_EXPECTED_EVENTS,
+    DEDUP_MEMORY_BYTES,
+    DEDUP_WINDOW,
+)
+from app.core.bloom import RotatingBloom
+
+# Drops tracking events that shouldn't reach the database or the counters:
+#
+#   - prefetches and previews (Purpose / Sec-Purpose / X-Moz / X-Purpose
+#     headers), which were never seen by a person;
+#   - self-declared bots: crawler, monitoring and HTTP-library user agents,
+#     and requests with no user agent at all;
+#   - repeats of the same event by the same visitor for the same campaign
+#     and variant within DEDUP_WINDOW seconds (page refreshes, double
+#     clicks), remembered in a rotating Bloom filter of fixed size. The
+#     visitor is the publisher's visitor id when there is one, else IP +
+#     user agent + Accept-Language.
+#
+# A Bloom filter never misses a repeat, but may mistake a new event for one;
+# stats() reports the estimated rate so DEDUP_MEMORY_BYTES can be sized.
+
+_PREFETCH_HEADERS = ("purpose", "sec-purpose", "x-moz", "x-purpose")
+_PREFETCH_VALUES = ("prefetch", "preview", "prerender")
+
+_BOT_UA = re.compile(
+    r"\bbot\b|bot/|crawl|spider|slurp|scrap|headless|phantomjs|lighthouse|pingdom|uptime|monitor|"
+    r"facebookexternalhit|embedly|preview|curl/|wget/|python-requests|python-urllib|httpx|aiohttp|"
+    r"go-http-client|java/|libwww|node-fetch|axios/",
+    re.IGNORECASE,
+)
+
+KINDS = ("impression", "click")
+
+
+def is_prefetch(headers: Mapping[str, str]) -> bool:
+    for name in _PREFETCH_HEADERS:
+        value = headers.get(name)
+        if value and any(v in value.lower() for v in _PREFETCH_VALUES):
+            return True
+    return False
+
+
+def is_bot(user_agent: str) -> bool:
+    return not user_agent or _BOT_UA.search(user_agent) is not None
+
+
+class EventFilter:
+    """Bot/prefetch screening plus windowed de-duplication of tracking events."""
+
+    def __init__(self, window: float, memory_bytes: int, expected_per_window: int):
+        self.seen = RotatingBloom(window, memory_bytes, expected_per_window)
+        self._counts = {kind: {"total": 0, "admitted": 0, "duplicate": 0, "bot": 0, "prefetch": 0} for kind in KINDS}
+
+    def admit(
+        self,
+        kind: str,
+        campaign_id: str,
+        variant_id: str,
+        ip: str,
+        headers: Mapping[str, str],
+        visitor_id: Optional[str] = None,
+        placement: str = "",
+    ) -> bool:
+        """Whether this event should be recorded; counts the reason when it isn't."""
+        counts = self._counts[kind]
+        counts["total"] += 1
+        if BOT_FILTER:
+            if is_prefetch(headers):
+                counts["prefetch"] += 1
+                return False
+            user_agent = headers.get("user-agent", "")
+            if is_bot(user_agent):
+                counts["bot"] += 1
+                return False
+        if DEDUP_ENABLED:
+            if visitor_id:
+                visitor = f"id:{visitor_id}"
+            else:
+                # Shared IPs (carrier NAT, office proxies) make IP + user agent
+                # too coarse on its own; Accept-Language splits it further
+                visitor = f"ipua:{ip}|{headers.get('user-agent', '')}|{headers.get('accept-language', '')}"
+            key = f"{kind}\n{campaign_id}\n{variant_id}\n{placement}\n{visitor}".encode()
+            if self.seen.check_and_add(key):
+                counts["duplicate"] += 1
+                return False
+        counts["admitted"] += 1
+        return True
+
+    def stats(self) -> dict:
+        result: dict = {"bot_filter": BOT_FILTER, "dedup": DEDUP_ENABLED, "bloom": self.seen.stats()}
+        for kind, counts in self._counts.items():
+            total = counts["total"]
+            dropped = total - counts["admitted"]
+            result[kind] = {**counts, "drop_rate": round(dropped / total, 4) if total else 0.0}
+        return result
+
+
+event_filter = EventFilter(DEDUP_WINDOW, DEDUP_MEMORY_BYTES, DEDUP_EXPECTED_EVENTS)
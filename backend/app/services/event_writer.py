@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import uuid
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+from app.config import (
+    EVENT_BATCH_SIZE,
+    EVENT_DRAIN_TIMEOUT,
+    EVENT_ENQUEUE_TIMEOUT,
+    EVENT_FLUSH_INTERVAL,
+    EVENT_MAX_RETRIES,
+    EVENT_QUEUE_MAX,
+    EVENT_WRITER_WORKERS,
+    SPOOL_DIR,
+)
+from app.services import db, signal_codec
+from app.services.spool import Spool
+
+# Buffered bulk inserts for tracking events.
+#
+# Request handlers enqueue rows and return; a few worker tasks drain the
+# queue into multi-row PostgREST inserts, flushing when a batch is full or
+# EVENT_FLUSH_INTERVAL has passed since its first row. The queue is bounded:
+# offer() drops (and counts) when it is full, put() waits up to a timeout
+# first so callers that can afford it feel the backpressure. Failed batches
+# are retried with exponential backoff; a batch the database rejects outright
+# (4xx) is split in halves so one bad row doesn't take the others down.
+#
+# With a spool (SPOOL_DIR), nothing is dropped while the database is down:
+# batches that exhaust their retries, rows that find the queue full and rows
+# still queued at shutdown go to the local spool, which replays them once
+# the database answers again. Every row gets an event id when it is queued
+# and inserts skip ids already present, so retries and replays never double
+# count.
+#
+# An `encode` hook turns queued rows into their stored form right before the
+# insert (impressions: the compact signal columns). Queued and spooled rows
+# stay in the raw form; an encode that fails is retried, or split, like an insert.
+
+RETRY_BACKOFF = 0.5
+
+# Client errors that are about the request's timing, not its rows
+RETRYABLE_4XX = frozenset({408, 425, 429})
+
+
+class BatchWriter:
+    """Bounded async queue of rows for one table, written in batches."""
+
+    def __init__(
+        self,
+        table: str,
+        batch_size: int = EVENT_BATCH_SIZE,
+        flush_interval: float = EVENT_FLUSH_INTERVAL,
+        max_queue: int = EVENT_QUEUE_MAX,
+        max_retries: int = EVENT_MAX_RETRIES,
+        workers: int = EVENT_WRITER_WORKERS,
+        spool: Optional[Spool] = None,
+        encode: Optional[Callable[[list[dict]], Awaitable[list[dict]]]] = None,
+    ):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.workers = workers
+        self.spool = spool
+        self.encode = encode
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.batched_rows = 0
+        self.last_batch_size = 0
+        self.retries = 0
+        self.dropped_full = 0
+        self.dropped_failed = 0
+        self.spilled = 0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        return self._queue
+
+    def _spill(self, rows: list[dict]) -> int:
+        """Hand rows to the spool; returns how many it took."""
+        taken = self.spool.append(self.table, rows) if self.spool is not None else 0
+        self.spilled += taken
+        return taken
+
+    def offer(self, row: dict) -> bool:
+        """Enqueue without waiting; when full, spool or (returning False) count a drop."""
+        row.setdefault("id", str(uuid.uuid4()))
+        try:
+            self._get_queue().put_nowait(row)
+        except asyncio.QueueFull:
+            if self._spill([row]):
+                return True
+            self.dropped_full += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def put(self, row: dict, timeout: float = EVENT_ENQUEUE_TIMEOUT) -> bool:
+        """Enqueue, waiting up to `timeout` for room before spooling; False if the row was dropped."""
+        row.setdefault("id", str(uuid.uuid4()))
+        queue = self._get_queue()
+        try:
+            queue.put_nowait(row)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(queue.put(row), timeout)
+            except asyncio.TimeoutError:
+                if self._spill([row]):
+                    return True
+                self.dropped_full += 1
+                return False
+        self.enqueued += 1
+        return True
+
+    async def _next_batch(self, queue: asyncio.Queue) -> list[dict]:
+        batch = [await queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        try:
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            self._give_up(batch)
+            for _ in batch:
+                queue.task_done()
+            raise
+        return batch
+
+    async def _write(self, rows: list[dict], retries: int) -> list[dict]:
+        """Insert rows, returning those the database couldn't take (empty when all are settled).
+
+        Rows it rejects outright count as dropped_failed and are not returned.
+        """
+        for attempt in range(retries + 1):
+            try:
+                payload = await self.encode(rows) if self.encode is not None else rows
+                await db.insert(self.table, payload, on_conflict="id")
+            except httpx.HTTPStatusError as e:
+                # A 4xx from the insert or the encode step's requests means some
+                # row is bad: split until it's isolated, so it can't hold back the
+                # rest (or, replayed from the spool, every later segment)
+                status = e.response.status_code
+                if status < 500 and status not in RETRYABLE_4XX:
+                    return await self._reject(rows, retries)
+            except (httpx.HTTPError, OSError):
+                pass
+            except Exception:
+                # Anything else (e.g. a value the encoder or JSON can't take) is
+                # about the rows' content, so it is isolated the same way
+                return await self._reject(rows, retries)
+            else:
+                self.written += len(rows)
+                return []
+            if attempt < retries:
+                self.retries += 1
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        return rows
+
+    async def _reject(self, rows: list[dict], retries: int) -> list[dict]:
+        """Split a rejected batch and write the halves; a single rejected row is dropped."""
+        if len(rows) > 1:
+            mid = len(rows) // 2
+            return await self._write(rows[:mid], retries) + await self._write(rows[mid:], retries)
+        self.dropped_failed += 1
+        return []
+
+    def _give_up(self, rows: list[dict]) -> None:
+        self.dropped_failed += len(rows) - self._spill(rows)
+
+    async def deliver(self, rows: list[dict]) -> bool:
+        """Single-attempt write for spool replay; False while the database is unavailable."""
+        return not await self._write(rows, retries=0)
+
+    async def _run(self) -> None:
+        queue = self._get_queue()
+        while True:
+            batch = await self._next_batch(queue)
+            self.batches += 1
+            self.batched_rows += len(batch)
+            self.last_batch_size = len(batch)
+            try:
+                self._give_up(await self._write(batch, self.max_retries))
+            except asyncio.CancelledError:
+                self._give_up(batch)  # stopped mid-write: keep the rows
+                raise
+            except Exception:
+                self._give_up(batch)  # unexpected: keep the worker alive
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = EVENT_DRAIN_TIMEOUT) -> None:
+        """Drain what is queued (up to `timeout`), then stop the workers."""
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None:
+            left = []
+            while not self._queue.empty():
+                left.append(self._queue.get_nowait())
+                self._queue.task_done()
+            if left:
+                self._give_up(left)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_rows / self.batches, 1) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "retries": self.retries,
+            "dropped_full": self.dropped_full,
+            "dropped_failed": self.dropped_failed,
+            "spilled": self.spilled,
+        }
+
+
+spool = Spool(SPOOL_DIR) if SPOOL_DIR else None
+
+impression_writer = BatchWriter("impressions", spool=spool, encode=signal_codec.encode_rows)
+click_writer = BatchWriter("clicks", spool=spool)
+
+_writers = {w.table: w for w in (impression_writer, click_writer)}
+
+
+async def _replay_into(table: str, rows: list[dict]) -> bool:
+    writer = _writers.get(table)
+    return await writer.deliver(rows) if writer is not None else True
+
+
+async def startup() -> None:
+    for writer in _writers.values():
+        writer.start()
+    if spool is not None:
+        spool.start(_replay_into, EVENT_BATCH_SIZE)
+
+
+async def shutdown() -> None:
+    await asyncio.gather(*(writer.stop() for writer in _writers.values()))
+    if spool is not None:
+        await spool.stop()
+
+
+def stats() -> dict:
+    result = {"impressions": impression_writer.stats(), "clicks": click_writer.stats()}
+    if spool is not None:
+        result["spool"] = spool.stats()
+    return result
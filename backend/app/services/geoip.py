@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import csv
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_right
+from typing import Optional
+
+# Local IPv4 geolocation from an IP-range table.
+#
+# A CSV of ranges (start_ip,end_ip,country,region,city,lat,lon,timezone) is
+# compiled into a flat binary file of sorted uint32 arrays and memory-mapped
+# read-only, so every worker on a host shares the same page-cache copy and a
+# lookup is a bisect over the mapped starts array.
+#
+# File layout (little-endian):
+#   header    MAGIC, n_ranges, n_locations, n_strings, blob_len
+#   starts    n_ranges   x uint32   (sorted)
+#   ends      n_ranges   x uint32
+#   loc_idx   n_ranges   x uint32
+#   loc_str   n_locations x 4 x uint32  (country, region, city, timezone string ids)
+#   loc_pos   n_locations x 2 x float32 (lat, lon)
+#   str_off   n_strings + 1 x uint32
+#   blob      utf-8 string data
+
+MAGIC = b"DCOGEO01"
+_HEADER = struct.Struct("<8sIIII")
+
+_db: Optional["GeoIPDatabase"] = None
+_stats = {"lookups": 0, "hits": 0, "misses": 0}
+
+
+def _ip_to_int(value: str) -> int:
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(ipaddress.IPv4Address(value))
+
+
+def build(csv_path: str, out_path: str) -> int:
+    """Compile a CSV range table into the binary format. Returns the range count."""
+    strings: dict[str, int] = {}
+    locations: dict[tuple, int] = {}
+    ranges: list[tuple[int, int, int]] = []
+
+    def intern(s: str) -> int:
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#") or row[0] == "start_ip":
+                continue
+            start, end, country, region, city, lat, lon, tz = (row + [""] * 8)[:8]
+            loc = (
+                intern(country), intern(region), intern(city), intern(tz),
+                float(lat or 0), float(lon or 0),
+            )
+            if loc not in locations:
+                locations[loc] = len(locations)
+            ranges.append((_ip_to_int(start), _ip_to_int(end), locations[loc]))
+
+    ranges.sort()
+    blob = bytearray()
+    offsets = [0]
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+
+    n, m = len(ranges), len(locations)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)))
+    with os.fdopen(fd, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, n, m, len(strings), len(blob)))
+        for col in range(3):
+            out.write(array("I", (r[col] for r in ranges)).tobytes())
+        out.write(array("I", (i for loc in locations for i in loc[:4])).tobytes())
+        out.write(array("f", (x for loc in locations for x in loc[4:])).tobytes())
+        out.write(array("I", offsets).tobytes())
+        out.write(blob)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, out_path)
+    return n
+
+
+class GeoIPDatabase:
+    """Read-only, memory-mapped view over a compiled range table."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, m, n_str, blob_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled GeoIP database")
+        if sys.byteorder != "little":
+            raise ValueError("GeoIP database requires a little-endian host")
+
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+
+        def take(count: int, fmt: str, size: int) -> memoryview:
+            nonlocal pos
+            part = view[pos:pos + count * size].cast(fmt)
+            pos += count * size
+            return part
+
+        self.size = n
+        self._starts = take(n, "I", 4)
+        self._ends = take(n, "I", 4)
+        self._loc_idx = take(n, "I", 4)
+        self._loc_str = take(m * 4, "I", 4)
+        self._loc_pos = take(m * 2, "f", 4)
+        self._str_off = take(n_str + 1, "I", 4)
+        self._blob = view[pos:pos + blob_len]
+
+    def _string(self, i: int) -> str:
+        return bytes(self._blob[self._str_off[i]:self._str_off[i + 1]]).decode("utf-8")
+
+    def lookup(self, ip: str) -> Optional[dict]:
+        try:
+            n = int.from_bytes(socket.inet_aton(ip), "big")
+        except OSError:
+            return None  # IPv6 or malformed
+        i = bisect_right(self._starts, n) - 1
+        if i < 0 or n > self._ends[i]:
+            return None
+        loc = self._loc_idx[i]
+        country, region, city, tz = self._loc_str[loc * 4:loc * 4 + 4]
+        return {
+            "geo_country": self._string(country),
+            "geo_region": self._string(region),
+            "geo_city": self._string(city),
+            "geo_lat": round(self._loc_pos[loc * 2], 4),
+            "geo_lon": round(self._loc_pos[loc * 2 + 1], 4),
+            "geo_timezone": self._string(tz),
+        }
+
+
+def load(path: str) -> GeoIPDatabase:
+    """Load a compiled database, compiling `path` first when it is a CSV."""
+    global _db
+    if path.endswith(".csv"):
+        compiled = path[:-4] + ".bin"
+        if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+            build(path, compiled)
+        path = compiled
+    _db = GeoIPDatabase(path)
+    return _db
+
+
+def is_loaded() -> bool:
+    return _db is not None
+
+
+def lookup(ip: str) -> Optional[dict]:
+    if _db is None:
+        return None
+    _stats["lookups"] += 1
+    result = _db.lookup(ip)
+    _stats["hits" if result else "misses"] += 1
+    return result
+
+
+def stats() -> dict:
+    return {"loaded": _db is not None, "ranges": _db.size if _db else 0, **_stats}
+
+
+if __name__ == "__main__":
+    # python -m app.services.geoip build ranges.csv ranges.bin
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        print("usage: python -m app.services.geoip build <ranges.csv> <out.bin>")
+        sys.exit(1)
+    print(f"{build(sys.argv[2], sys.argv[3])} ranges written to {sys.argv[3]}")
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import AsyncIterator, Iterable, Optional
+
+import numpy as np
+
+from app.services import db, signal_codec
+from app.services.decisioning import (
+    BANDIT_MODE,
+    RULE_MODES,
+    STICKY_MODES,
+    WEIGHTED_MODES,
+    CompiledRule,
+    _get_default_variant,
+    _parse_number,
+    _weights,
+    compile_rules,
+)
+
+# What-if replay of decisioning over historical impressions.
+#
+# Impressions are read page by page. Each page's signals are encoded column-
+# wise: per signal, a dictionary of distinct values plus an int code per row.
+# A rule is evaluated once per distinct value (numeric comparisons as numpy
+# ops over the distinct numbers) and broadcast to rows through the codes, so
+# the per-row work is numpy indexing. Rules are applied in priority order
+# and the first match wins, exactly as select_variant does.
+#
+# Rows no rule matches go to the mode's fallback. `rules`/`off` fall back to
+# the default variant, which is deterministic. Weighted and sticky fallbacks
+# are predicted as the expected split by weight. Bandit fallbacks depend on
+# live counters and are reported as undetermined.
+
+# PostgREST caps responses at 1000 rows (max-rows); a larger page would come back short
+PAGE_SIZE = 1000
+PAGE_TIMEOUT = 30.0
+
+NO_MATCH = -1
+
+# Modes whose no-match fallback is not the default variant
+FALLBACK_MODES = WEIGHTED_MODES + STICKY_MODES + (BANDIT_MODE,)
+
+
+class SignalColumns:
+    """One page of impression signals, dictionary-encoded per signal key."""
+
+    def __init__(self, signal_rows: list[dict], keys: Iterable[str]):
+        self.size = len(signal_rows)
+        self.codes: dict[str, np.ndarray] = {}
+        self.present: dict[str, np.ndarray] = {}
+        self.texts: dict[str, np.ndarray] = {}
+        self.numbers: dict[str, np.ndarray] = {}
+        for key in keys:
+            self._encode(key, [row.get(key) for row in signal_rows])
+
+    def _encode(self, key: str, values: list) -> None:
+        # Booleans lowercase to "true"/"false" but parse as numbers 1/0, so
+        # they are kept apart from the strings with the same text
+        index: dict[tuple[str, bool], int] = {}
+        texts: list[str] = []
+        numbers: list[float] = []
+        codes = np.empty(len(values), dtype=np.int32)
+        present = np.empty(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            present[i] = value is not None
+            text = str(value).lower() if value is not None else ""
+            ident = (text, isinstance(value, bool))
+            code = index.get(ident)
+            if code is None:
+                code = index[ident] = len(texts)
+                texts.append(text)
+                number = _parse_number(value) if value is not None else None
+                numbers.append(np.nan if number is None else number)
+            codes[i] = code
+        self.codes[key] = codes
+        self.present[key] = present
+        self.texts[key] = np.array(texts, dtype=object)
+        self.numbers[key] = np.array(numbers, dtype=np.float64)
+
+    def rule_mask(self, rule: CompiledRule) -> np.ndarray:
+        """Rows matched by `rule`, evaluated once per distinct signal value."""
+        key = rule.signal
+        texts, numbers = self.texts[key], self.numbers[key]
+        op = rule.operator
+        if op == "eq":
+            distinct = texts == rule.text
+        elif op == "ne":
+            distinct = texts != rule.text
+        elif op == "in":
+            distinct = np.fromiter((t in rule.options for t in texts), dtype=bool, count=len(texts))
+        elif op == "contains":
+            distinct = np.fromiter((rule.text in t for t in texts), dtype=bool, count=len(texts))
+        else:
+            # NaN (missing or non-numeric) compares false, like the n-is-None guard
+            with np.errstate(invalid="ignore"):
+                if op == "gt":
+                    distinct = numbers > rule.number
+                elif op == "lt":
+                    distinct = numbers < rule.number
+                elif op == "gte":
+                    distinct = numbers >= rule.number
+                else:
+                    distinct = numbers <= rule.number
+        return distinct.astype(bool)[self.codes[key]] & self.present[key]
+
+
+class ReplayPlan:
+    """A campaign with a (possibly proposed) rule set, prepared for replay."""
+
+    def __init__(self, campaign: dict, rules: list[dict], mode: str):
+        self.mode = mode
+        self.variants = list(campaign.get("variants", []))
+        self.variant_ids = [v["id"] for v in self.variants]
+        self.index = {vid: i for i, vid in enumerate(self.variant_ids)}
+        self.rules = compile_rules(self.variants, rules) if mode in RULE_MODES else ()
+        self.rule_variant = np.array([self.index[r.variant["id"]] for r in self.rules], dtype=np.int32)
+        self.signal_keys = sorted({r.signal for r in self.rules if r.signal})
+        default = _get_default_variant(self.variants)
+        self.default = self.index[default["id"]] if default else NO_MATCH
+
+        # Expected split for rows that fall through to a random or hashed choice
+        self.fallback_split: Optional[np.ndarray] = None
+        if mode in WEIGHTED_MODES or mode in STICKY_MODES:
+            weights = np.array(_weights(self.variants), dtype=np.float64)
+            total = weights.sum()
+            if total > 0:
+                self.fallback_split = weights / total
+            else:
+                self.fallback_split = np.zeros(len(self.variants))
+                self.fallback_split[0] = 1.0
+
+    def decide(self, columns: SignalColumns) -> tuple[np.ndarray, np.ndarray]:
+        """Per row: the variant index picked by rules or default (-1 if none), and the matching rule (-1 if none)."""
+        chosen = np.full(columns.size, NO_MATCH, dtype=np.int32)
+        matched_rule = np.full(columns.size, NO_MATCH, dtype=np.int32)
+        for r, rule in enumerate(self.rules):
+            undecided = matched_rule == NO_MATCH
+            if not undecided.any():
+                break
+            hit = columns.rule_mask(rule) & undecided
+            matched_rule[hit] = r
+            chosen[hit] = self.rule_variant[r]
+        if self.mode not in FALLBACK_MODES:
+            chosen[chosen == NO_MATCH] = self.default
+        return chosen, matched_rule
+
+
+class ReplayTotals:
+    """Running predicted-vs-actual tallies across pages."""
+
+    def __init__(self, plan: ReplayPlan):
+        self.plan = plan
+        n = len(plan.variant_ids)
+        self.rows = 0
+        self.predicted = np.zeros(n, dtype=np.float64)
+        self.actual: Counter = Counter()
+        self.rule_hits = np.zeros(len(plan.rules), dtype=np.int64)
+        self.decided = 0
+        self.changed = 0
+        self.undetermined = 0
+
+    def add(self, chosen: np.ndarray, matched_rule: np.ndarray, served: list) -> dict:
+        plan = self.plan
+        n = len(plan.variant_ids)
+        decided = chosen != NO_MATCH
+        predicted = np.bincount(chosen[decided], minlength=n).astype(np.float64)
+        fallback = int((~decided).sum())
+        undetermined = 0
+        if fallback:
+            if plan.fallback_split is not None:
+                predicted += fallback * plan.fallback_split
+            else:
+                undetermined = fallback
+
+        served_idx = np.fromiter((plan.index.get(v, NO_MATCH) for v in served), dtype=np.int32, count=len(served))
+        changed = int((decided & (chosen != served_idx)).sum())
+        actual = Counter(v or "unknown" for v in served)
+
+        self.rows += len(served)
+        self.predicted += predicted
+        self.actual.update(actual)
+        self.rule_hits += np.bincount(matched_rule[matched_rule != NO_MATCH], minlength=len(plan.rules))
+        self.decided += int(decided.sum())
+        self.changed += changed
+        self.undetermined += undetermined
+        return {
+            "type": "page",
+            "rows": len(served),
+            "predicted": self._distribution(predicted),
+            "actual": dict(actual),
+            "changed": changed,
+            "undetermined": undetermined,
+        }
+
+    def _distribution(self, counts: np.ndarray) -> dict:
+        return {vid: round(float(c), 2) for vid, c in zip(self.plan.variant_ids, counts) if c}
+
+    def summary(self) -> dict:
+        plan = self.plan
+        variants = []
+        ids = list(plan.variant_ids) + sorted(set(self.actual) - set(plan.variant_ids))
+        for vid in ids:
+            i = plan.index.get(vid)
+            predicted = float(self.predicted[i]) if i is not None else 0.0
+            actual = self.actual.get(vid, 0)
+            variants.append({
+                "variant_id": vid,
+                "predicted": round(predicted, 2),
+                "actual": actual,
+                "delta": round(predicted - actual, 2),
+                "predicted_share": round(predicted / self.rows, 4) if self.rows else 0.0,
+                "actual_share": round(actual / self.rows, 4) if self.rows else 0.0,
+            })
+        return {
+            "type": "summary",
+            "mode": plan.mode,
+            "rows": self.rows,
+            "rules": len(plan.rules),
+            "decided": self.decided,
+            "changed": self.changed,
+            "undetermined": self.undetermined,
+            "variants": variants,
+            "rule_hits": [
+                {"rule_id": rule.rule_id, "variant_id": rule.variant["id"], "hits": int(hits)}
+                for rule, hits in zip(plan.rules, self.rule_hits)
+            ],
+        }
+
+
+async def replay(plan: ReplayPlan, campaign_id: str, since: str, limit: int) -> AsyncIterator[dict]:
+    """Replay `plan` over the campaign's impressions since `since`, one result per page, then a summary."""
+    totals = ReplayTotals(plan)
+    last: Optional[dict] = None
+    remaining = limit
+    # Newest first, keyset-paged on (created_at, id)
+    while remaining > 0:
+        filters = {"campaign_id": db.eq(campaign_id), "created_at": db.gte(since)}
+        if last is not None:
+            filters["or"] = (
+                f'(created_at.lt."{last["created_at"]}",'
+                f'and(created_at.eq."{last["created_at"]}",id.lt.{last["id"]}))'
+            )
+        page = await db.select(
+            "impressions",
+            f"id, created_at, variant_id, {signal_codec.COLUMNS}",
+            filters,
+            order="created_at.desc,id.desc",
+            limit=min(PAGE_SIZE, remaining),
+            timeout=PAGE_TIMEOUT,
+        )
+        if not page:
+            break
+        columns = SignalColumns(await signal_codec.decode_rows(page), plan.signal_keys)
+        chosen, matched_rule = plan.decide(columns)
+        yield totals.add(chosen, matched_rule, [row.get("variant_id") for row in page])
+        last = page[-1]
+        remaining -= len(page)
+    yield totals.summary()
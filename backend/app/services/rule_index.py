@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Optional
+
+from app.services.decisioning import CompiledRule, _parse_number
+
+# Indexed matcher for campaigns with many rules.
+#
+# Rules arrive compiled and in priority order; a rule's position ("rank") is
+# its precedence, lower wins. Per signal, each operator family gets a
+# structure that answers "best-ranked rule matching this value" without
+# scanning the rules:
+#   eq / in            hash of value -> best rank
+#   gt / gte / lt / lte sorted thresholds with prefix/suffix best ranks
+#   contains           Aho-Corasick automaton over the patterns
+#   ne                 rank-ordered list; first entry whose value differs
+# The overall answer is the best rank across all signals present.
+
+_NONE = 1 << 62
+
+# Below this many patterns a plain substring scan beats the automaton
+AHO_CORASICK_MIN_PATTERNS = 16
+
+
+class _Thresholds:
+    """Sorted thresholds answering the best rank among rules satisfied by n."""
+
+    __slots__ = ("values", "prefix_best", "suffix_best")
+
+    def __init__(self, entries: list[tuple[float, int]]):
+        entries.sort()
+        self.values = [t for t, _ in entries]
+        self.prefix_best = []
+        best = _NONE
+        for _, rank in entries:
+            best = min(best, rank)
+            self.prefix_best.append(best)
+        self.suffix_best = [_NONE] * (len(entries) + 1)
+        for i in range(len(entries) - 1, -1, -1):
+            self.suffix_best[i] = min(self.suffix_best[i + 1], entries[i][1])
+
+    def below(self, idx: int) -> int:
+        """Best rank among values[:idx]."""
+        return self.prefix_best[idx - 1] if idx > 0 else _NONE
+
+    def from_(self, idx: int) -> int:
+        """Best rank among values[idx:]."""
+        return self.suffix_best[idx]
+
+
+class _Automaton:
+    """Aho-Corasick automaton returning the best rank of any pattern found in a text.
+
+    Failure links are folded into the transition table at build time, so a
+    search is one dict lookup per character.
+    """
+
+    __slots__ = ("delta", "best")
+
+    def __init__(self, patterns: list[tuple[str, int]]):
+        goto: list[dict[str, int]] = [{}]
+        best = [_NONE]
+        for pattern, rank in patterns:
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    best.append(_NONE)
+                node = nxt
+            best[node] = min(best[node], rank)
+
+        # Breadth-first, so a node's failure target is complete before the node
+        fail = [0] * len(goto)
+        delta: list[dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            delta[node] = {**delta[fail[node]], **goto[node]}
+            for ch, child in goto[node].items():
+                fail[child] = delta[fail[node]].get(ch, 0) if node else 0
+                best[child] = min(best[child], best[fail[child]])
+                queue.append(child)
+        self.delta = delta
+        self.best = best
+
+    def search(self, text: str) -> int:
+        delta, best = self.delta, self.best
+        node = 0
+        result = best[0]
+        for ch in text:
+            node = delta[node].get(ch, 0)
+            if best[node] < result:
+                result = best[node]
+        return result
+
+
+class _SignalIndex:
+    __slots__ = (
+        "exact", "ne", "contains", "contains_scan", "contains_best",
+        "gt", "gte", "lt", "lte", "numeric_best",
+    )
+
+    def __init__(self, rules: list[tuple[int, CompiledRule]]):
+        self.exact: dict[str, int] = {}
+        ne: list[tuple[int, str]] = []
+        contains: list[tuple[str, int]] = []
+        numeric: dict[str, list[tuple[float, int]]] = {"gt": [], "gte": [], "lt": [], "lte": []}
+
+        for rank, rule in rules:
+            op = rule.operator
+            if op == "eq":
+                self.exact.setdefault(rule.text, rank)
+            elif op == "in":
+                for option in rule.options or ():
+                    self.exact.setdefault(option, rank)
+            elif op == "ne":
+                ne.append((rank, rule.text))
+            elif op == "contains":
+                contains.append((rule.text, rank))
+            else:
+                numeric[op].append((rule.number, rank))  # type: ignore[arg-type]
+
+        self.ne = ne
+        self.contains: Optional[_Automaton] = None
+        self.contains_scan: list[tuple[int, str]] = []
+        if len(contains) >= AHO_CORASICK_MIN_PATTERNS:
+            self.contains = _Automaton(contains)
+        else:
+            self.contains_scan = sorted((rank, text) for text, rank in contains)
+        self.contains_best = min((rank for _, rank in contains), default=_NONE)
+        self.gt = _Thresholds(numeric["gt"]) if numeric["gt"] else None
+        self.gte = _Thresholds(numeric["gte"]) if numeric["gte"] else None
+        self.lt = _Thresholds(numeric["lt"]) if numeric["lt"] else None
+        self.lte = _Thresholds(numeric["lte"]) if numeric["lte"] else None
+        self.numeric_best = min((rank for entries in numeric.values() for _, rank in entries), default=_NONE)
+
+    def best(self, value: object, best: int) -> int:
+        """Best rank below `best` among rules matching value, else `best`.
+
+        Structures whose best rule cannot beat the current bound are skipped,
+        including the number parse when no numeric rule could win.
+        """
+        s = str(value).lower()
+        rank = self.exact.get(s, _NONE)
+        if rank < best:
+            best = rank
+
+        for rank, text in self.ne:
+            if rank >= best:
+                break
+            if s != text:
+                best = rank
+                break
+
+        if self.contains_best < best:
+            if self.contains is not None:
+                best = min(best, self.contains.search(s))
+            else:
+                for rank, text in self.contains_scan:
+                    if rank >= best:
+                        break
+                    if text in s:
+                        best = rank
+                        break
+
+        if self.numeric_best < best:
+            n = _parse_number(value)
+            if n is not None and n == n:
+                if self.gt is not None:  # threshold < n
+                    best = min(best, self.gt.below(bisect_left(self.gt.values, n)))
+                if self.gte is not None:  # threshold <= n
+                    best = min(best, self.gte.below(bisect_right(self.gte.values, n)))
+                if self.lt is not None:  # threshold > n
+                    best = min(best, self.lt.from_(bisect_right(self.lt.values, n)))
+                if self.lte is not None:  # threshold >= n
+                    best = min(best, self.lte.from_(bisect_left(self.lte.values, n)))
+        return best
+
+
+class RuleIndex:
+    """Highest-priority matching rule in time independent of the rule count."""
+
+    __slots__ = ("rules", "signals")
+
+    def __init__(self, rules: tuple[CompiledRule, ...]):
+        self.rules = rules
+        by_signal: dict[str, list[tuple[int, CompiledRule]]] = {}
+        for rank, rule in enumerate(rules):
+            by_signal.setdefault(rule.signal, []).append((rank, rule))
+        # Signals holding the highest-priority rules go first so the bound tightens early
+        self.signals = [
+            (entries[0][0], key, _SignalIndex(entries))
+            for key, entries in sorted(by_signal.items(), key=lambda item: item[1][0][0])
+        ]
+
+    def match(self, signals: dict) -> Optional[dict]:
+        best = _NONE
+        for first_rank, key, index in self.signals:
+            if first_rank >= best:
+                break
+            actual = signals.get(key)
+            if actual is None:
+                continue
+            best = index.best(actual, best)
+        return self.rules[best].variant if best != _NONE else None
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import math
+from typing import Optional
+
+from app.config import SIGNAL_DICT_CACHE_MAX
+from app.core.cache import TTLCache
+from app.services import db
+
+# Compact storage of impression signals.
+#
+# Instead of the full signals dict as JSONB, impression rows store:
+#   - string signals (user agent, referer, geo names, timezone, weather
+#     condition, daypart) as integer ids into the shared signal_dict table,
+#     interned in bulk when a batch is flushed;
+#   - numeric and boolean signals in typed columns;
+#   - nothing for `ip`, which is already in ip_address.
+# Anything else (e.g. custom keys sent to POST /impression, or a value of
+# an unexpected type) stays in the `signals` JSONB column, which is NULL
+# when empty. decode_rows() rebuilds the original dict, and also handles
+# rows written before this encoding (full JSONB, no ids). Dictionary strings
+# are stored cut to MAX_VALUE_LENGTH and without NUL characters, which
+# Postgres text can't hold.
+#
+# Dictionary ids never change, so both directions are cached per process.
+
+DICT_FIELDS = (
+    "user_agent",
+    "referer",
+    "geo_country",
+    "geo_region",
+    "geo_city",
+    "geo_timezone",
+    "weather_condition",
+    "daypart",
+)
+FLOAT_FIELDS = ("geo_lat", "geo_lon", "weather_temp")
+INT_FIELDS = ("weather_code", "daypart_hour")
+BOOL_FIELDS = ("weather_is_hot", "weather_is_cold", "daypart_is_weekend")
+
+# Numbers outside the typed columns' range stay in JSONB
+FLOAT_MAX = 1.7976931348623157e308
+SMALLINT_MIN, SMALLINT_MAX = -(2 ** 15), 2 ** 15 - 1  # INT_FIELDS are smallint columns
+
+# Restored from their own impression columns on decode
+COLUMN_FIELDS = {"ip": "ip_address"}
+
+# Longer strings are cut before interning (btree keys are capped at ~2.7kB)
+MAX_VALUE_LENGTH = 512
+
+# Columns to select for decode_rows()
+COLUMNS = ", ".join(
+    ("signals", "ip_address")
+    + tuple(f"{f}_id" for f in DICT_FIELDS)
+    + FLOAT_FIELDS
+    + INT_FIELDS
+    + BOOL_FIELDS
+)
+
+# Ids are looked up in chunks to keep the request URL short
+LOOKUP_CHUNK = 200
+
+_ids = TTLCache(86400, SIGNAL_DICT_CACHE_MAX)
+_values = TTLCache(86400, SIGNAL_DICT_CACHE_MAX)
+_counters = {"interned": 0, "intern_calls": 0, "lookup_calls": 0}
+
+
+def _remember(id_: int, value: str) -> None:
+    _ids.set(value, id_)
+    _values.set(id_, value)
+
+
+def _text(value: str) -> str:
+    """The dictionary form of a string signal: cut to length, and storable as Postgres text."""
+    value = value[:MAX_VALUE_LENGTH]
+    if "\x00" in value:
+        value = value.replace("\x00", "")
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:  # lone surrogates
+        value = value.encode("utf-8", "replace").decode("utf-8")
+    return value
+
+
+def _is_number(value) -> bool:
+    """A finite int or float (bools excluded)."""
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, float) and math.isfinite(value))
+
+
+async def _intern(values: set[str]) -> None:
+    missing = [v for v in values if _ids.get(v) is None]
+    if not missing:
+        return
+    _counters["intern_calls"] += 1
+    for row in await db.rpc("intern_signal_values", {"vals": missing}):
+        _remember(row["id"], row["value"])
+    _counters["interned"] += len(missing)
+
+
+def _encode(signals: dict) -> tuple[dict, Optional[dict]]:
+    columns: dict = {}
+    # NaN/Infinity can't be stored (JSONB has no such numbers), so they are dropped
+    rest = {
+        k: v for k, v in signals.items()
+        if k not in COLUMN_FIELDS and not (isinstance(v, float) and not math.isfinite(v))
+    }
+    for field in DICT_FIELDS:
+        value = rest.get(field)
+        if isinstance(value, str):
+            id_ = _ids.get(_text(value))
+            if id_ is not None:
+                columns[f"{field}_id"] = id_
+                del rest[field]
+                continue
+        columns[f"{field}_id"] = None
+    for field in FLOAT_FIELDS:
+        value = rest.get(field)
+        if _is_number(value) and abs(value) <= FLOAT_MAX:
+            columns[field] = float(value)
+            del rest[field]
+        else:
+            columns[field] = None
+    for field in INT_FIELDS:
+        value = rest.get(field)
+        if _is_number(value) and value == int(value) and SMALLINT_MIN <= value <= SMALLINT_MAX:
+            columns[field] = int(value)
+            del rest[field]
+        else:
+            columns[field] = None
+    for field in BOOL_FIELDS:
+        value = rest.get(field)
+        if isinstance(value, bool):
+            columns[field] = value
+            del rest[field]
+        else:
+            columns[field] = None
+    return columns, rest or None
+
+
+async def encode_rows(rows: list[dict]) -> list[dict]:
+    """Impression rows with `signals` replaced by dictionary ids and typed columns (inputs are untouched)."""
+    strings = set()
+    for row in rows:
+        signals = row.get("signals") or {}
+        for field in DICT_FIELDS:
+            value = signals.get(field)
+            if isinstance(value, str):
+                strings.add(_text(value))
+    await _intern(strings)
+
+    encoded = []
+    for row in rows:
+        columns, rest = _encode(row.get("signals") or {})
+        out = {k: v for k, v in row.items() if k != "signals"}
+        out.update(columns)
+        out["signals"] = rest
+        encoded.append(out)
+    return encoded
+
+
+async def _lookup(ids: set[int]) -> None:
+    missing = [i for i in ids if _values.get(i) is None]
+    for start in range(0, len(missing), LOOKUP_CHUNK):
+        _counters["lookup_calls"] += 1
+        chunk = missing[start:start + LOOKUP_CHUNK]
+        for row in await db.select("signal_dict", "id, value", {"id": db.in_(chunk)}):
+            _remember(row["id"], row["value"])
+
+
+async def decode_rows(rows: list[dict]) -> list[dict]:
+    """The signals dict of each impression row (selected with COLUMNS), compact or not."""
+    ids = set()
+    for row in rows:
+        for field in DICT_FIELDS:
+            id_ = row.get(f"{field}_id")
+            if id_ is not None:
+                ids.add(id_)
+    await _lookup(ids)
+
+    decoded = []
+    for row in rows:
+        signals = dict(row.get("signals") or {})
+        for key, column in COLUMN_FIELDS.items():
+            if key not in signals and row.get(column) is not None:
+                signals[key] = row[column]
+        for field in DICT_FIELDS:
+            id_ = row.get(f"{field}_id")
+            if id_ is not None:
+                value = _values.get(id_)
+                if value is not None:
+                    signals[field] = value
+        for field in FLOAT_FIELDS + INT_FIELDS + BOOL_FIELDS:
+            value = row.get(field)
+            if value is not None:
+                signals[field] = value
+        decoded.append(signals)
+    return decoded
+
+
+def stats() -> dict:
+    return {"cached_ids": len(_ids), "cached_values": len(_values), **_counters}
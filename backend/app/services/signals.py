@@ -1,19 +1,62 @@
 from __future__ import annotations
 
+import asyncio
 import time
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import Iterable, Optional
 
 import httpx
 from fastapi import Request
 
-# In-memory caches
-_geo_cache: dict[str, tuple[dict, float]] = {}
-_weather_cache: dict[str, tuple[dict, float]] = {}
+from app.config import (
+    SIGNALS_HTTP_TIMEOUT,
+    SIGNALS_DEADLINE,
+    SIGNALS_MAX_CONNECTIONS,
+    SIGNALS_MAX_KEEPALIVE,
+    GEO_CACHE_MAX_ENTRIES,
+    GEO_CACHE_MAX_BYTES,
+    WEATHER_CACHE_MAX_ENTRIES,
+    WEATHER_CACHE_MAX_BYTES,
+    GEOIP_DB_PATH,
+    GEOIP_REMOTE_FALLBACK,
+    WEATHER_MAX_STALE,
+    WEATHER_REFRESH_INTERVAL,
+    WEATHER_REFRESH_TOP,
+)
+from app.core import timing
+from app.core.cache import TTLCache
+from app.core.singleflight import SingleFlight
+from app.services import geoip
+
+# Shared keep-alive client for the signal providers (created on app startup)
+_http: httpx.AsyncClient | None = None
+
+# Provider fetches that outlived the request deadline; kept referenced so
+# they can finish and warm the caches.
+_background: set[asyncio.Task] = set()
 
 GEO_TTL = 600  # 10 min
 WEATHER_TTL = 300  # 5 min
 
+# In-memory caches. Entries are flat tuples in *_FIELDS order rather than
+# dicts, which keeps a cached IP at a few hundred bytes.
+GEO_FIELDS = ("geo_country", "geo_region", "geo_city", "geo_lat", "geo_lon", "geo_timezone")
+WEATHER_FIELDS = ("weather_temp", "weather_condition", "weather_code", "weather_is_hot", "weather_is_cold")
+
+_geo_cache = TTLCache(GEO_TTL, GEO_CACHE_MAX_ENTRIES, GEO_CACHE_MAX_BYTES)
+_weather_cache = TTLCache(
+    WEATHER_TTL, WEATHER_CACHE_MAX_ENTRIES, WEATHER_CACHE_MAX_BYTES, max_stale=WEATHER_MAX_STALE
+)
+
+# Request counts per weather cell since the last refresher pass: key -> [hits, lat, lon]
+_weather_heat: dict[str, list] = {}
+_weather_refresher: asyncio.Task | None = None
+_weather_refreshes = {"background": 0, "periodic": 0, "errors": 0}
+
+# At most one outbound lookup per IP / weather cell; concurrent misses share it
+_geo_flight = SingleFlight()
+_weather_flight = SingleFlight()
+
 # Circuit breaker state
 _cb_state: dict[str, dict] = {
     "geo": {"failures": 0, "open_until": 0.0},
@@ -44,6 +87,41 @@ def _cb_record_success(service: str):
     _cb_state[service]["failures"] = 0
 
 
+def _get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            timeout=SIGNALS_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SIGNALS_MAX_CONNECTIONS,
+                max_keepalive_connections=SIGNALS_MAX_KEEPALIVE,
+                keepalive_expiry=60,
+            ),
+        )
+    return _http
+
+
+async def startup() -> None:
+    global _weather_refresher
+    _get_http()
+    if GEOIP_DB_PATH:
+        geoip.load(GEOIP_DB_PATH)
+    if WEATHER_REFRESH_INTERVAL > 0:
+        _weather_refresher = asyncio.create_task(_refresh_hot_weather_cells())
+
+
+async def shutdown() -> None:
+    global _http, _weather_refresher
+    if _weather_refresher is not None:
+        _weather_refresher.cancel()
+        _weather_refresher = None
+    for task in list(_background):
+        task.cancel()
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
 def _get_client_ip(request: Request) -> str:
     forwarded = request.headers.get("x-forwarded-for")
     if forwarded:
@@ -52,19 +130,25 @@ def _get_client_ip(request: Request) -> str:
 
 
 async def _fetch_geo(ip: str) -> Optional[dict]:
+    if geoip.is_loaded():
+        local = geoip.lookup(ip)
+        if local is not None or not GEOIP_REMOTE_FALLBACK:
+            return local
+
     if _cb_is_open("geo"):
         return None
 
-    now = time.time()
-    if ip in _geo_cache:
-        cached, ts = _geo_cache[ip]
-        if now - ts < GEO_TTL:
-            return cached
+    cached = _geo_cache.get(ip)
+    if cached is not None:
+        return dict(zip(GEO_FIELDS, cached))
+
+    return await _geo_flight.do(ip, lambda: _request_geo(ip))
 
+
+async def _request_geo(ip: str) -> Optional[dict]:
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(f"http://ip-api.com/json/{ip}")
-            data = resp.json()
+        resp = await _get_http().get(f"http://ip-api.com/json/{ip}")
+        data = resp.json()
         if data.get("status") != "success":
             return None
         result = {
@@ -75,7 +159,7 @@ async def _fetch_geo(ip: str) -> Optional[dict]:
             "geo_lon": data.get("lon"),
             "geo_timezone": data.get("timezone", ""),
         }
-        _geo_cache[ip] = (result, now)
+        _geo_cache.set(ip, tuple(result[f] for f in GEO_FIELDS))
         _cb_record_success("geo")
         return result
     except Exception:
@@ -84,27 +168,72 @@ async def _fetch_geo(ip: str) -> Optional[dict]:
 
 
 async def _fetch_weather(lat: float, lon: float) -> Optional[dict]:
+    cache_key = f"{lat:.2f},{lon:.2f}"
+    _record_weather_heat(cache_key, lat, lon)
+
+    # Stale-while-revalidate: a stale cell is served immediately and refreshed
+    # in the background, up to WEATHER_MAX_STALE past its TTL.
+    hit = _weather_cache.get_stale(cache_key)
+    if hit is not None:
+        cached, stale = hit
+        if stale:
+            _refresh_weather_in_background(lat, lon, cache_key)
+        return dict(zip(WEATHER_FIELDS, cached))
+
     if _cb_is_open("weather"):
         return None
+    return await _weather_flight.do(cache_key, lambda: _request_weather(lat, lon, cache_key))
 
-    cache_key = f"{lat:.2f},{lon:.2f}"
-    now = time.time()
-    if cache_key in _weather_cache:
-        cached, ts = _weather_cache[cache_key]
-        if now - ts < WEATHER_TTL:
-            return cached
 
+def _record_weather_heat(cache_key: str, lat: float, lon: float) -> None:
+    heat = _weather_heat.get(cache_key)
+    if heat is None:
+        if len(_weather_heat) >= WEATHER_CACHE_MAX_ENTRIES:
+            return
+        _weather_heat[cache_key] = [1, lat, lon]
+    else:
+        heat[0] += 1
+
+
+def _refresh_weather_in_background(lat: float, lon: float, cache_key: str, reason: str = "background") -> None:
+    if _cb_is_open("weather") or cache_key in _weather_flight:
+        return
+    _weather_refreshes[reason] += 1
+    task = asyncio.ensure_future(
+        _weather_flight.do(cache_key, lambda: _request_weather(lat, lon, cache_key))
+    )
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _refresh_hot_weather_cells() -> None:
+    """Keep the most requested weather cells warm so they never go stale on a request."""
+    while True:
+        await asyncio.sleep(WEATHER_REFRESH_INTERVAL)
+        hottest = sorted(_weather_heat.items(), key=lambda kv: kv[1][0], reverse=True)
+        _weather_heat.clear()
+        for cache_key, (_, lat, lon) in hottest[:WEATHER_REFRESH_TOP]:
+            try:
+                age = _weather_cache.age(cache_key)
+                # Refresh cells that would expire before the next pass
+                if age is None or age >= WEATHER_TTL - WEATHER_REFRESH_INTERVAL:
+                    _refresh_weather_in_background(lat, lon, cache_key, reason="periodic")
+            except Exception:
+                # One bad cell must not stop the refresher for all the others
+                _weather_refreshes["errors"] += 1
+
+
+async def _request_weather(lat: float, lon: float, cache_key: str) -> Optional[dict]:
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params={
-                    "latitude": lat,
-                    "longitude": lon,
-                    "current_weather": "true",
-                },
-            )
-            data = resp.json()
+        resp = await _get_http().get(
+            "https://api.open-meteo.com/v1/forecast",
+            params={
+                "latitude": lat,
+                "longitude": lon,
+                "current_weather": "true",
+            },
+        )
+        data = resp.json()
         cw = data.get("current_weather", {})
         temp = cw.get("temperature", 0)
         wmo = cw.get("weathercode", 0)
@@ -132,7 +261,7 @@ async def _fetch_weather(lat: float, lon: float) -> Optional[dict]:
             "weather_is_hot": temp >= 30,
             "weather_is_cold": temp <= 5,
         }
-        _weather_cache[cache_key] = (result, now)
+        _weather_cache.set(cache_key, tuple(result[f] for f in WEATHER_FIELDS))
         _cb_record_success("weather")
         return result
     except Exception:
@@ -140,6 +269,16 @@ async def _fetch_weather(lat: float, lon: float) -> Optional[dict]:
         return None
 
 
+def stats() -> dict:
+    return {
+        "geo_cache": _geo_cache.stats(),
+        "weather_cache": _weather_cache.stats(),
+        "geo_singleflight": _geo_flight.stats(),
+        "weather_singleflight": _weather_flight.stats(),
+        "weather_refreshes": dict(_weather_refreshes),
+    }
+
+
 def _compute_daypart(tz_name: str = "") -> dict:
     now = datetime.now(timezone.utc)
     hour = now.hour
@@ -167,8 +306,64 @@ def _compute_daypart(tz_name: str = "") -> dict:
     }
 
 
-async def collect_signals(request: Request) -> dict:
-    """Collect all available signals from the request context."""
+# Signal providers beyond the request headers, keyed by the signal prefix they fill
+ALL_PROVIDERS = frozenset({"geo", "weather", "daypart"})
+
+
+def providers_for(signal_keys: Iterable[str]) -> frozenset[str]:
+    """Providers needed to fill the given signal keys (weather implies geo)."""
+    needed = set()
+    for key in signal_keys:
+        if key.startswith("weather_"):
+            needed.update(("geo", "weather"))
+        elif key.startswith("geo_"):
+            needed.add("geo")
+        elif key.startswith("daypart"):
+            needed.add("daypart")
+    return frozenset(needed)
+
+
+async def _geo(ip: str) -> dict:
+    with timing.timed("geo"):
+        return await _fetch_geo(ip) or {}
+
+
+async def _weather(lat: float, lon: float) -> dict:
+    with timing.timed("weather"):
+        return await _fetch_weather(lat, lon) or {}
+
+
+async def _within(coro, timeout: float) -> dict:
+    """Await a provider for up to `timeout` seconds; {} if it fails or runs late.
+
+    A late provider is not cancelled: it keeps running in the background so
+    its result lands in the caches for the next request.
+    """
+    task = asyncio.ensure_future(coro)
+    done, _ = await asyncio.wait((task,), timeout=timeout)
+    if not done:
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        return {}
+    if task.cancelled() or task.exception() is not None:
+        return {}
+    return task.result()
+
+
+async def collect_signals(
+    request: Request,
+    providers: Optional[frozenset[str]] = None,
+    report: Optional[dict] = None,
+) -> dict:
+    """Collect signals from the request context.
+
+    Only the given providers run (all of them when None); pass `report` to
+    get back which providers were invoked and which were skipped.
+    """
+    if providers is None:
+        providers = ALL_PROVIDERS
+    elif "weather" in providers:
+        providers = providers | {"geo"}
     signals: dict = {}
 
     ip = _get_client_ip(request)
@@ -176,19 +371,22 @@ async def collect_signals(request: Request) -> dict:
     signals["user_agent"] = request.headers.get("user-agent", "")
     signals["referer"] = request.headers.get("referer", "")
 
-    # Geo
-    geo = await _fetch_geo(ip)
-    if geo:
-        signals.update(geo)
-
-    # Weather (requires geo lat/lon)
-    if geo and geo.get("geo_lat") and geo.get("geo_lon"):
-        weather = await _fetch_weather(geo["geo_lat"], geo["geo_lon"])
-        if weather:
-            signals.update(weather)
+    # Remote providers run one after the other (weather needs geo's lat/lon)
+    # under one shared SIGNALS_DEADLINE; a late weather fetch only loses weather.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SIGNALS_DEADLINE
+    if "geo" in providers:
+        signals.update(await _within(_geo(ip), SIGNALS_DEADLINE))
+    if "weather" in providers and signals.get("geo_lat") and signals.get("geo_lon"):
+        remaining = max(deadline - loop.time(), 0)
+        signals.update(await _within(_weather(signals["geo_lat"], signals["geo_lon"]), remaining))
 
     # Daypart
-    tz = signals.get("geo_timezone", "")
-    signals.update(_compute_daypart(tz))
+    if "daypart" in providers:
+        tz = signals.get("geo_timezone", "")
+        signals.update(_compute_daypart(tz))
 
+    if report is not None:
+        report["providers_invoked"] = sorted(providers & ALL_PROVIDERS)
+        report["providers_skipped"] = sorted(ALL_PROVIDERS - providers)
     return signals
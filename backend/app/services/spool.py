@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import struct
+import time
+import zlib
+from typing import Awaitable, Callable, Optional
+
+from app.config import (
+    SPOOL_FSYNC_INTERVAL,
+    SPOOL_MAX_BYTES,
+    SPOOL_REPLAY_INTERVAL,
+    SPOOL_SEGMENT_BYTES,
+)
+
+# Local write-ahead spool for tracking events the database can't take.
+#
+# Rows are appended to the open segment as length-prefixed records:
+# <u32 payload length><u32 crc32><payload>, the payload being compact JSON
+# [table, row]. Appends only hit the file buffer; a background task flushes
+# and fsyncs the segment every SPOOL_FSYNC_INTERVAL, so one fsync covers
+# every event accepted in that window. Segments are sealed (renamed from
+# .open to .seg) when they reach SPOOL_SEGMENT_BYTES or when the replayer
+# runs, and the replayer loads sealed segments back, oldest first, deleting
+# each one only once all of its rows are in. Rows carry their event id and
+# are inserted with on_conflict=id, so a segment replayed twice (a crash
+# between the insert and the delete) is still counted once.
+#
+# A torn record at the end of a segment (crash mid-append) fails its length
+# or CRC check and ends the read there. Segment names carry the writing
+# process's pid; leftovers of a process that is gone are sealed and
+# replayed by whichever process starts next.
+
+HEADER = struct.Struct("<II")
+
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".seg"
+CLAIM_SUFFIX = ".claim"
+
+# Replays a batch of rows into `table`; False means the database is still unavailable
+Sink = Callable[[str, list[dict]], Awaitable[bool]]
+
+
+_encode_json = json.JSONEncoder(separators=(",", ":"), default=str).encode
+
+
+def encode_record(table: str, row: dict) -> bytes:
+    payload = _encode_json([table, row]).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(data: bytes) -> tuple[list[tuple[str, dict]], bool]:
+    """Decode a segment's records; the flag is False when it ended on a torn or corrupt record."""
+    records = []
+    pos, end = 0, len(data)
+    while pos < end:
+        if end - pos < HEADER.size:
+            return records, False
+        length, crc = HEADER.unpack_from(data, pos)
+        payload = data[pos + HEADER.size:pos + HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return records, False
+        table, row = json.loads(payload)
+        records.append((table, row))
+        pos += HEADER.size + length
+    return records, True
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fsync_and_close(fd: int) -> None:
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Spool:
+    """Append-only segment files under `directory`, replayed into the database later."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = SPOOL_SEGMENT_BYTES,
+        max_bytes: int = SPOOL_MAX_BYTES,
+        fsync_interval: float = SPOOL_FSYNC_INTERVAL,
+        replay_interval: float = SPOOL_REPLAY_INTERVAL,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.replay_interval = replay_interval
+        self._pid = os.getpid()
+        self._seq = 0
+        self._file = None
+        self._path: Optional[str] = None
+        self._size = 0
+        self._dirty = False
+        self._sealed_bytes = 0
+        self._tasks: list[asyncio.Task] = []
+        self._replay_lock = asyncio.Lock()
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped_full = 0
+        self.corrupt_segments = 0
+        self.replay_errors = 0
+        self.fsyncs = 0
+
+    # -- writing ------------------------------------------------------------
+
+    def _segment_path(self, suffix: str) -> str:
+        self._seq += 1
+        name = f"{int(time.time() * 1000):015d}-{self._pid}-{self._seq:06d}"
+        return os.path.join(self.directory, name + suffix)
+
+    def _open_segment(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = self._segment_path(OPEN_SUFFIX)
+        self._file = open(self._path, "ab")
+        self._size = 0
+
+    def append(self, table: str, rows: list[dict]) -> int:
+        """Append rows to the open segment; returns how many fit under SPOOL_MAX_BYTES."""
+        accepted = 0
+        for row in rows:
+            record = encode_record(table, row)
+            if self._sealed_bytes + self._size + len(record) > self.max_bytes:
+                self.dropped_full += len(rows) - accepted
+                break
+            if self._file is None:
+                self._open_segment()
+            self._file.write(record)
+            self._size += len(record)
+            accepted += 1
+            if self._size >= self.segment_bytes:
+                self._seal()
+        if accepted:
+            self._dirty = self._file is not None
+            self.spooled += accepted
+        return accepted
+
+    async def sync(self) -> None:
+        """Flush buffered records and fsync them (off the event loop)."""
+        if not self._dirty or self._file is None:
+            return
+        self._file.flush()
+        self._dirty = False
+        # A dup'd descriptor stays valid if the segment is sealed meanwhile
+        await asyncio.to_thread(_fsync_and_close, os.dup(self._file.fileno()))
+        self.fsyncs += 1
+
+    def _seal(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        fd = os.dup(self._file.fileno())
+        self._file.close()
+        os.rename(self._path, self._path[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        self._sealed_bytes += self._size
+        self._file, self._path, self._size, self._dirty = None, None, 0, False
+        # The final fsync goes to a thread when there is a loop; the segment
+        # is readable (and replayable) from the page cache meanwhile
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _fsync_and_close, fd)
+        except RuntimeError:
+            _fsync_and_close(fd)
+        self.fsyncs += 1
+
+    # -- replay -------------------------------------------------------------
+
+    def _list(self, suffix: str) -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.directory, n) for n in names if n.endswith(suffix))
+
+    def recover(self) -> None:
+        """Seal open segments and release claims left by processes that are gone."""
+        for path in self._list(OPEN_SUFFIX):
+            # Our own pid here means a previous run that happened to get the same one
+            pid = int(os.path.basename(path).split("-")[1])
+            if path != self._path and (pid == self._pid or not _pid_alive(pid)):
+                os.rename(path, path[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        for path in self._list(CLAIM_SUFFIX):
+            pid = int(path.rsplit(".", 2)[-2])
+            if pid == self._pid or not _pid_alive(pid):
+                os.rename(path, path[: path.index(SEALED_SUFFIX) + len(SEALED_SUFFIX)])
+        self._sealed_bytes = sum(os.path.getsize(p) for p in self._list(SEALED_SUFFIX))
+
+    async def replay(self, sink: Sink, batch_size: int) -> int:
+        """Load sealed segments back, oldest first; stops at the first one the database won't take."""
+        async with self._replay_lock:
+            self._seal()
+            replayed = 0
+            for path in self._list(SEALED_SUFFIX):
+                claimed = f"{path}.{self._pid}{CLAIM_SUFFIX}"
+                try:
+                    os.rename(path, claimed)  # another process may be replaying it
+                except FileNotFoundError:
+                    continue
+                try:
+                    size = os.path.getsize(claimed)
+                    records, ok = await self._replay_segment(claimed, sink, batch_size)
+                except BaseException:
+                    os.rename(claimed, path)  # un-claim, so this or the next run retries it
+                    raise
+                if not ok:
+                    os.rename(claimed, path)
+                    break
+                os.remove(claimed)
+                self._sealed_bytes = max(self._sealed_bytes - size, 0)
+                replayed += len(records)
+            self.replayed += replayed
+            return replayed
+
+    async def _replay_segment(self, path: str, sink: Sink, batch_size: int) -> tuple[list, bool]:
+        """Send one claimed segment's records to `sink`; False if it refused a batch."""
+        data = await asyncio.to_thread(_read_file, path)
+        records, complete = read_records(data)
+        if not complete:
+            self.corrupt_segments += 1
+        by_table: dict[str, list[dict]] = {}
+        for table, row in records:
+            by_table.setdefault(table, []).append(row)
+        for table, rows in by_table.items():
+            for i in range(0, len(rows), batch_size):
+                if not await sink(table, rows[i:i + batch_size]):
+                    return records, False
+        return records, True
+
+    # -- lifecycle ----------------------------------------------------------
+
+    async def _sync_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.sync()
+            except OSError:
+                pass
+
+    async def _replay_periodically(self, sink: Sink, batch_size: int) -> None:
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            if not self.pending_bytes():
+                continue
+            try:
+                await self.replay(sink, batch_size)
+            except Exception:
+                # Keep replaying on the next interval whatever went wrong
+                self.replay_errors += 1
+
+    def start(self, sink: Sink, batch_size: int) -> None:
+        if self._tasks:
+            return
+        self.recover()
+        self._tasks = [
+            asyncio.create_task(self._sync_periodically()),
+            asyncio.create_task(self._replay_periodically(sink, batch_size)),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._seal()
+
+    def pending_bytes(self) -> int:
+        return self._sealed_bytes + self._size
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "pending_bytes": self.pending_bytes(),
+            "max_bytes": self.max_bytes,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "dropped_full": self.dropped_full,
+            "corrupt_segments": self.corrupt_segments,
+            "replay_errors": self.replay_errors,
+            "fsyncs": self.fsyncs,
+        }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
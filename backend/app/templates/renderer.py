@@ -1,7 +1,15 @@
 from __future__ import annotations
 
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from html import escape
+from string import Formatter
 from typing import Optional
 
+from app.config import RENDER_CACHE_MAX, RENDER_CACHE_GZIP
+
 TEMPLATES: dict[str, str] = {}
 
 # --- Default Template ---
@@ -104,7 +112,97 @@ body{{font-family:-apple-system,BlinkMacSystemFont,sans-serif;display:flex;align
 <a class="cta" href="{click_url}" target="_blank">{cta_text}</a>
 </div></body></html>"""
 
-TEMPLATE_NAMES = list(TEMPLATES.keys())
+class CompiledTemplate:
+    """A template split once into pre-encoded static segments and named slots.
+
+    Rendering joins the static byte segments with the slot values, so the CSS
+    and markup are never re-parsed or re-encoded per impression.
+    """
+
+    __slots__ = ("name", "statics", "slots")
+
+    def __init__(self, name: str, source: str):
+        statics: list[bytes] = []
+        slots: list[str] = []
+        pending = ""
+        for literal, field, spec, conversion in Formatter().parse(source):
+            pending += literal
+            if field is None:
+                continue
+            if spec or conversion or field not in SLOT_NAMES:
+                raise ValueError(f"Template {name!r}: unsupported placeholder {{{field}}}")
+            statics.append(pending.encode("utf-8"))
+            slots.append(field)
+            pending = ""
+        statics.append(pending.encode("utf-8"))
+        self.name = name
+        self.statics = tuple(statics)
+        self.slots = tuple(slots)
+
+    def render(self, values: dict[str, bytes]) -> bytes:
+        statics = self.statics
+        parts = [statics[0]]
+        for i, slot in enumerate(self.slots, 1):
+            parts.append(values[slot])
+            parts.append(statics[i])
+        return b"".join(parts)
+
+
+SLOT_NAMES = frozenset({
+    "width", "height", "headline", "body_text", "image_url",
+    "image_tag", "image_block", "cta_text", "click_url",
+})
+
+COMPILED: dict[str, CompiledTemplate] = {}
+TEMPLATE_NAMES: list[str] = []
+
+
+def register_template(name: str, source: str) -> None:
+    """Compile and register a template written in str.format syntax."""
+    compiled = CompiledTemplate(name, source)
+    replaced = name in COMPILED
+    TEMPLATES[name] = source
+    COMPILED[name] = compiled
+    if replaced:
+        _forget_template(name)
+    if name not in TEMPLATE_NAMES:
+        TEMPLATE_NAMES.append(name)
+
+
+for _name, _source in list(TEMPLATES.items()):
+    register_template(_name, _source)
+
+
+def _text(value: object) -> bytes:
+    return escape(str(value), quote=True).encode("utf-8")
+
+
+def render_ad_bytes(
+    variant: dict,
+    template_name: str = "default",
+    width: int = 400,
+    height: int = 300,
+    click_url: Optional[str] = None,
+) -> bytes:
+    """Render an ad variant into UTF-8 HTML using the specified compiled template."""
+    tpl = COMPILED.get(template_name) or COMPILED["default"]
+
+    # Everything is HTML-escaped except image_tag/image_block, which are markup built here.
+    image_url = variant.get("image_url") or ""
+    image_tag = b'<img src="' + _text(image_url) + b'" alt="">' if image_url else b""
+
+    values: dict[str, bytes] = {
+        "width": str(int(width)).encode(),
+        "height": str(int(height)).encode(),
+        "headline": _text(variant.get("headline") or ""),
+        "body_text": _text(variant.get("body_text") or ""),
+        "image_url": _text(image_url),
+        "image_tag": image_tag,
+        "image_block": image_tag,
+        "cta_text": _text(variant.get("cta_text") or "Learn More"),
+        "click_url": _text(click_url or variant.get("cta_url") or "#"),
+    }
+    return tpl.render(values)
 
 
 def render_ad(
@@ -115,25 +213,88 @@ def render_ad(
     click_url: Optional[str] = None,
 ) -> str:
     """Render an ad variant into HTML using the specified template."""
-    tpl = TEMPLATES.get(template_name, TEMPLATES["default"])
-
-    headline = variant.get("headline", "")
-    body_text = variant.get("body_text", "")
-    image_url = variant.get("image_url", "")
-    cta_text = variant.get("cta_text", "Learn More")
-    cta_url = click_url or variant.get("cta_url", "#")
-
-    image_tag = f'<img src="{image_url}" alt="">' if image_url else ""
-    image_block = f'<img src="{image_url}" alt="">' if image_url else ""
-
-    return tpl.format(
-        width=width,
-        height=height,
-        headline=headline,
-        body_text=body_text,
-        image_url=image_url,
-        image_tag=image_tag,
-        image_block=image_block,
-        cta_text=cta_text,
-        click_url=cta_url,
+    return render_ad_bytes(variant, template_name, width, height, click_url).decode("utf-8")
+
+
+class RenderedAd:
+    """Rendered HTML body plus its gzipped form and strong ETags."""
+
+    __slots__ = ("body", "gzipped", "etag", "etag_gzip")
+
+    def __init__(self, body: bytes, gzip_body: bool):
+        self.body = body
+        self.gzipped = gzip.compress(self.body, compresslevel=6, mtime=0) if gzip_body else None
+        digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self.etag = f'"{digest}"'
+        self.etag_gzip = f'"{digest}-gz"'
+
+    @property
+    def html(self) -> str:
+        return self.body.decode("utf-8")
+
+
+_render_cache: OrderedDict[tuple, RenderedAd] = OrderedDict()
+_render_lock = threading.Lock()
+_render_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _variant_version(variant: dict) -> object:
+    """Cheap version marker; falls back to the rendered fields when rows lack updated_at."""
+    updated = variant.get("updated_at")
+    if updated:
+        return updated
+    return (
+        variant.get("headline"),
+        variant.get("body_text"),
+        variant.get("image_url"),
+        variant.get("cta_text"),
+        variant.get("cta_url"),
     )
+
+
+def render_ad_cached(
+    variant: dict,
+    template_name: str = "default",
+    width: int = 400,
+    height: int = 300,
+    click_url: Optional[str] = None,
+) -> RenderedAd:
+    """Like render_ad, but memoized in a bounded LRU keyed on everything the output depends on."""
+    if template_name not in COMPILED:
+        template_name = "default"
+    # Keyed on the compiled template itself, so re-registering a name never serves the old HTML
+    key = (variant.get("id"), _variant_version(variant), COMPILED[template_name], width, height, click_url)
+
+    with _render_lock:
+        cached = _render_cache.get(key)
+        if cached is not None:
+            _render_cache.move_to_end(key)
+            _render_stats["hits"] += 1
+            return cached
+        _render_stats["misses"] += 1
+
+    rendered = RenderedAd(render_ad_bytes(variant, template_name, width, height, click_url), RENDER_CACHE_GZIP)
+
+    with _render_lock:
+        _render_cache[key] = rendered
+        while len(_render_cache) > RENDER_CACHE_MAX:
+            _render_cache.popitem(last=False)
+            _render_stats["evictions"] += 1
+    return rendered
+
+
+def _forget_template(name: str) -> None:
+    """Drop cached renders of a template that was just re-registered."""
+    with _render_lock:
+        for key in [k for k in _render_cache if k[2].name == name]:
+            del _render_cache[key]
+
+
+def render_cache_stats() -> dict:
+    total = _render_stats["hits"] + _render_stats["misses"]
+    return {
+        "size": len(_render_cache),
+        "max_size": RENDER_CACHE_MAX,
+        **_render_stats,
+        "hit_rate": round(_render_stats["hits"] / total, 4) if total else 0.0,
+    }
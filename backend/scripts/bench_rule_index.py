@@ -0,0 +1,103 @@
+"""Benchmark the indexed rule matcher against the linear evaluator.
+
+Builds campaigns with programmatically generated city/country/weather/UA
+rules, checks that RuleIndex picks exactly the same variant as match_rules
+for every sampled request, and reports per-decision timings.
+
+    cd backend && python -m scripts.bench_rule_index [--rules 100,1000,5000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+
+from app.services.decisioning import compile_rules, match_rules
+from app.services.rule_index import RuleIndex
+
+COUNTRIES = [f"c{i:03d}" for i in range(200)]
+CITIES = [f"city-{i}" for i in range(5000)]
+UA_TOKENS = ["iphone", "android", "ipad", "windows", "macintosh", "linux", "chrome", "firefox",
+             "safari", "edg/", "opr/", "bot", "crawler", "mobile", "tablet", "smart-tv"]
+
+
+def make_campaign(n_rules: int, rng: random.Random) -> tuple[list[dict], list[dict]]:
+    variants = [{"id": f"v{i}", "weight": 1} for i in range(20)]
+    rules = []
+    for j in range(n_rules):
+        kind = rng.random()
+        if kind < 0.55:
+            signal, operator, value = "geo_city", "eq", rng.choice(CITIES)
+        elif kind < 0.75:
+            signal, operator, value = "geo_country", "in", ",".join(rng.sample(COUNTRIES, 3))
+        elif kind < 0.85:
+            signal = "weather_temp"
+            operator, value = rng.choice([("gt", rng.randint(30, 45)), ("gte", rng.randint(30, 45)),
+                                          ("lt", rng.randint(-20, 0)), ("lte", rng.randint(-20, 0))])
+            value = str(value)
+        else:
+            signal, operator, value = "user_agent", "contains", rng.choice(UA_TOKENS) + str(rng.randint(0, 9))
+        rules.append({
+            "id": f"r{j}",
+            "variant_id": rng.choice(variants)["id"],
+            "signal": signal,
+            "operator": operator,
+            "value": value,
+            "priority": rng.randint(0, 100),
+        })
+    return variants, rules
+
+
+def make_signals(rng: random.Random) -> dict:
+    return {
+        "geo_city": rng.choice(CITIES),
+        "geo_country": rng.choice(COUNTRIES),
+        "weather_temp": round(rng.uniform(-25, 50), 1),
+        "user_agent": "Mozilla/5.0 (" + " ".join(rng.sample(UA_TOKENS, 3)) + str(rng.randint(0, 9)) + ")",
+        "daypart": rng.choice(["morning", "afternoon", "evening", "night"]),
+    }
+
+
+def timed(fn, samples: list[dict]) -> tuple[list, float]:
+    start = time.perf_counter()
+    results = [fn(s) for s in samples]
+    return results, (time.perf_counter() - start) / len(samples) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", default="16,100,1000,5000", help="comma-separated rule counts")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    samples = [make_signals(rng) for _ in range(args.requests)]
+    failed = False
+
+    print(f"{'rules':>7} {'linear us':>10} {'index us':>10} {'speedup':>8} {'build ms':>9} {'matched':>8}  result")
+    for n in (int(x) for x in args.rules.split(",")):
+        variants, rules = make_campaign(n, rng)
+        compiled = compile_rules(variants, rules)
+
+        start = time.perf_counter()
+        index = RuleIndex(compiled)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        linear, linear_us = timed(lambda s: match_rules(compiled, s), samples)
+        indexed, index_us = timed(index.match, samples)
+
+        mismatches = sum(1 for a, b in zip(linear, indexed) if a is not b)
+        matched = sum(1 for a in linear if a is not None)
+        failed |= mismatches > 0
+        result = "identical" if not mismatches else f"{mismatches} MISMATCHES"
+        print(
+            f"{n:>7} {linear_us:>10.2f} {index_us:>10.2f} {linear_us / index_us:>7.1f}x "
+            f"{build_ms:>9.1f} {matched:>8}  {result}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Check the tracking dedup filter: no missed repeats, and a false-positive rate as estimated.
+
+For a window's worth of distinct synthetic events at several memory budgets
+this verifies that
+  - every repeat of an event already seen is reported as seen,
+  - the measured rate of new events wrongly reported as seen stays close to
+    the filter's own estimate,
+and prints the per-event cost and whether each budget meets --max-fp.
+
+    cd backend && python -m scripts.check_dedup_filter [--events 500000]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+
+from app.core.bloom import RotatingBloom
+
+BUDGETS_MB = (1, 4, 8)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=500000, help="distinct events per window")
+    parser.add_argument("--probes", type=int, default=200000, help="fresh events used to measure false positives")
+    parser.add_argument("--max-fp", type=float, default=0.001)
+    args = parser.parse_args()
+
+    keys = [f"impression\ncampaign-{i % 50}\nvariant-{i % 7}\n\nid:visitor-{i}".encode() for i in range(args.events)]
+    probes = [f"click\ncampaign-{i % 50}\nvariant-{i % 7}\n\nid:other-{i}".encode() for i in range(args.probes)]
+
+    failed = False
+    print(f"{'budget':>7} {'hashes':>6} {'missed':>7} {'fp measured':>12} {'fp estimate':>12} {'us/event':>9} {'<max-fp':>7}  result")
+    for mb in BUDGETS_MB:
+        bloom = RotatingBloom(3600, mb * 1024 * 1024, args.events)
+        start = time.perf_counter()
+        first = sum(bloom.check_and_add(k) for k in keys)
+        us = (time.perf_counter() - start) / len(keys) * 1e6
+        missed = sum(not bloom.check_and_add(k) for k in keys)
+        estimate = bloom.false_positive_rate()
+        measured = sum(bloom.contains(k) for k in probes) / len(probes)
+        # Blocking costs some accuracy against the classic estimate; allow 2x plus sampling noise
+        ok = missed == 0 and measured <= 2 * estimate + 5 / len(probes)
+        failed |= not ok
+        fits = "yes" if measured <= args.max_fp and first / len(keys) <= args.max_fp else "no"
+        print(
+            f"{mb:>5}MB {bloom.k:>6} {missed:>7} {measured:>12.6f} {estimate:>12.6f} {us:>9.2f} {fits:>7}  "
+            f"{'ok' if ok else 'FAIL'}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Check sticky bucketing: stable, weight-proportional, and minimally disruptive.
+
+For a set of synthetic visitors this verifies that
+  - the same visitor always lands on the same variant,
+  - shares track the weights (within --tolerance),
+  - after a weight change, the share of visitors who move is close to the
+    theoretical minimum (the total variation between old and new weights).
+
+    cd backend && python -m scripts.check_sticky_split [--visitors 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections import Counter
+
+from app.services.decisioning import StickySplit
+
+
+def variants_for(weights: list[float]) -> list[dict]:
+    return [{"id": f"variant-{i}", "weight": w} for i, w in enumerate(weights)]
+
+
+def assign(ring: StickySplit, visitors: list[str]) -> list[str]:
+    return [ring.pick(v)["id"] for v in visitors]  # type: ignore[index]
+
+
+def minimal_move(old: list[float], new: list[float]) -> float:
+    a, b = sum(old), sum(new)
+    return 0.5 * sum(abs(o / a - n / b) for o, n in zip(old, new))
+
+
+SCENARIOS = [
+    ("50/50 -> 60/40", [100, 100], [120, 80]),
+    ("3 equal -> add 4th", [100, 100, 100, 0], [100, 100, 100, 100]),
+    ("4 equal -> drop 1", [100, 100, 100, 100], [100, 100, 100, 0]),
+    ("skewed nudge", [700, 200, 100], [650, 250, 100]),
+    ("2000 variants, 1 doubled", [100] * 2000, [200] + [100] * 1999),
+]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--visitors", type=int, default=100000)
+    parser.add_argument("--tolerance", type=float, default=0.03, help="allowed share error")
+    args = parser.parse_args()
+
+    visitors = [f"visitor-{i}" for i in range(args.visitors)]
+    failed = False
+    print(f"{'scenario':>26} {'max share err':>14} {'moved':>7} {'minimum':>8} {'us/pick':>8}  result")
+    for name, old_w, new_w in SCENARIOS:
+        old_ring = StickySplit("campaign-1", variants_for(old_w))
+        new_ring = StickySplit("campaign-1", variants_for(new_w))
+
+        start = time.perf_counter()
+        before = assign(old_ring, visitors)
+        us = (time.perf_counter() - start) / len(visitors) * 1e6
+        stable = before == assign(old_ring, visitors)
+        after = assign(new_ring, visitors)
+
+        counts = Counter(after)
+        total = sum(new_w)
+        share_err = max(
+            abs(counts.get(f"variant-{i}", 0) / len(visitors) - w / total) for i, w in enumerate(new_w)
+        )
+        moved = sum(1 for a, b in zip(before, after) if a != b) / len(visitors)
+        minimum = minimal_move(old_w, new_w)
+        # Moving more than the minimum means visitors were reshuffled needlessly
+        ok = stable and share_err <= args.tolerance and moved <= minimum + args.tolerance
+        failed |= not ok
+        print(
+            f"{name:>26} {share_err:>14.4f} {moved:>7.3f} {minimum:>8.3f} {us:>8.2f}  "
+            f"{'ok' if ok else 'FAIL'}{'' if stable else ' (unstable)'}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Check that WeightedSampler draws the same distribution as random.choices.
+
+For several weight layouts (uniform, skewed, zero weights, thousands of
+generated variants) both samplers are run, and each is tested against the
+expected proportions with a chi-square goodness-of-fit test. Also reports
+the per-draw cost of each.
+
+    cd backend && python -m scripts.check_weighted_sampler [--draws 200000]
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+from app.services.decisioning import WeightedSampler
+
+# Upper-tail z for the significance level used by the test (alpha = 0.001)
+Z_CRITICAL = 3.090
+
+
+def chi_square_critical(dof: int) -> float:
+    """Wilson-Hilferty approximation of the chi-square critical value."""
+    h = 2.0 / (9.0 * dof)
+    return dof * (1.0 - h + Z_CRITICAL * math.sqrt(h)) ** 3
+
+
+def chi_square(counts: Counter, weights: list[float], draws: int) -> tuple[float, int]:
+    total = sum(weights)
+    stat = 0.0
+    dof = -1
+    for i, w in enumerate(weights):
+        if w <= 0:
+            if counts.get(i):
+                return math.inf, max(dof, 1)  # a zero-weight variant was drawn
+            continue
+        expected = draws * w / total
+        stat += (counts.get(i, 0) - expected) ** 2 / expected
+        dof += 1
+    return stat, max(dof, 1)
+
+
+def layouts(rng: random.Random) -> dict[str, list[float]]:
+    return {
+        "uniform-5": [100] * 5,
+        "skewed": [1000, 100, 10, 1],
+        "with-zeros": [50, 0, 25, 0, 25],
+        "generated-2000": [rng.randint(1, 100) for _ in range(2000)],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--draws", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    print(f"{'layout':>15} {'sampler':>9} {'chi2':>10} {'critical':>9} {'us/draw':>8}  result")
+    for name, weights in layouts(rng).items():
+        variants = [{"id": i, "weight": w} for i, w in enumerate(weights)]
+        sampler = WeightedSampler(variants)
+
+        def choices() -> dict:
+            return random.choices(variants, weights=[v.get("weight", 1.0) for v in variants], k=1)[0]
+
+        for label, draw in (("choices", choices), ("alias", sampler.pick)):
+            start = time.perf_counter()
+            counts = Counter(draw()["id"] for _ in range(args.draws))
+            us = (time.perf_counter() - start) / args.draws * 1e6
+            stat, dof = chi_square(counts, weights, args.draws)
+            critical = chi_square_critical(dof)
+            ok = stat <= critical
+            failed |= not ok
+            print(f"{name:>15} {label:>9} {stat:>10.1f} {critical:>9.1f} {us:>8.2f}  {'ok' if ok else 'FAIL'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
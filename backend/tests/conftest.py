@@ -0,0 +1,13 @@
+"""Shared test configuration.
+
+Settings are read from the environment when app.config is imported, so the
+defaults tests rely on are set here, before any app module is loaded.
+"""
+from __future__ import annotations
+
+import os
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-service-key")
+os.environ.setdefault("CLICK_SIGNING_SECRET", "test-click-secret")
+os.environ["SPOOL_DIR"] = ""
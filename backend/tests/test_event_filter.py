@@ -0,0 +1,98 @@
+"""Tests for the tracking event filter and its rotating Bloom filter."""
+from __future__ import annotations
+
+import pytest
+
+from app.core import bloom as bloom_module
+from app.core.bloom import RotatingBloom
+from app.services.event_filter import EventFilter
+
+EVENTS = 50000
+PROBES = 50000
+BROWSER = {"user-agent": "Mozilla/5.0 (Windows NT 10.0) Chrome/120.0", "accept-language": "es-AR"}
+
+
+class TestRotatingBloom:
+    """No missed repeats, and a false-positive rate close to the estimate."""
+
+    @pytest.mark.parametrize("memory_bytes", [64 * 1024, 256 * 1024, 1024 * 1024])
+    def test_repeats_and_false_positives(self, memory_bytes):
+        """Should report every repeat as seen and keep false positives near the estimate."""
+        bloom = RotatingBloom(3600, memory_bytes, EVENTS)
+        keys = [f"impression\nc{i % 50}\nv{i % 7}\n\nid:visitor-{i}".encode() for i in range(EVENTS)]
+        probes = [f"click\nc{i % 50}\nv{i % 7}\n\nid:other-{i}".encode() for i in range(PROBES)]
+
+        for key in keys:
+            bloom.check_and_add(key)
+        missed = sum(not bloom.check_and_add(key) for key in keys)
+        measured = sum(bloom.contains(key) for key in probes) / PROBES
+
+        assert missed == 0
+        # Same allowance as scripts/check_dedup_filter.py: blocking costs up to 2x
+        assert measured <= 2 * bloom.false_positive_rate() + 5 / PROBES
+
+    def test_forgets_after_two_windows(self, monkeypatch):
+        """Should remember a key through the next window and forget it after that."""
+        now = [1000.0]
+        monkeypatch.setattr(bloom_module.time, "monotonic", lambda: now[0])
+        bloom = RotatingBloom(60, 64 * 1024, 1000)
+
+        assert not bloom.check_and_add(b"key")
+        now[0] += 61
+        assert bloom.contains(b"key")
+        now[0] += 61
+        assert not bloom.check_and_add(b"key")
+
+
+class TestEventFilter:
+    """Bot/prefetch screening and de-duplication."""
+
+    def test_repeat_by_same_visitor_is_dropped(self):
+        """Should admit the first impression of a visitor and drop the repeat."""
+        f = EventFilter(60, 64 * 1024, 1000)
+
+        assert f.admit("impression", "c1", "v1", "198.51.100.1", BROWSER, "visitor-1")
+        assert not f.admit("impression", "c1", "v1", "198.51.100.1", BROWSER, "visitor-1")
+        assert f.stats()["impression"]["duplicate"] == 1
+
+    def test_visitor_ids_split_a_shared_ip(self):
+        """Should count distinct visitor ids behind one IP and user agent separately."""
+        f = EventFilter(60, 64 * 1024, 1000)
+
+        assert f.admit("impression", "c1", "v1", "198.51.100.1", BROWSER, "visitor-1")
+        assert f.admit("impression", "c1", "v1", "198.51.100.1", BROWSER, "visitor-2")
+
+    def test_fallback_key_includes_accept_language(self):
+        """Should tell apart visitors without ids by Accept-Language."""
+        f = EventFilter(60, 64 * 1024, 1000)
+        other = {**BROWSER, "accept-language": "en-US"}
+
+        assert f.admit("click", "c1", "v1", "198.51.100.1", BROWSER)
+        assert f.admit("click", "c1", "v1", "198.51.100.1", other)
+        assert not f.admit("click", "c1", "v1", "198.51.100.1", BROWSER)
+
+    def test_placements_are_separate(self):
+        """Should not treat the same ad in two slots of a page as a repeat."""
+        f = EventFilter(60, 64 * 1024, 1000)
+
+        assert f.admit("impression", "c1", "v1", "198.51.100.1", BROWSER, "visitor-1", placement="0")
+        assert f.admit("impression", "c1", "v1", "198.51.100.1", BROWSER, "visitor-1", placement="1")
+
+    @pytest.mark.parametrize("headers", [
+        {"user-agent": "Mozilla/5.0 (compatible; Googlebot/2.1)"},
+        {"user-agent": "curl/8.4.0"},
+        {},
+    ])
+    def test_bots_are_dropped(self, headers):
+        """Should drop self-declared bots and requests without a user agent."""
+        f = EventFilter(60, 64 * 1024, 1000)
+
+        assert not f.admit("impression", "c1", "v1", "198.51.100.1", headers)
+        assert f.stats()["impression"]["bot"] == 1
+
+    def test_prefetch_is_dropped(self):
+        """Should drop prefetches before anything else."""
+        f = EventFilter(60, 64 * 1024, 1000)
+
+        assert not f.admit("impression", "c1", "v1", "198.51.100.1", {**BROWSER, "sec-purpose": "prefetch"})
+        assert f.stats()["impression"]["prefetch"] == 1
@@ -0,0 +1,78 @@
+"""Tests for the batched tracking writer's handling of bad rows."""
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import db
+from app.services.event_writer import BatchWriter
+
+
+def _rejection(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://supabase.test/rest/v1/impressions")
+    return httpx.HTTPStatusError("rejected", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.fixture
+def inserted(monkeypatch):
+    rows: list[dict] = []
+
+    async def insert(table, payload, **kwargs):
+        if any(row.get("bad") for row in payload):
+            raise _rejection(400)
+        rows.extend(payload)
+
+    monkeypatch.setattr(db, "insert", insert)
+    return rows
+
+
+def _rows(n: int, bad: int) -> list[dict]:
+    return [{"id": f"event-{i}", "bad": i == bad} for i in range(n)]
+
+
+class TestBadRows:
+    """One bad row must not take the rest of its batch down."""
+
+    def test_rejected_insert_is_split(self, inserted):
+        """Should write every row but the one the database rejects."""
+        writer = BatchWriter("impressions", workers=1)
+
+        left = asyncio.run(writer._write(_rows(10, bad=3), retries=2))
+
+        assert left == []
+        assert sorted(r["id"] for r in inserted) == sorted(f"event-{i}" for i in range(10) if i != 3)
+        assert writer.dropped_failed == 1
+        assert writer.retries == 0
+
+    def test_failed_encode_is_split(self, inserted):
+        """Should isolate a row the encode hook can't handle, like a rejected insert."""
+
+        async def encode(rows):
+            for row in rows:
+                if row["id"] == "event-7":
+                    raise ValueError("can't encode")
+            return rows
+
+        writer = BatchWriter("impressions", workers=1, encode=encode)
+
+        left = asyncio.run(writer._write(_rows(10, bad=-1), retries=2))
+
+        assert left == []
+        assert len(inserted) == 9
+        assert writer.dropped_failed == 1
+
+    def test_unavailable_database_keeps_rows(self, monkeypatch):
+        """Should hand back every row while the database answers 5xx."""
+
+        async def insert(table, payload, **kwargs):
+            raise _rejection(503)
+
+        monkeypatch.setattr(db, "insert", insert)
+        monkeypatch.setattr("app.services.event_writer.RETRY_BACKOFF", 0)
+        writer = BatchWriter("impressions", workers=1)
+
+        rows = _rows(4, bad=-1)
+        assert asyncio.run(writer._write(rows, retries=1)) == rows
+        assert writer.dropped_failed == 0
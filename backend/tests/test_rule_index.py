@@ -0,0 +1,76 @@
+"""Tests for the indexed rule matcher (RuleIndex) against the linear evaluator."""
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from app.services.decisioning import compile_rules, match_rules
+from app.services.rule_index import RuleIndex
+
+COUNTRIES = [f"c{i:03d}" for i in range(200)]
+CITIES = [f"city-{i}" for i in range(5000)]
+UA_TOKENS = ["iphone", "android", "ipad", "windows", "macintosh", "linux", "chrome", "firefox",
+             "safari", "edg/", "opr/", "bot", "crawler", "mobile", "tablet", "smart-tv"]
+
+
+def make_campaign(n_rules: int, rng: random.Random) -> tuple[list[dict], list[dict]]:
+    """20 variants and `n_rules` city/country/weather/UA rules with random priorities."""
+    variants = [{"id": f"v{i}", "weight": 1} for i in range(20)]
+    rules = []
+    for j in range(n_rules):
+        kind = rng.random()
+        if kind < 0.55:
+            signal, operator, value = "geo_city", "eq", rng.choice(CITIES)
+        elif kind < 0.75:
+            signal, operator, value = "geo_country", "in", ",".join(rng.sample(COUNTRIES, 3))
+        elif kind < 0.85:
+            signal = "weather_temp"
+            operator, value = rng.choice([("gt", rng.randint(30, 45)), ("gte", rng.randint(30, 45)),
+                                          ("lt", rng.randint(-20, 0)), ("lte", rng.randint(-20, 0))])
+            value = str(value)
+        else:
+            signal, operator, value = "user_agent", "contains", rng.choice(UA_TOKENS) + str(rng.randint(0, 9))
+        rules.append({
+            "id": f"r{j}",
+            "variant_id": rng.choice(variants)["id"],
+            "signal": signal,
+            "operator": operator,
+            "value": value,
+            "priority": rng.randint(0, 100),
+        })
+    return variants, rules
+
+
+def make_signals(rng: random.Random) -> dict:
+    return {
+        "geo_city": rng.choice(CITIES),
+        "geo_country": rng.choice(COUNTRIES),
+        "weather_temp": round(rng.uniform(-25, 50), 1),
+        "user_agent": "Mozilla/5.0 (" + " ".join(rng.sample(UA_TOKENS, 3)) + str(rng.randint(0, 9)) + ")",
+        "daypart": rng.choice(["morning", "afternoon", "evening", "night"]),
+    }
+
+
+class TestRuleIndex:
+    """RuleIndex must pick exactly what match_rules picks."""
+
+    @pytest.mark.parametrize("n_rules", [16, 100, 1000])
+    def test_index_matches_linear_evaluator(self, n_rules):
+        """Should choose the same variant object for every sampled request."""
+        rng = random.Random(42)
+        variants, rules = make_campaign(n_rules, rng)
+        compiled = compile_rules(variants, rules)
+        index = RuleIndex(compiled)
+
+        samples = [make_signals(rng) for _ in range(2000)]
+        mismatches = [s for s in samples if index.match(s) is not match_rules(compiled, s)]
+
+        assert mismatches == []
+
+    def test_missing_signals_match_nothing(self):
+        """Should not match when none of the rule signals are present."""
+        variants, rules = make_campaign(100, random.Random(1))
+        index = RuleIndex(compile_rules(variants, rules))
+
+        assert index.match({}) is None
@@ -0,0 +1,167 @@
+"""Tests for the compact impression signal encoding."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.services import db, signal_codec
+from app.services.signal_codec import MAX_VALUE_LENGTH
+
+
+class FakeSignalDict:
+    """In-memory stand-in for the signal_dict table and its intern RPC."""
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.rpc_calls = 0
+
+    async def rpc(self, fn: str, args=None, timeout=None):
+        assert fn == "intern_signal_values"
+        self.rpc_calls += 1
+        for value in args["vals"]:
+            self.ids.setdefault(value, len(self.ids) + 1)
+        return [{"id": self.ids[v], "value": v} for v in args["vals"]]
+
+    async def select(self, table, columns="*", filters=None, order=None, limit=None, timeout=None):
+        assert table == "signal_dict"
+        wanted = {int(i) for i in filters["id"][len("in.("):-1].split(",")}
+        return [{"id": i, "value": v} for v, i in self.ids.items() if i in wanted]
+
+
+@pytest.fixture
+def signal_dict(monkeypatch):
+    fake = FakeSignalDict()
+    monkeypatch.setattr(db, "rpc", fake.rpc)
+    monkeypatch.setattr(db, "select", fake.select)
+    # Each test starts with cold per-process caches
+    monkeypatch.setattr(signal_codec, "_ids", TTLCache(86400, 1000))
+    monkeypatch.setattr(signal_codec, "_values", TTLCache(86400, 1000))
+    return fake
+
+
+def _signals() -> dict:
+    return {
+        "ip": "203.0.113.7",
+        "user_agent": "Mozilla/5.0 (iPhone)",
+        "referer": "https://example.com/",
+        "geo_country": "AR",
+        "geo_region": "Buenos Aires",
+        "geo_city": "La Plata",
+        "geo_timezone": "America/Argentina/Buenos_Aires",
+        "geo_lat": -34.92,
+        "geo_lon": -57.95,
+        "weather_temp": 31.5,
+        "weather_code": 2,
+        "weather_condition": "clear",
+        "weather_is_hot": True,
+        "weather_is_cold": False,
+        "daypart": "afternoon",
+        "daypart_hour": 15,
+        "daypart_is_weekend": False,
+    }
+
+
+def _row(signals: dict) -> dict:
+    return {"id": "e1", "campaign_id": "c1", "variant_id": "v1", "signals": signals, "ip_address": signals.get("ip")}
+
+
+def _round_trip(rows: list[dict]) -> tuple[list[dict], list[dict]]:
+    encoded = asyncio.run(signal_codec.encode_rows(rows))
+    # Columns as decode_rows selects them
+    stored = [{c: row.get(c) for c in signal_codec.COLUMNS.split(", ")} for row in encoded]
+    return encoded, asyncio.run(signal_codec.decode_rows(stored))
+
+
+class TestRoundTrip:
+    """encode_rows -> decode_rows gives back the original signals."""
+
+    def test_full_signals(self, signal_dict):
+        """Should move every known signal to columns and restore all of them."""
+        encoded, decoded = _round_trip([_row(_signals())])
+
+        assert encoded[0]["signals"] is None
+        assert encoded[0]["weather_code"] == 2
+        assert isinstance(encoded[0]["user_agent_id"], int)
+        assert decoded == [_signals()]
+
+    def test_unknown_keys_and_odd_types_stay_in_jsonb(self, signal_dict):
+        """Should keep custom keys and unexpected value types in `signals`."""
+        signals = {"custom": {"a": 1}, "geo_lat": "n/a", "weather_code": 2.5, "weather_is_hot": 1, "daypart": 3}
+
+        encoded, decoded = _round_trip([_row(signals)])
+
+        assert encoded[0]["signals"] == signals
+        assert decoded == [signals]
+
+    def test_non_finite_numbers_are_dropped(self, signal_dict):
+        """Should drop NaN/Infinity instead of failing, whatever field they are in."""
+        signals = {"geo_lat": float("inf"), "weather_code": float("nan"), "custom": float("-inf"), "daypart_hour": 9}
+
+        encoded, decoded = _round_trip([_row(signals)])
+
+        assert encoded[0]["geo_lat"] is None
+        assert encoded[0]["signals"] is None
+        assert decoded == [{"daypart_hour": 9}]
+
+    def test_out_of_range_numbers_stay_in_jsonb(self, signal_dict):
+        """Should keep numbers the typed columns can't hold in `signals`."""
+        signals = {"weather_code": 10 ** 6, "geo_lon": 10 ** 400}
+
+        encoded, decoded = _round_trip([_row(signals)])
+
+        assert encoded[0]["signals"] == signals
+        assert decoded == [signals]
+
+    def test_input_rows_untouched(self, signal_dict):
+        """Should not modify the rows it is given."""
+        row = _row(_signals())
+
+        asyncio.run(signal_codec.encode_rows([row]))
+
+        assert row == _row(_signals())
+
+    def test_long_values_are_cut(self, signal_dict):
+        """Should store strings cut to MAX_VALUE_LENGTH."""
+        long_ua = "x" * (MAX_VALUE_LENGTH + 100)
+
+        _, decoded = _round_trip([_row({"user_agent": long_ua})])
+
+        assert decoded == [{"user_agent": long_ua[:MAX_VALUE_LENGTH]}]
+
+    def test_nul_characters_are_dropped(self, signal_dict):
+        """Should strip NUL, which Postgres text can't store, before interning."""
+        _, decoded = _round_trip([_row({"referer": "a\x00b"})])
+
+        assert decoded == [{"referer": "ab"}]
+        assert all("\x00" not in v for v in signal_dict.ids)
+
+    def test_values_interned_once(self, signal_dict):
+        """Should intern each distinct value once per batch, and not again once cached."""
+        rows = [_row({"geo_country": "AR", "daypart": "night"}) for _ in range(50)]
+
+        asyncio.run(signal_codec.encode_rows(rows))
+        asyncio.run(signal_codec.encode_rows(rows))
+
+        assert signal_dict.rpc_calls == 1
+        assert set(signal_dict.ids) == {"AR", "night"}
+
+
+class TestLegacyRows:
+    """Rows written before the compact encoding."""
+
+    def test_jsonb_only_row(self, signal_dict):
+        """Should decode a row that only has the full signals JSONB."""
+        signals = _signals()
+        stored = {c: None for c in signal_codec.COLUMNS.split(", ")}
+        stored["signals"] = signals
+        stored["ip_address"] = signals["ip"]
+
+        assert asyncio.run(signal_codec.decode_rows([stored])) == [signals]
+
+    def test_empty_row(self, signal_dict):
+        """Should decode a row with no signals at all to an empty dict."""
+        stored = {c: None for c in signal_codec.COLUMNS.split(", ")}
+
+        assert asyncio.run(signal_codec.decode_rows([stored])) == [{}]
@@ -0,0 +1,195 @@
+"""Tests for the local write-ahead spool (records, replay, recovery)."""
+from __future__ import annotations
+
+import asyncio
+import os
+
+import pytest
+
+from app.services.spool import Spool, encode_record, read_records
+
+
+def _dead_pid() -> int:
+    pid = 4_000_000
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid += 1
+
+
+class Sink:
+    """Collects replayed rows; refuses them while `down` is set."""
+
+    def __init__(self):
+        self.rows: list[tuple[str, dict]] = []
+        self.down = False
+
+    async def __call__(self, table: str, rows: list[dict]) -> bool:
+        if self.down:
+            return False
+        self.rows.extend((table, row) for row in rows)
+        return True
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path), segment_bytes=1024, max_bytes=1 << 20)
+
+
+def _rows(n: int, start: int = 0) -> list[dict]:
+    return [{"id": f"event-{i}", "campaign_id": "c1", "n": i} for i in range(start, start + n)]
+
+
+class TestRecords:
+    """Length-prefixed CRC32 records."""
+
+    def test_round_trip(self):
+        """Should decode what was encoded, in order."""
+        data = b"".join(encode_record("impressions", row) for row in _rows(3))
+
+        records, complete = read_records(data)
+
+        assert complete
+        assert records == [("impressions", row) for row in _rows(3)]
+
+    def test_truncated_tail(self):
+        """Should return the complete records and flag the torn last one."""
+        data = b"".join(encode_record("clicks", row) for row in _rows(3))
+
+        for cut in (1, 5, 12):
+            records, complete = read_records(data[:-cut])
+            assert not complete
+            assert records == [("clicks", row) for row in _rows(2)]
+
+    def test_crc_mismatch(self):
+        """Should stop at a record whose payload doesn't match its CRC."""
+        first, second, third = (encode_record("clicks", row) for row in _rows(3))
+        corrupt = bytearray(second)
+        corrupt[-2] ^= 0xFF
+
+        records, complete = read_records(first + bytes(corrupt) + third)
+
+        assert not complete
+        assert records == [("clicks", _rows(1)[0])]
+
+    def test_empty(self):
+        """Should read an empty segment as complete."""
+        assert read_records(b"") == ([], True)
+
+
+class TestReplay:
+    """Appending and loading segments back."""
+
+    def test_replays_everything_once(self, spool):
+        """Should replay every row, across segments, then remove the segments."""
+        sink = Sink()
+        spool.append("impressions", _rows(50))
+        spool.append("clicks", _rows(5, start=100))
+
+        replayed = asyncio.run(spool.replay(sink, batch_size=10))
+
+        assert replayed == 55
+        assert sorted(r["n"] for _, r in sink.rows) == list(range(50)) + list(range(100, 105))
+        assert os.listdir(spool.directory) == []
+        assert spool.pending_bytes() == 0
+        assert asyncio.run(spool.replay(sink, batch_size=10)) == 0
+
+    def test_keeps_segments_while_database_is_down(self, spool):
+        """Should leave segments in place when the sink refuses, and replay them later."""
+        sink = Sink()
+        sink.down = True
+        spool.append("impressions", _rows(20))
+
+        assert asyncio.run(spool.replay(sink, batch_size=10)) == 0
+        assert spool.pending_bytes() > 0
+
+        sink.down = False
+        assert asyncio.run(spool.replay(sink, batch_size=10)) == 20
+        assert len({r["id"] for _, r in sink.rows}) == 20
+
+    def test_sink_error_unclaims_segment(self, spool):
+        """Should put a segment back when the sink raises, and replay it next time."""
+        spool.append("impressions", _rows(5))
+
+        async def broken(table, rows):
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(spool.replay(broken, batch_size=10))
+        assert spool._list(".claim") == []
+
+        sink = Sink()
+        assert asyncio.run(spool.replay(sink, batch_size=10)) == 5
+
+    def test_max_bytes(self, tmp_path):
+        """Should refuse rows past max_bytes and count them."""
+        record = len(encode_record("impressions", _rows(1)[0]))
+        spool = Spool(str(tmp_path), segment_bytes=1 << 20, max_bytes=record * 3)
+
+        assert spool.append("impressions", _rows(5)) == 3
+        assert spool.dropped_full == 2
+
+    def test_torn_segment_replays_complete_records(self, spool):
+        """Should replay the intact records of a torn segment and count it as corrupt."""
+        spool.append("impressions", _rows(3))
+        spool._seal()
+        (path,) = spool._list(".seg")
+        with open(path, "ab") as f:
+            f.write(encode_record("impressions", {"id": "torn"})[:-4])
+        sink = Sink()
+
+        assert asyncio.run(spool.replay(sink, batch_size=10)) == 3
+        assert spool.corrupt_segments == 1
+
+
+class TestRecover:
+    """Leftovers of processes that are gone."""
+
+    def test_seals_open_segments_of_dead_process(self, tmp_path):
+        """Should seal a dead process's open segment and replay it."""
+        dead = _dead_pid()
+        with open(tmp_path / f"000000000000001-{dead}-000001.open", "wb") as f:
+            f.write(encode_record("impressions", {"id": "a"}))
+        spool = Spool(str(tmp_path))
+
+        spool.recover()
+        sink = Sink()
+
+        assert asyncio.run(spool.replay(sink, batch_size=10)) == 1
+        assert sink.rows == [("impressions", {"id": "a"})]
+
+    def test_leaves_open_segments_of_live_process(self, tmp_path):
+        """Should not touch a segment another live process is still writing."""
+        name = f"000000000000001-{os.getppid()}-000001.open"
+        (tmp_path / name).write_bytes(encode_record("impressions", {"id": "a"}))
+        spool = Spool(str(tmp_path))
+
+        spool.recover()
+
+        assert os.listdir(tmp_path) == [name]
+
+    def test_releases_claims_of_dead_process(self, tmp_path):
+        """Should return a dead process's claimed segment to the replay queue."""
+        dead = _dead_pid()
+        sealed = f"000000000000001-{dead}-000001.seg"
+        (tmp_path / f"{sealed}.{dead}.claim").write_bytes(encode_record("clicks", {"id": "b"}))
+        spool = Spool(str(tmp_path))
+
+        spool.recover()
+
+        assert os.listdir(tmp_path) == [sealed]
+        assert spool.pending_bytes() > 0
+
+    def test_own_pid_leftovers_are_recovered(self, tmp_path):
+        """Should treat segments carrying our own pid (a previous run) as leftovers."""
+        pid = os.getpid()
+        (tmp_path / f"000000000000001-{pid}-000001.open").write_bytes(encode_record("clicks", {"id": "c"}))
+        spool = Spool(str(tmp_path))
+
+        spool.recover()
+
+        assert os.listdir(tmp_path) == [f"000000000000001-{pid}-000001.seg"]
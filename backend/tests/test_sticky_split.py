@@ -0,0 +1,73 @@
+"""Tests for sticky visitor bucketing (StickySplit)."""
+from __future__ import annotations
+
+from collections import Counter
+
+import pytest
+
+from app.services.decisioning import StickySplit
+
+SCENARIOS = [
+    ("50/50 -> 60/40", [100, 100], [120, 80]),
+    ("3 equal -> add 4th", [100, 100, 100, 0], [100, 100, 100, 100]),
+    ("4 equal -> drop 1", [100, 100, 100, 100], [100, 100, 100, 0]),
+    ("skewed nudge", [700, 200, 100], [650, 250, 100]),
+    ("2000 variants, 1 doubled", [100] * 2000, [200] + [100] * 1999),
+]
+VISITORS = [f"visitor-{i}" for i in range(20000)]
+TOLERANCE = 0.03
+
+
+def variants_for(weights: list[float]) -> list[dict]:
+    return [{"id": f"variant-{i}", "weight": w} for i, w in enumerate(weights)]
+
+
+def assign(split: StickySplit, visitors: list[str]) -> list[str]:
+    return [split.pick(v)["id"] for v in visitors]  # type: ignore[index]
+
+
+def minimal_move(old: list[float], new: list[float]) -> float:
+    """Share of visitors that must move: total variation between the weight splits."""
+    a, b = sum(old), sum(new)
+    return 0.5 * sum(abs(o / a - n / b) for o, n in zip(old, new))
+
+
+class TestStickySplit:
+    """Assignments must be stable, follow the weights and move few visitors on change."""
+
+    @pytest.mark.parametrize("name,old_weights,new_weights", SCENARIOS, ids=[s[0] for s in SCENARIOS])
+    def test_weight_change(self, name, old_weights, new_weights):
+        """Should keep shares within tolerance and move close to the minimum."""
+        old_ring = StickySplit("campaign-1", variants_for(old_weights))
+        new_ring = StickySplit("campaign-1", variants_for(new_weights))
+
+        before = assign(old_ring, VISITORS)
+        after = assign(new_ring, VISITORS)
+
+        counts = Counter(after)
+        total = sum(new_weights)
+        share_err = max(
+            abs(counts.get(f"variant-{i}", 0) / len(VISITORS) - w / total) for i, w in enumerate(new_weights)
+        )
+        moved = sum(1 for a, b in zip(before, after) if a != b) / len(VISITORS)
+        assert before == assign(old_ring, VISITORS)
+        assert share_err <= TOLERANCE
+        assert moved <= minimal_move(old_weights, new_weights) + TOLERANCE
+
+    def test_same_visitor_same_variant_across_instances(self):
+        """Should not depend on process state: a rebuilt split assigns identically."""
+        variants = variants_for([1, 2, 3])
+
+        first = assign(StickySplit("c", variants), VISITORS[:1000])
+        second = assign(StickySplit("c", variants), VISITORS[:1000])
+
+        assert first == second
+
+    def test_campaigns_are_independent(self):
+        """Should bucket the same visitor independently per campaign."""
+        variants = variants_for([1, 1])
+
+        a = assign(StickySplit("campaign-a", variants), VISITORS[:2000])
+        b = assign(StickySplit("campaign-b", variants), VISITORS[:2000])
+
+        assert a != b
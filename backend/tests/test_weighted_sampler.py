@@ -0,0 +1,86 @@
+"""Tests for the alias-table WeightedSampler."""
+from __future__ import annotations
+
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from app.services import decisioning
+from app.services.decisioning import WeightedSampler
+
+DRAWS = 50000
+
+# Upper-tail z for the significance level used by the fit test (alpha = 0.001)
+Z_CRITICAL = 3.090
+
+LAYOUTS = {
+    "uniform-5": [100] * 5,
+    "skewed": [1000, 100, 10, 1],
+    "with-zeros": [50, 0, 25, 0, 25],
+    "generated-2000": [random.Random(7).randint(1, 100) for _ in range(2000)],
+}
+
+
+def chi_square_critical(dof: int) -> float:
+    """Wilson-Hilferty approximation of the chi-square critical value."""
+    h = 2.0 / (9.0 * dof)
+    return dof * (1.0 - h + Z_CRITICAL * math.sqrt(h)) ** 3
+
+
+def chi_square(counts: Counter, weights: list[float], draws: int) -> tuple[float, int]:
+    """Statistic and degrees of freedom; inf if a zero-weight index was drawn."""
+    total = sum(weights)
+    stat = 0.0
+    dof = -1
+    for i, w in enumerate(weights):
+        if w <= 0:
+            if counts.get(i):
+                return math.inf, max(dof, 1)
+            continue
+        expected = draws * w / total
+        stat += (counts.get(i, 0) - expected) ** 2 / expected
+        dof += 1
+    return stat, max(dof, 1)
+
+
+@pytest.fixture(autouse=True)
+def seeded_rng(monkeypatch):
+    monkeypatch.setattr(decisioning, "_rng", random.Random(7))
+
+
+class TestWeightedSampler:
+    """Draws must follow the variant weights."""
+
+    @pytest.mark.parametrize("layout", list(LAYOUTS))
+    def test_draws_fit_weights(self, layout):
+        """Should pass a chi-square goodness-of-fit test against the weights."""
+        weights = LAYOUTS[layout]
+        sampler = WeightedSampler([{"id": i, "weight": w} for i, w in enumerate(weights)])
+
+        counts = Counter(sampler.pick()["id"] for _ in range(DRAWS))
+        stat, dof = chi_square(counts, weights, DRAWS)
+
+        assert stat <= chi_square_critical(dof)
+
+    def test_zero_weight_never_drawn(self):
+        """Should never return a variant whose weight is zero."""
+        sampler = WeightedSampler([{"id": "a", "weight": 1}, {"id": "b", "weight": 0}, {"id": "c", "weight": -3}])
+
+        assert {sampler.pick()["id"] for _ in range(5000)} == {"a"}
+
+    def test_missing_weight_counts_as_one(self):
+        """Should treat a missing weight as 1.0."""
+        sampler = WeightedSampler([{"id": "a"}, {"id": "b", "weight": 3}])
+
+        counts = Counter(sampler.pick()["id"] for _ in range(DRAWS))
+        stat, dof = chi_square(Counter({0: counts["a"], 1: counts["b"]}), [1, 3], DRAWS)
+
+        assert stat <= chi_square_critical(dof)
+
+    def test_all_zero_weights_pick_first(self):
+        """Should fall back to the first variant when nothing has positive weight."""
+        sampler = WeightedSampler([{"id": "a", "weight": 0}, {"id": "b", "weight": 0}])
+
+        assert sampler.pick()["id"] == "a"
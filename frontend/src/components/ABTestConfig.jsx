@@ -5,6 +5,9 @@ const MODES = [
   { value: 'rules', label: 'Rules Only', desc: 'Select variant based on signal rules' },
   { value: 'weighted', label: 'Weighted', desc: 'Distribute traffic by weight' },
   { value: 'rules_then_weighted', label: 'Rules + Weighted', desc: 'Try rules first, fallback to weighted' },
+  { value: 'sticky', label: 'Sticky', desc: 'Split by weight, each visitor always sees the same variant' },
+  { value: 'rules_then_sticky', label: 'Rules + Sticky', desc: 'Try rules first, fallback to sticky split' },
+  { value: 'bandit', label: 'Bandit', desc: 'Shift traffic toward the variants with the best click-through' },
 ]
 
 export default function ABTestConfig({ campaign, onSave, variants }) {
@@ -32,7 +35,7 @@ export default function ABTestConfig({ campaign, onSave, variants }) {
         ))}
       </div>
 
-      {(mode === 'weighted' || mode === 'rules_then_weighted') && variants.length > 0 && (
+      {['weighted', 'rules_then_weighted', 'sticky', 'rules_then_sticky'].includes(mode) && variants.length > 0 && (
         <div className="bg-white rounded-lg shadow p-4 mt-4">
           <h3 className="text-sm font-medium text-gray-700 mb-3">Weight Distribution</h3>
           <div className="space-y-3">
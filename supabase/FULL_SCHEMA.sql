@@ -1,10 +1,11 @@
 -- SOUTS DCO Platform - Full Database Schema
--- Consolidated from migrations 001-009
+-- Consolidated from migrations 001-014
 -- Generated for easy one-shot setup
 --
 -- Tables: campaigns, variants, rules, assets, impressions, clicks,
 --         component_pools, api_keys, organizations, org_memberships,
---         org_invitations, ai_generations, ai_prompt_templates, ai_usage
+--         org_invitations, ai_generations, ai_prompt_templates, ai_usage,
+--         variant_stats, signal_dict, campaign_stats_hourly
 
 -- ============================================================
 -- 001_initial.sql - Base schema
@@ -376,3 +377,239 @@ CREATE POLICY "ai_prompt_templates_delete" ON ai_prompt_templates FOR DELETE
 CREATE POLICY "ai_usage_select_own" ON ai_usage FOR SELECT USING (auth.uid() = user_id);
 CREATE POLICY "ai_usage_insert_own" ON ai_usage FOR INSERT WITH CHECK (auth.uid() = user_id);
 CREATE POLICY "ai_usage_update_own" ON ai_usage FOR UPDATE USING (auth.uid() = user_id);
+
+-- ============================================================
+-- 010_sticky_ab_modes.sql - Sticky A/B modes
+-- ============================================================
+
+ALTER TABLE campaigns DROP CONSTRAINT IF EXISTS campaigns_ab_test_mode_check;
+ALTER TABLE campaigns ADD CONSTRAINT campaigns_ab_test_mode_check
+  CHECK (ab_test_mode IN ('rules', 'weighted', 'rules_then_weighted', 'sticky', 'rules_then_sticky', 'off'));
+
+-- ============================================================
+-- 011_bandit.sql - Bandit A/B mode counters
+-- ============================================================
+
+ALTER TABLE campaigns DROP CONSTRAINT IF EXISTS campaigns_ab_test_mode_check;
+ALTER TABLE campaigns ADD CONSTRAINT campaigns_ab_test_mode_check
+  CHECK (ab_test_mode IN ('rules', 'weighted', 'rules_then_weighted', 'sticky', 'rules_then_sticky', 'bandit', 'off'));
+
+CREATE TABLE variant_stats (
+  variant_id uuid PRIMARY KEY REFERENCES variants(id) ON DELETE CASCADE,
+  campaign_id uuid REFERENCES campaigns(id) ON DELETE CASCADE,
+  impressions bigint NOT NULL DEFAULT 0,
+  clicks bigint NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now()
+);
+
+CREATE INDEX idx_variant_stats_campaign_id ON variant_stats(campaign_id);
+
+ALTER TABLE variant_stats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "variant_stats_select_own" ON variant_stats FOR SELECT
+  USING (campaign_id IN (SELECT id FROM campaigns WHERE user_id = auth.uid()));
+
+-- Add counter deltas: [{ "variant_id", "campaign_id", "impressions", "clicks" }, ...]
+-- Deltas for variants deleted in the meantime are dropped.
+CREATE OR REPLACE FUNCTION increment_variant_stats(deltas jsonb)
+RETURNS void
+LANGUAGE sql
+AS $$
+  INSERT INTO variant_stats (variant_id, campaign_id, impressions, clicks, updated_at)
+  SELECT d.variant_id, d.campaign_id, d.impressions, d.clicks, now()
+  FROM jsonb_to_recordset(deltas) AS d(variant_id uuid, campaign_id uuid, impressions bigint, clicks bigint)
+  WHERE EXISTS (SELECT 1 FROM variants v WHERE v.id = d.variant_id)
+  ON CONFLICT (variant_id) DO UPDATE SET
+    impressions = variant_stats.impressions + EXCLUDED.impressions,
+    clicks = variant_stats.clicks + EXCLUDED.clicks,
+    updated_at = now();
+$$;
+
+REVOKE EXECUTE ON FUNCTION increment_variant_stats(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_variant_stats(jsonb) TO service_role;
+
+-- ============================================================
+-- 012_compact_signals.sql - Compact impression signals
+-- ============================================================
+
+-- Shared dictionary for string signal values (user agent, referer, geo names, ...)
+CREATE TABLE signal_dict (
+  id integer GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  value text NOT NULL UNIQUE
+);
+
+-- Only the service role reads or writes the dictionary
+ALTER TABLE signal_dict ENABLE ROW LEVEL SECURITY;
+
+-- Ids point into signal_dict; no foreign keys, to keep bulk inserts cheap.
+-- `signals` keeps only what has no column of its own (NULL when nothing).
+ALTER TABLE impressions
+  ADD COLUMN user_agent_id integer,
+  ADD COLUMN referer_id integer,
+  ADD COLUMN geo_country_id integer,
+  ADD COLUMN geo_region_id integer,
+  ADD COLUMN geo_city_id integer,
+  ADD COLUMN geo_timezone_id integer,
+  ADD COLUMN weather_condition_id integer,
+  ADD COLUMN daypart_id integer,
+  ADD COLUMN geo_lat double precision,
+  ADD COLUMN geo_lon double precision,
+  ADD COLUMN weather_temp double precision,
+  ADD COLUMN weather_code smallint,
+  ADD COLUMN daypart_hour smallint,
+  ADD COLUMN weather_is_hot boolean,
+  ADD COLUMN weather_is_cold boolean,
+  ADD COLUMN daypart_is_weekend boolean;
+
+-- Ids for the given values, adding the ones not seen before
+CREATE OR REPLACE FUNCTION intern_signal_values(vals text[])
+RETURNS TABLE (id integer, value text)
+LANGUAGE sql
+AS $$
+  INSERT INTO signal_dict (value)
+  SELECT DISTINCT v FROM unnest(vals) AS v
+  ON CONFLICT (value) DO NOTHING;
+
+  SELECT d.id, d.value FROM signal_dict d WHERE d.value = ANY(vals);
+$$;
+
+REVOKE EXECUTE ON FUNCTION intern_signal_values(text[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION intern_signal_values(text[]) TO service_role;
+
+-- ============================================================
+-- 013_stats_rollups.sql - Hourly campaign stats rollups
+-- ============================================================
+
+CREATE TABLE campaign_stats_hourly (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  campaign_id uuid NOT NULL REFERENCES campaigns(id) ON DELETE CASCADE,
+  -- No foreign key: counts of a deleted variant stay under its old id
+  variant_id uuid,
+  bucket timestamptz NOT NULL,  -- start of the UTC hour
+  impressions bigint NOT NULL DEFAULT 0,
+  clicks bigint NOT NULL DEFAULT 0,
+  UNIQUE NULLS NOT DISTINCT (campaign_id, variant_id, bucket)
+);
+
+CREATE INDEX idx_campaign_stats_hourly_campaign_bucket ON campaign_stats_hourly(campaign_id, bucket);
+
+ALTER TABLE campaign_stats_hourly ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "campaign_stats_hourly_select_own" ON campaign_stats_hourly FOR SELECT
+  USING (campaign_id IN (SELECT id FROM campaigns WHERE user_id = auth.uid()));
+
+-- Statement-level triggers: one grouped upsert per (bulk) insert, reading the
+-- inserted rows from the transition table. Rows skipped by ON CONFLICT DO
+-- NOTHING are not in it, so replayed events are not counted twice. Rows are
+-- upserted in key order so concurrent batches lock counters in the same order.
+-- SECURITY DEFINER: events may be inserted by roles that can't write rollups.
+CREATE OR REPLACE FUNCTION rollup_impressions()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO campaign_stats_hourly AS s (campaign_id, variant_id, bucket, impressions)
+  SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC'), count(*)
+  FROM new_rows
+  WHERE campaign_id IS NOT NULL
+  GROUP BY 1, 2, 3
+  ORDER BY 1, 2, 3
+  ON CONFLICT (campaign_id, variant_id, bucket) DO UPDATE SET impressions = s.impressions + EXCLUDED.impressions;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_clicks()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO campaign_stats_hourly AS s (campaign_id, variant_id, bucket, clicks)
+  SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC'), count(*)
+  FROM new_rows
+  WHERE campaign_id IS NOT NULL
+  GROUP BY 1, 2, 3
+  ORDER BY 1, 2, 3
+  ON CONFLICT (campaign_id, variant_id, bucket) DO UPDATE SET clicks = s.clicks + EXCLUDED.clicks;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER impressions_rollup
+  AFTER INSERT ON impressions
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION rollup_impressions();
+
+CREATE TRIGGER clicks_rollup
+  AFTER INSERT ON clicks
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION rollup_clicks();
+
+-- Rebuild the counters from the raw events for buckets from `since` on
+-- (e.g. after bulk deletes or for data older than this migration). New
+-- inserts wait while it runs, so nothing is counted twice or missed.
+CREATE OR REPLACE FUNCTION backfill_campaign_stats(since timestamptz DEFAULT '-infinity')
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  buckets bigint;
+BEGIN
+  LOCK TABLE impressions, clicks IN SHARE MODE;
+  DELETE FROM campaign_stats_hourly WHERE bucket >= date_trunc('hour', since, 'UTC');
+  INSERT INTO campaign_stats_hourly (campaign_id, variant_id, bucket, impressions, clicks)
+  SELECT campaign_id, variant_id, bucket, sum(impressions), sum(clicks)
+  FROM (
+    SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC') AS bucket, 1 AS impressions, 0 AS clicks
+    FROM impressions WHERE campaign_id IS NOT NULL AND created_at >= date_trunc('hour', since, 'UTC')
+    UNION ALL
+    SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC'), 0, 1
+    FROM clicks WHERE campaign_id IS NOT NULL AND created_at >= date_trunc('hour', since, 'UTC')
+  ) events
+  GROUP BY campaign_id, variant_id, bucket;
+  GET DIAGNOSTICS buckets = ROW_COUNT;
+  RETURN buckets;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION backfill_campaign_stats(timestamptz) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION backfill_campaign_stats(timestamptz) TO service_role;
+
+SELECT backfill_campaign_stats();
+
+-- ============================================================
+-- 014_dashboard_stats.sql - Dashboard totals RPC
+-- ============================================================
+
+-- [{ "campaign_id", "impressions", "clicks" }, ...] for every campaign of `uid`
+-- (zeros included), oldest campaign first. Returned as one JSON array so
+-- accounts with many campaigns aren't cut off by the API row limit.
+CREATE OR REPLACE FUNCTION dashboard_stats(uid uuid, since timestamptz)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT coalesce(
+    jsonb_agg(
+      jsonb_build_object('campaign_id', t.id, 'impressions', t.impressions, 'clicks', t.clicks)
+      ORDER BY t.created_at, t.id
+    ),
+    '[]'::jsonb
+  )
+  FROM (
+    SELECT c.id, c.created_at, coalesce(sum(s.impressions), 0) AS impressions, coalesce(sum(s.clicks), 0) AS clicks
+    FROM campaigns c
+    LEFT JOIN campaign_stats_hourly s
+      ON s.campaign_id = c.id AND s.bucket >= date_trunc('hour', since, 'UTC')
+    WHERE c.user_id = uid
+    GROUP BY c.id, c.created_at
+  ) t;
+$$;
+
+-- Takes any user id, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION dashboard_stats(uuid, timestamptz) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION dashboard_stats(uuid, timestamptz) TO service_role;
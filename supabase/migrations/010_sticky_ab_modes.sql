@@ -0,0 +1,6 @@
+-- 010_sticky_ab_modes.sql
+-- Sticky A/B modes: visitors are hashed onto variants by weight, statelessly
+
+ALTER TABLE campaigns DROP CONSTRAINT IF EXISTS campaigns_ab_test_mode_check;
+ALTER TABLE campaigns ADD CONSTRAINT campaigns_ab_test_mode_check
+  CHECK (ab_test_mode IN ('rules', 'weighted', 'rules_then_weighted', 'sticky', 'rules_then_sticky', 'off'));
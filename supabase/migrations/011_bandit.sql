@@ -0,0 +1,40 @@
+-- 011_bandit.sql
+-- Bandit A/B mode: per-variant counters merged from the serving workers
+
+ALTER TABLE campaigns DROP CONSTRAINT IF EXISTS campaigns_ab_test_mode_check;
+ALTER TABLE campaigns ADD CONSTRAINT campaigns_ab_test_mode_check
+  CHECK (ab_test_mode IN ('rules', 'weighted', 'rules_then_weighted', 'sticky', 'rules_then_sticky', 'bandit', 'off'));
+
+CREATE TABLE variant_stats (
+  variant_id uuid PRIMARY KEY REFERENCES variants(id) ON DELETE CASCADE,
+  campaign_id uuid REFERENCES campaigns(id) ON DELETE CASCADE,
+  impressions bigint NOT NULL DEFAULT 0,
+  clicks bigint NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now()
+);
+
+CREATE INDEX idx_variant_stats_campaign_id ON variant_stats(campaign_id);
+
+ALTER TABLE variant_stats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "variant_stats_select_own" ON variant_stats FOR SELECT
+  USING (campaign_id IN (SELECT id FROM campaigns WHERE user_id = auth.uid()));
+
+-- Add counter deltas: [{ "variant_id", "campaign_id", "impressions", "clicks" }, ...]
+-- Deltas for variants deleted in the meantime are dropped.
+CREATE OR REPLACE FUNCTION increment_variant_stats(deltas jsonb)
+RETURNS void
+LANGUAGE sql
+AS $$
+  INSERT INTO variant_stats (variant_id, campaign_id, impressions, clicks, updated_at)
+  SELECT d.variant_id, d.campaign_id, d.impressions, d.clicks, now()
+  FROM jsonb_to_recordset(deltas) AS d(variant_id uuid, campaign_id uuid, impressions bigint, clicks bigint)
+  WHERE EXISTS (SELECT 1 FROM variants v WHERE v.id = d.variant_id)
+  ON CONFLICT (variant_id) DO UPDATE SET
+    impressions = variant_stats.impressions + EXCLUDED.impressions,
+    clicks = variant_stats.clicks + EXCLUDED.clicks,
+    updated_at = now();
+$$;
+
+REVOKE EXECUTE ON FUNCTION increment_variant_stats(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_variant_stats(jsonb) TO service_role;
@@ -0,0 +1,46 @@
+-- 012_compact_signals.sql
+-- Compact impression signals: dictionary-encoded strings and typed columns
+
+-- Shared dictionary for string signal values (user agent, referer, geo names, ...)
+CREATE TABLE signal_dict (
+  id integer GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  value text NOT NULL UNIQUE
+);
+
+-- Only the service role reads or writes the dictionary
+ALTER TABLE signal_dict ENABLE ROW LEVEL SECURITY;
+
+-- Ids point into signal_dict; no foreign keys, to keep bulk inserts cheap.
+-- `signals` keeps only what has no column of its own (NULL when nothing).
+ALTER TABLE impressions
+  ADD COLUMN user_agent_id integer,
+  ADD COLUMN referer_id integer,
+  ADD COLUMN geo_country_id integer,
+  ADD COLUMN geo_region_id integer,
+  ADD COLUMN geo_city_id integer,
+  ADD COLUMN geo_timezone_id integer,
+  ADD COLUMN weather_condition_id integer,
+  ADD COLUMN daypart_id integer,
+  ADD COLUMN geo_lat double precision,
+  ADD COLUMN geo_lon double precision,
+  ADD COLUMN weather_temp double precision,
+  ADD COLUMN weather_code smallint,
+  ADD COLUMN daypart_hour smallint,
+  ADD COLUMN weather_is_hot boolean,
+  ADD COLUMN weather_is_cold boolean,
+  ADD COLUMN daypart_is_weekend boolean;
+
+-- Ids for the given values, adding the ones not seen before
+CREATE OR REPLACE FUNCTION intern_signal_values(vals text[])
+RETURNS TABLE (id integer, value text)
+LANGUAGE sql
+AS $$
+  INSERT INTO signal_dict (value)
+  SELECT DISTINCT v FROM unnest(vals) AS v
+  ON CONFLICT (value) DO NOTHING;
+
+  SELECT d.id, d.value FROM signal_dict d WHERE d.value = ANY(vals);
+$$;
+
+REVOKE EXECUTE ON FUNCTION intern_signal_values(text[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION intern_signal_values(text[]) TO service_role;
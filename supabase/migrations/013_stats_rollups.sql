@@ -0,0 +1,103 @@
+-- 013_stats_rollups.sql
+-- Hourly impression/click counters per campaign and variant, kept up to date at insert time
+
+CREATE TABLE campaign_stats_hourly (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  campaign_id uuid NOT NULL REFERENCES campaigns(id) ON DELETE CASCADE,
+  -- No foreign key: counts of a deleted variant stay under its old id
+  variant_id uuid,
+  bucket timestamptz NOT NULL,  -- start of the UTC hour
+  impressions bigint NOT NULL DEFAULT 0,
+  clicks bigint NOT NULL DEFAULT 0,
+  UNIQUE NULLS NOT DISTINCT (campaign_id, variant_id, bucket)
+);
+
+CREATE INDEX idx_campaign_stats_hourly_campaign_bucket ON campaign_stats_hourly(campaign_id, bucket);
+
+ALTER TABLE campaign_stats_hourly ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "campaign_stats_hourly_select_own" ON campaign_stats_hourly FOR SELECT
+  USING (campaign_id IN (SELECT id FROM campaigns WHERE user_id = auth.uid()));
+
+-- Statement-level triggers: one grouped upsert per (bulk) insert, reading the
+-- inserted rows from the transition table. Rows skipped by ON CONFLICT DO
+-- NOTHING are not in it, so replayed events are not counted twice. Rows are
+-- upserted in key order so concurrent batches lock counters in the same order.
+-- SECURITY DEFINER: events may be inserted by roles that can't write rollups.
+CREATE OR REPLACE FUNCTION rollup_impressions()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO campaign_stats_hourly AS s (campaign_id, variant_id, bucket, impressions)
+  SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC'), count(*)
+  FROM new_rows
+  WHERE campaign_id IS NOT NULL
+  GROUP BY 1, 2, 3
+  ORDER BY 1, 2, 3
+  ON CONFLICT (campaign_id, variant_id, bucket) DO UPDATE SET impressions = s.impressions + EXCLUDED.impressions;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_clicks()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO campaign_stats_hourly AS s (campaign_id, variant_id, bucket, clicks)
+  SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC'), count(*)
+  FROM new_rows
+  WHERE campaign_id IS NOT NULL
+  GROUP BY 1, 2, 3
+  ORDER BY 1, 2, 3
+  ON CONFLICT (campaign_id, variant_id, bucket) DO UPDATE SET clicks = s.clicks + EXCLUDED.clicks;
+  RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER impressions_rollup
+  AFTER INSERT ON impressions
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION rollup_impressions();
+
+CREATE TRIGGER clicks_rollup
+  AFTER INSERT ON clicks
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION rollup_clicks();
+
+-- Rebuild the counters from the raw events for buckets from `since` on
+-- (e.g. after bulk deletes or for data older than this migration). New
+-- inserts wait while it runs, so nothing is counted twice or missed.
+CREATE OR REPLACE FUNCTION backfill_campaign_stats(since timestamptz DEFAULT '-infinity')
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  buckets bigint;
+BEGIN
+  LOCK TABLE impressions, clicks IN SHARE MODE;
+  DELETE FROM campaign_stats_hourly WHERE bucket >= date_trunc('hour', since, 'UTC');
+  INSERT INTO campaign_stats_hourly (campaign_id, variant_id, bucket, impressions, clicks)
+  SELECT campaign_id, variant_id, bucket, sum(impressions), sum(clicks)
+  FROM (
+    SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC') AS bucket, 1 AS impressions, 0 AS clicks
+    FROM impressions WHERE campaign_id IS NOT NULL AND created_at >= date_trunc('hour', since, 'UTC')
+    UNION ALL
+    SELECT campaign_id, variant_id, date_trunc('hour', created_at, 'UTC'), 0, 1
+    FROM clicks WHERE campaign_id IS NOT NULL AND created_at >= date_trunc('hour', since, 'UTC')
+  ) events
+  GROUP BY campaign_id, variant_id, bucket;
+  GET DIAGNOSTICS buckets = ROW_COUNT;
+  RETURN buckets;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION backfill_campaign_stats(timestamptz) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION backfill_campaign_stats(timestamptz) TO service_role;
+
+SELECT backfill_campaign_stats();
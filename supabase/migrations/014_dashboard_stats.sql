@@ -0,0 +1,31 @@
+-- 014_dashboard_stats.sql
+-- Per-campaign totals for a user's dashboard in one grouped query over the hourly rollups
+
+-- [{ "campaign_id", "impressions", "clicks" }, ...] for every campaign of `uid`
+-- (zeros included), oldest campaign first. Returned as one JSON array so
+-- accounts with many campaigns aren't cut off by the API row limit.
+CREATE OR REPLACE FUNCTION dashboard_stats(uid uuid, since timestamptz)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT coalesce(
+    jsonb_agg(
+      jsonb_build_object('campaign_id', t.id, 'impressions', t.impressions, 'clicks', t.clicks)
+      ORDER BY t.created_at, t.id
+    ),
+    '[]'::jsonb
+  )
+  FROM (
+    SELECT c.id, c.created_at, coalesce(sum(s.impressions), 0) AS impressions, coalesce(sum(s.clicks), 0) AS clicks
+    FROM campaigns c
+    LEFT JOIN campaign_stats_hourly s
+      ON s.campaign_id = c.id AND s.bucket >= date_trunc('hour', since, 'UTC')
+    WHERE c.user_id = uid
+    GROUP BY c.id, c.created_at
+  ) t;
+$$;
+
+-- Takes any user id, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION dashboard_stats(uuid, timestamptz) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION dashboard_stats(uuid, timestamptz) TO service_role;